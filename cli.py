@@ -14,10 +14,13 @@ sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
 def cmd_task(args):
     """运行采集任务（日志记录已集成在各task模块内部）"""
-    from pcrdb.tasks import clan_sync, grand_sync, arena_deck_sync, player_profile_sync
+    import os
+    from pcrdb.tasks import clan_sync, clan_summary, grand_sync, arena_deck_sync, player_profile_sync
+    from pcrdb.db.task_profiler import PROFILE_ENV
     
     task_map = {
         'clan_sync': clan_sync.run,
+        'clan_summary': clan_summary.run,
         'grand_sync': grand_sync.run,
         'arena_deck_sync': arena_deck_sync.run,
         'player_profile_sync': player_profile_sync.run,
@@ -36,8 +39,18 @@ def cmd_task(args):
                 k, v = arg.split('=', 1)
                 kwargs[k] = int(v) if v.isdigit() else v
     
+    if args.profile:
+        # TaskLogger.start() 按该环境变量开启剖析
+        os.environ[PROFILE_ENV] = args.profile
+    
     print(f"运行任务: {args.task_name}")
     try:
+        # 预建快照表的当月和下月分区
+        from pcrdb.db.partitions import ensure_partitions
+        created = ensure_partitions()
+        if created:
+            print(f"已创建分区: {', '.join(created)}")
+        
         task_map[args.task_name](**kwargs)
         return 0
     except Exception as e:
@@ -45,20 +58,85 @@ def cmd_task(args):
         return 1
 
 
+def cmd_partitions(args):
+    """预建快照表月分区"""
+    from pcrdb.db.partitions import ensure_partitions
+    created = ensure_partitions(months_ahead=args.months_ahead)
+    if created:
+        print(f"已创建分区: {', '.join(created)}")
+    else:
+        print("分区已就绪，无需创建")
+    return 0
+
+
+def cmd_latest(args):
+    """从快照历史回填 player_latest / clan_latest（按分区逐个提交，可重复执行）"""
+    import time
+    from pcrdb.db.connection import pooled_connection
+    from pcrdb.db.latest import PLAYER_SOURCES, rebuild_source
+    from pcrdb.db.partitions import is_partitioned, list_partitions
+    from pcrdb.db.task_logger import notify_data_changed
+    
+    tables = ['clan_snapshots'] + list(PLAYER_SOURCES)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for table in tables:
+            relations = list_partitions(cursor, table) if is_partitioned(cursor, table) else [table]
+            for relation in relations:
+                start = time.time()
+                count = rebuild_source(cursor, table, relation)
+                conn.commit()
+                print(f"{relation}: upsert {count} 行，耗时 {time.time() - start:.1f} 秒")
+    
+    # 通知 server 刷新内存热数据和响应缓存
+    notify_data_changed('latest_backfill')
+    print("最新状态目录回填完成")
+    return 0
+
+
+def cmd_aliases(args):
+    """从快照历史回填 player_aliases / clan_aliases（按分区逐个提交，可重复执行）"""
+    import time
+    from pcrdb.db.connection import pooled_connection
+    from pcrdb.db.aliases import ALIAS_SOURCES, rebuild_aliases
+    from pcrdb.db.partitions import is_partitioned, list_partitions
+    from pcrdb.db.task_logger import notify_data_changed
+    
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for table in ALIAS_SOURCES:
+            relations = list_partitions(cursor, table) if is_partitioned(cursor, table) else [table]
+            for relation in relations:
+                start = time.time()
+                count = rebuild_aliases(cursor, table, relation)
+                conn.commit()
+                print(f"{relation}: upsert {count} 个别名，耗时 {time.time() - start:.1f} 秒")
+    
+    notify_data_changed('aliases_backfill')
+    print("名字别名表回填完成")
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='pcrdb - 公主连结渠道服数据采集系统',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 可用任务:
-  clan_sync           同步公会数据
+  clan_sync           同步公会数据（完成后自动汇总本期 clan_period_summary）
+  clan_summary        重建公会月度汇总 (period=YYYY-MM / all / missing)
   grand_sync          同步PJJC排名数据
   arena_deck_sync     同步JJC防守阵容
   player_profile_sync 同步玩家档案
 
 示例:
   python cli.py task clan_sync
+  python cli.py partitions --months-ahead 2
+  python cli.py task clan_summary --args period=all
+  python cli.py latest
+  python cli.py aliases
   python cli.py task player_profile_sync --args mode=top_clans rank_limit=30
+  python cli.py task clan_sync --profile=cpu
 """
     )
     
@@ -68,8 +146,23 @@ def main():
     task_parser = subparsers.add_parser('task', help='运行采集任务')
     task_parser.add_argument('task_name', help='任务名称')
     task_parser.add_argument('--args', nargs='*', help='任务参数 (key=value)')
+    task_parser.add_argument('--profile', choices=['cpu', 'mem'],
+                             help='性能剖析：cpu (cProfile) / mem (tracemalloc)，产物写入 PCRDB_PROFILE_DIR')
     task_parser.set_defaults(func=cmd_task)
     
+    # partitions 命令
+    partitions_parser = subparsers.add_parser('partitions', help='预建快照表月分区')
+    partitions_parser.add_argument('--months-ahead', type=int, default=1, help='预建未来几个月 (默认 1)')
+    partitions_parser.set_defaults(func=cmd_partitions)
+    
+    # latest 命令
+    latest_parser = subparsers.add_parser('latest', help='从快照历史回填 player_latest / clan_latest')
+    latest_parser.set_defaults(func=cmd_latest)
+    
+    # aliases 命令
+    aliases_parser = subparsers.add_parser('aliases', help='从快照历史回填 player_aliases / clan_aliases')
+    aliases_parser.set_defaults(func=cmd_aliases)
+    
     args = parser.parse_args()
     
     if args.command is None:
@@ -2,7 +2,7 @@
  * PCR 渠道服工具箱 - 前端 Vue 应用
  * 入口文件 - 组合各功能模块
  */
-import { formatDate, formatTime, formatDateTime } from './modules/utils.js';
+import { formatDate, formatTime, formatDateTime, formatChangePct, formatPhaseComparison } from './modules/utils.js';
 import { useAuth } from './modules/auth.js';
 import { useClanBattle } from './modules/clanBattle.js';
 import { useClan } from './modules/clan.js';
@@ -141,6 +141,8 @@ createApp({
             loadTaskLogs,
             loadAdminUsers,
             formatDateTime,
+            formatChangePct,
+            formatPhaseComparison,
             getApiCallCount,
             getLastCallTime
         };
@@ -171,7 +171,6 @@ export function useClan(authFetch, logout) {
         clan.profilesResult = null;
 
         try {
-            let url = `${LOCAL_API}/api/clan/profiles?`;
             const params = [];
             if (clan.searchDate) {
                 params.push(`date=${clan.searchDate}`);
@@ -179,19 +178,43 @@ export function useClan(authFetch, logout) {
             if (clan.selectedClanId) {
                 params.push(`clan_id=${clan.selectedClanId}`);
             }
-            url += params.join('&');
 
-            const res = await authFetch(url);
-            if (res.status === 401) {
-                clan.error = '认证已过期，请重新登录';
-                logout();
-                return;
+            // 接口按页返回（每页最多 1000 人），沿 next_cursor 取完全部页后在前端排序
+            let data = null;
+            let cursor = null;
+            while (true) {
+                const pageParams = cursor ? [...params, `cursor=${encodeURIComponent(cursor)}`] : params;
+                const res = await authFetch(`${LOCAL_API}/api/clan/profiles?${pageParams.join('&')}`);
+                if (res.status === 401) {
+                    clan.error = '认证已过期，请重新登录';
+                    logout();
+                    return;
+                }
+                if (res.status === 429) {
+                    // 限流：按 Retry-After 等待后继续取当前页
+                    const wait = parseInt(res.headers.get('Retry-After')) || 1;
+                    await new Promise(resolve => setTimeout(resolve, wait * 1000));
+                    continue;
+                }
+                const page = await res.json();
+                if (page.error) {
+                    clan.error = page.error;
+                    return;
+                }
+                if (data) {
+                    data.players.push(...page.players);
+                } else {
+                    data = page;
+                    // 后续页固定为第一页解析出的日期（未选日期时为最新日期）
+                    if (!clan.searchDate && page.date) {
+                        params.push(`date=${page.date}`);
+                    }
+                }
+                cursor = page.next_cursor;
+                if (!cursor) break;
             }
-            const data = await res.json();
 
-            if (data.error) {
-                clan.error = data.error;
-            } else {
+            if (data) {
                 clan.profilesResult = data;
                 // Apply default sort (force descending, don't toggle)
                 sortProfiles('total_power', true);
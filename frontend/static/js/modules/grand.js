@@ -27,7 +27,8 @@ export function useGrand(authFetch, logout) {
                 logout();
                 return;
             }
-            grand.results = await res.json();
+            const data = await res.json();
+            grand.results = data.rankings || [];
         } catch (e) {
             console.error('双场查询失败:', e);
             grand.results = [];
@@ -99,8 +99,8 @@ export function usePlayer(authFetch, logout) {
 
             if (data.error) {
                 player.error = data.error;
-            } else if (Array.isArray(data)) {
-                player.searchResults = data;
+            } else if (Array.isArray(data.players)) {
+                player.searchResults = data.players;
             }
         } catch (e) {
             player.error = '查询失败，请确保后端服务已启动';
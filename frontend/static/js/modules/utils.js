@@ -59,6 +59,28 @@ export function formatDateTime(str) {
     }
 }
 
+/**
+ * 格式化与上次运行的变化百分比（任务日志对比）
+ */
+export function formatChangePct(pct) {
+    if (pct === null || pct === undefined) return '-';
+    return `${pct > 0 ? '+' : ''}${pct.toFixed(1)}%`;
+}
+
+/**
+ * 任务日志的分阶段耗时说明（用于 title 提示）
+ */
+export function formatPhaseComparison(log) {
+    const phases = log.comparison?.phases || log.details?.phases;
+    if (!phases) return '';
+    return Object.entries(phases)
+        .map(([name, p]) => {
+            const change = p.change_pct !== undefined ? ` (${formatChangePct(p.change_pct)})` : '';
+            return `${name}: ${p.seconds}s${change}`;
+        })
+        .join('\n');
+}
+
 /**
  * 带认证的 fetch 封装
  */
@@ -1,6 +1,11 @@
 """
 PCRDB Unified Runner
-Starts Backend (API), Frontend (Static + Proxy), and Scheduler.
+Starts the web server and the Scheduler.
+
+PCRDB_RUN_MODE:
+  single (default) - API and static frontend in one ASGI app on FRONTEND_HOST:FRONTEND_PORT
+  split            - API on BACKEND_HOST:BACKEND_PORT, frontend server proxies /api and /proxy to it
+  supervisor       - production: N API worker processes, scheduler and collector processes (see supervisor.py)
 """
 import os
 import sys
@@ -11,6 +16,7 @@ import uvicorn
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.background import BackgroundTask
 
@@ -36,6 +42,14 @@ BACKEND_PORT = int(os.environ["BACKEND_PORT"])
 FRONTEND_HOST = os.environ["FRONTEND_HOST"]
 FRONTEND_PORT = int(os.environ["FRONTEND_PORT"])
 BACKEND_URL = f"http://{BACKEND_HOST}:{BACKEND_PORT}"
+RUN_MODE = os.getenv("PCRDB_RUN_MODE", "single")
+
+API_PREFIXES = ("/api/", "/proxy/", "/metrics")
+
+# 静态文件：每次使用前用 ETag / Last-Modified 验证（StaticFiles 自带 304 处理）
+STATIC_CACHE_CONTROL = "no-cache"
+# 后端未声明缓存策略的代理响应（登录、管理接口等）一律不缓存
+PROXY_DEFAULT_CACHE_CONTROL = "no-store"
 
 # === Backend Service ===
 def run_backend():
@@ -76,67 +90,58 @@ class CustomStaticFiles(StaticFiles):
                  print(f"[Static] Serving JS: {resp.path} forced to application/javascript")
                  resp.media_type = "application/javascript"
                  resp.headers["content-type"] = "application/javascript"
+        resp.headers["cache-control"] = STATIC_CACHE_CONTROL
         return resp
 
+# Split mode: one pooled client for the whole process, bodies streamed both ways
+HOP_BY_HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "content-length", "upgrade"}
+proxy_client = httpx.AsyncClient(
+    base_url=BACKEND_URL,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
 async def proxy_request(request: Request):
     """Forwards requests to the backend"""
-    path = request.path_params.get("path", "")
-    client = httpx.AsyncClient(base_url=BACKEND_URL)
-    
-    url = f"/{path}" # Reconstruct the path relative to backend root but ensuring we don't double slash if not needed, or just use request.url.path logic
-    # Actually, the logic in previous code was: url = request.url.path which is full path like /api/foo/bar
-    # If backend expects /api/foo/bar it is fine.
-    # But wait, if I use /api/{path:path}, the backend likely expects /api/... as well if it has the same routes?
-    # server.py has @app.post("/api/auth/register")
-    # So if frontend requests /api/auth/register, proxy receives /api/auth/register
-    # path param "path" would be "auth/register"
-    # request.url.path would be "/api/auth/register".
-    
-    # Let's keep using request.url.path as it was in the original code, 
-    # but we just need to fix the function signature.
-    
-    client = httpx.AsyncClient(base_url=BACKEND_URL)
-    
-    # We will use the full path from the request, so we don't technically need the 'path' variable 
-    # for the URL construction if we just proxy exact path.
-    # However, 'path' was incorrectly requested as an arg.
-    
+    # request.url.path is the full path (/api/...), the backend serves the same routes
     url = request.url.path
     if request.url.query:
         url += f"?{request.url.query}"
     
-    # Exclude headers that might cause issues
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    headers.pop("content-length", None) # Let httpx handle this
+    headers = {k: v for k, v in request.headers.items() if k not in HOP_BY_HOP_HEADERS}
     
     try:
-        content = await request.body()
-        
-        rp_req = client.build_request(
+        rp_req = proxy_client.build_request(
             request.method,
             url,
             headers=headers,
-            content=content
-        )
-        rp_resp = await client.send(rp_req, stream=True)
-        
-        return Response(
-            content=await rp_resp.aread(),
-            status_code=rp_resp.status_code,
-            headers=dict(rp_resp.headers),
-            background=BackgroundTask(rp_resp.aclose)
+            content=request.stream()
         )
+        rp_resp = await proxy_client.send(rp_req, stream=True)
     except Exception as e:
         return Response(content=f"Proxy Error: {str(e)}", status_code=502)
-    finally:
-        await client.aclose()
+    
+    # 原样转发 ETag / Cache-Control（If-None-Match 已随请求头转发，304 直接透传）
+    resp_headers = {k: v for k, v in rp_resp.headers.items() if k not in HOP_BY_HOP_HEADERS}
+    resp_headers.setdefault("cache-control", PROXY_DEFAULT_CACHE_CONTROL)
+    
+    # Raw bytes keep content-encoding consistent with the forwarded headers
+    return StreamingResponse(
+        rp_resp.aiter_raw(),
+        status_code=rp_resp.status_code,
+        headers=resp_headers,
+        background=BackgroundTask(rp_resp.aclose)
+    )
+
+@frontend_app.on_event("shutdown")
+async def close_proxy_client():
+    await proxy_client.aclose()
 
 # Register Proxy Routes
-# We need to catch /api/* and /proxy/*
 # Note: "path" in {path:path} captures the rest of the URL
 frontend_app.add_route("/api/{path:path}", proxy_request, methods=["GET", "POST", "PUT", "DELETE"])
 frontend_app.add_route("/proxy/{path:path}", proxy_request, methods=["GET", "POST", "PUT", "DELETE"])
+frontend_app.add_route("/metrics", proxy_request, methods=["GET"])
 
 # Mount Static Files (Must be last to avoid catching api routes if folders match)
 if Path("frontend").exists():
@@ -147,19 +152,62 @@ def run_frontend():
     print(f"[Frontend] Starting on {FRONTEND_HOST}:{FRONTEND_PORT}...")
     uvicorn.run(frontend_app, host=FRONTEND_HOST, port=FRONTEND_PORT, log_level="error")
 
+# === Single App ===
+def default_cache_control(send):
+    """Add Cache-Control to API responses that don't declare one (same default as the proxy)"""
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            headers = message.setdefault("headers", [])
+            if not any(k.lower() == b"cache-control" for k, _ in headers):
+                headers.append((b"cache-control", PROXY_DEFAULT_CACHE_CONTROL.encode()))
+        await send(message)
+    return wrapped
+
+def build_single_app():
+    """
+    API and static frontend in one ASGI app: /api and /proxy are dispatched
+    straight to pcrdb.server:app in-process, everything else is a static file
+    """
+    from src.pcrdb.server import app as api_app
+    static_app = CustomStaticFiles(directory="frontend", html=True)
+
+    async def app(scope, receive, send):
+        # Lifespan goes to the API app (pools, hot state, log buffer)
+        if scope["type"] == "lifespan":
+            return await api_app(scope, receive, send)
+        if scope["type"] == "http" and scope["path"].startswith(API_PREFIXES):
+            return await api_app(scope, receive, default_cache_control(send))
+        return await static_app(scope, receive, send)
+
+    return app
+
+def run_single():
+    """Runs API + frontend as one server"""
+    print(f"[Server] Starting on {FRONTEND_HOST}:{FRONTEND_PORT} (single app)...")
+    uvicorn.run(build_single_app(), host=FRONTEND_HOST, port=FRONTEND_PORT, log_level="info")
+
 if __name__ == "__main__":
-    print("=== PCRDB Unified Server Starting ===")
+    if RUN_MODE == "supervisor":
+        # Runs in the main thread: it owns signal handling for the child processes
+        from supervisor import main as run_supervisor
+        run_supervisor()
+        sys.exit(0)
+    
+    print(f"=== PCRDB Unified Server Starting ({RUN_MODE}) ===")
     
     # Create threads
-    t_backend = threading.Thread(target=run_backend, daemon=True)
-    t_frontend = threading.Thread(target=run_frontend, daemon=True)
     t_scheduler = threading.Thread(target=run_scheduler, daemon=True)
-    
-    # Start threads
-    t_backend.start()
-    time.sleep(2) # Give backend a moment
-    t_scheduler.start()
-    t_frontend.start()
+    if RUN_MODE == "split":
+        t_backend = threading.Thread(target=run_backend, daemon=True)
+        t_frontend = threading.Thread(target=run_frontend, daemon=True)
+        t_backend.start()
+        time.sleep(2) # Give backend a moment
+        t_scheduler.start()
+        t_frontend.start()
+    else:
+        t_server = threading.Thread(target=run_single, daemon=True)
+        t_server.start()
+        t_scheduler.start()
     
     try:
         # Keep main thread alive
@@ -2,7 +2,10 @@
 任务调度器
 读取 config/schedule.yaml 并按时执行各个同步任务
 """
+import functools
 import os
+import multiprocessing
+import threading
 import yaml
 import time
 import schedule
@@ -18,6 +21,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 调度器停止时等待采集进程响应 SIGTERM 的秒数（需小于 supervisor 的 PCRDB_SHUTDOWN_TIMEOUT）
+COLLECTOR_STOP_TIMEOUT = 10
+
 
 def load_schedule_config():
     """加载调度配置"""
@@ -31,11 +37,30 @@ def load_schedule_config():
         return yaml.safe_load(f)
 
 
+def prepare_partitions():
+    """预建快照表的当月和下月分区（任务写入前必须存在）"""
+    try:
+        from src.pcrdb.db.partitions import ensure_partitions
+        created = ensure_partitions()
+        if created:
+            logger.info(f"已创建分区: {', '.join(created)}")
+    except Exception as e:
+        logger.error(f"预建分区失败: {e}")
+
+
 def run_task(task_name: str, task_config: dict):
     """运行指定任务（日志记录已集成在各task模块内部）"""
     logger.info(f"开始执行任务: {task_name}")
     start_time = time.time()
     
+    prepare_partitions()
+    
+    # 任务配置 profile: cpu / mem 时剖析本次运行（TaskLogger 读取 PCRDB_PROFILE），结束后恢复原值
+    profile = task_config.get('profile')
+    previous_profile = os.environ.get('PCRDB_PROFILE')
+    if profile:
+        os.environ['PCRDB_PROFILE'] = profile
+    
     try:
         # 导入对应的任务模块
         if task_name == 'clan_sync':
@@ -69,6 +94,52 @@ def run_task(task_name: str, task_config: dict):
     
     except Exception as e:
         logger.error(f"任务 {task_name} 执行失败: {e}", exc_info=True)
+    
+    finally:
+        if profile:
+            if previous_profile is None:
+                os.environ.pop('PCRDB_PROFILE', None)
+            else:
+                os.environ['PCRDB_PROFILE'] = previous_profile
+
+
+def _collector_main(task_name: str, task_config: dict, niceness: int):
+    """采集子进程入口：降低优先级后执行任务"""
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+    run_task(task_name, task_config)
+
+
+def run_task_in_process(task_name: str, task_config: dict, niceness: int = 10,
+                        stop_event: threading.Event = None):
+    """
+    在独立的采集进程中运行任务（supervisor 模式）
+
+    加解密 / msgpack 等 CPU 密集的采集逻辑不与调度器、API 进程争用 GIL；
+    采集进程崩溃只影响本次任务。stop_event 设置后结束采集进程（先 SIGTERM，
+    COLLECTOR_STOP_TIMEOUT 秒后仍未退出则 kill），不留下孤儿进程继续写库。
+    """
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(
+        target=_collector_main,
+        args=(task_name, task_config, niceness),
+        name=f'pcrdb-collector-{task_name}'
+    )
+    proc.start()
+    logger.info(f"任务 {task_name} 在采集进程 {proc.pid} 中运行")
+    while proc.is_alive():
+        proc.join(1)
+        if stop_event is not None and stop_event.is_set() and proc.is_alive():
+            logger.info(f"收到停止信号，结束采集进程 {proc.pid} ({task_name})")
+            proc.terminate()
+            proc.join(COLLECTOR_STOP_TIMEOUT)
+            if proc.is_alive():
+                logger.error(f"采集进程 {proc.pid} 未在 {COLLECTOR_STOP_TIMEOUT} 秒内退出，强制结束")
+                proc.kill()
+                proc.join()
+            break
+    if proc.exitcode != 0:
+        logger.error(f"任务 {task_name} 的采集进程异常退出: exitcode={proc.exitcode}")
 
 
 import calendar
@@ -143,9 +214,9 @@ def check_day_match(day_expr: str) -> bool:
     return False
 
 
-def setup_schedules(config: dict):
+def setup_schedules(config: dict, runner=run_task):
     """
-    根据配置设置任务调度
+    根据配置设置任务调度（runner 为任务执行函数，默认在当前进程内执行）
     支持的 cron 表达式格式:
     - "分 时 * * *" : 每天执行
     - "分 时 日 * *" : 每月特定日期执行（支持逗号分隔如 1,11,21）
@@ -178,7 +249,7 @@ def setup_schedules(config: dict):
         if day_of_month == '*' and month == '*' and day_of_week == '*':
             # 每天执行
             schedule.every().day.at(time_str).do(
-                run_task, task_name=task_name, task_config=task_config
+                runner, task_name=task_name, task_config=task_config
             )
             logger.info(f"已调度任务: {task_name} 每天 {time_str} - {description}")
         
@@ -189,7 +260,7 @@ def setup_schedules(config: dict):
                 def monthly_job():
                     """月度任务包装：检查今天是否匹配日期表达式"""
                     if check_day_match(day_expr):
-                        run_task(t_name, t_config)
+                        runner(t_name, t_config)
                 return monthly_job
             
             job_func = make_monthly_job(task_name, task_config, day_of_month)
@@ -209,8 +280,14 @@ def setup_schedules(config: dict):
             logger.warning(f"任务 {task_name} 使用了复杂的 cron 表达式，暂不支持: {cron_expr}")
 
 
-def main():
-    """主函数"""
+def main(isolate: bool = False, stop_event: threading.Event = None):
+    """
+    主函数
+
+    Args:
+        isolate: 每个任务在独立的采集进程中运行（supervisor 模式）
+        stop_event: 设置后调度器退出
+    """
     logger.info("=" * 60)
     logger.info("pcrdb 任务调度器启动")
     logger.info("=" * 60)
@@ -224,17 +301,21 @@ def main():
     # scheduler_config = config.get('scheduler', {})
     # tz = scheduler_config.get('timezone', 'Asia/Shanghai')
     
-    # 设置所有调度
-    setup_schedules(config)
+    stop_event = stop_event or threading.Event()
+    
+    # 设置所有调度（隔离模式下停止信号会结束正在运行的采集进程）
+    runner = functools.partial(run_task_in_process, stop_event=stop_event) if isolate else run_task
+    setup_schedules(config, runner=runner)
     
     logger.info("调度器已准备就绪，等待任务执行...")
     logger.info("按 Ctrl+C 停止调度器")
     
     # 主循环
     try:
-        while True:
+        while not stop_event.is_set():
             schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
+            stop_event.wait(60)  # 每分钟检查一次
+        logger.info("收到停止信号，调度器退出")
     except KeyboardInterrupt:
         logger.info("收到停止信号，调度器退出")
 
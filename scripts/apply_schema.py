@@ -85,6 +85,16 @@ def apply_schema():
         conn.close()
         
         print(f"\n✅ 执行完成！成功: {success_count}, 跳过: {skip_count}")
+        
+        # 快照表为按月分区表，预建当月和下月的分区
+        from pcrdb.db.partitions import ensure_partitions
+        created = ensure_partitions()
+        if created:
+            print(f"✓ 已创建分区: {', '.join(created)}")
+
+        # 回填还没有公会月度汇总的期间（新建 clan_period_summary 后的首次执行）
+        from pcrdb.tasks import clan_summary
+        clan_summary.run('missing')
         return True
         
     except Exception as e:
@@ -0,0 +1,144 @@
+"""
+get_player_clan_history 基准测试
+
+按公会历史长度（月数）分桶抽样玩家，对比：
+- legacy: 原逐月查询 clan_snapshots 的实现（1 + 每月 1~2 次往返）
+- current: 单条 LATERAL 查询的实现（1 次往返）
+
+期望 current 的耗时不随历史长度增长，legacy 随月数线性增长。
+
+用法：
+    python scripts/bench_player_history.py
+    python scripts/bench_player_history.py --per-bucket 20 --repeat 5
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入 src.pcrdb 模块
+script_dir = Path(__file__).parent
+project_root = script_dir.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from pcrdb.db.connection import pooled_connection
+from pcrdb.analysis.player import get_player_clan_history
+
+
+# 历史月数分桶 [low, high)
+BUCKETS = [(1, 3), (3, 6), (6, 12), (12, 24), (24, 1000)]
+
+
+def legacy_history(viewer_id: int) -> int:
+    """原 N+1 实现（仅保留查询部分），返回数据库往返次数"""
+    round_trips = 0
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT ON (to_char(collected_at, 'YYYY-MM'))
+                to_char(collected_at, 'YYYY-MM') as period,
+                join_clan_id,
+                collected_at
+            FROM player_clan_snapshots
+            WHERE viewer_id = %s AND join_clan_id IS NOT NULL
+            ORDER BY to_char(collected_at, 'YYYY-MM') ASC, collected_at DESC
+        """, (viewer_id,))
+        round_trips += 1
+
+        for period, clan_id, collected_at in cursor.fetchall():
+            cursor.execute("""
+                SELECT grade_rank, current_period_ranking
+                FROM clan_snapshots
+                WHERE clan_id = %s AND collected_at > %s
+                ORDER BY collected_at ASC
+                LIMIT 1
+            """, (clan_id, collected_at))
+            round_trips += 1
+            ranking_row = cursor.fetchone()
+            if not (ranking_row and ranking_row[0]):
+                cursor.execute("""
+                    SELECT current_period_ranking
+                    FROM clan_snapshots
+                    WHERE clan_id = %s
+                    ORDER BY collected_at DESC
+                    LIMIT 1
+                """, (clan_id,))
+                round_trips += 1
+                cursor.fetchone()
+    return round_trips
+
+
+def sample_players(per_bucket: int, sample_percent: float) -> dict:
+    """抽样玩家并按历史月数分桶 {bucket: [viewer_id, ...]}"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT DISTINCT viewer_id
+            FROM player_clan_snapshots TABLESAMPLE SYSTEM ({sample_percent})
+            WHERE join_clan_id IS NOT NULL
+            LIMIT 5000
+        """)
+        candidates = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT viewer_id, COUNT(DISTINCT date_trunc('month', collected_at))
+            FROM player_clan_snapshots
+            WHERE viewer_id = ANY(%s) AND join_clan_id IS NOT NULL
+            GROUP BY viewer_id
+        """, (candidates,))
+        months = cursor.fetchall()
+
+    buckets = {b: [] for b in BUCKETS}
+    for viewer_id, count in months:
+        for low, high in BUCKETS:
+            if low <= count < high and len(buckets[(low, high)]) < per_bucket:
+                buckets[(low, high)].append(viewer_id)
+    return buckets
+
+
+def measure(func, viewer_ids: list, repeat: int) -> list:
+    """每个玩家执行 repeat 次，返回毫秒耗时列表"""
+    timings = []
+    for viewer_id in viewer_ids:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(viewer_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def p95(values: list) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='get_player_clan_history 基准测试')
+    parser.add_argument('--per-bucket', type=int, default=10, help='每个分桶抽样的玩家数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个玩家重复次数')
+    parser.add_argument('--sample-percent', type=float, default=1.0, help='TABLESAMPLE 抽样百分比')
+    args = parser.parse_args()
+
+    buckets = sample_players(args.per_bucket, args.sample_percent)
+
+    print(f"{'月数':>10} {'玩家':>4} {'legacy 往返':>10} {'legacy ms (avg/p95)':>20} {'current ms (avg/p95)':>21}")
+    for (low, high), viewer_ids in buckets.items():
+        if not viewer_ids:
+            continue
+        # 预热
+        for viewer_id in viewer_ids:
+            legacy_history(viewer_id)
+            get_player_clan_history(viewer_id)
+
+        round_trips = statistics.mean(legacy_history(v) for v in viewer_ids)
+        legacy = measure(legacy_history, viewer_ids, args.repeat)
+        current = measure(get_player_clan_history, viewer_ids, args.repeat)
+        print(f"{f'[{low},{high})':>10} {len(viewer_ids):>4} {round_trips:>10.1f} "
+              f"{statistics.mean(legacy):>11.1f} / {p95(legacy):<7.1f} "
+              f"{statistics.mean(current):>11.1f} / {p95(current):<7.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+大结果接口的序列化 / 压缩基准测试
+
+对 /api/clan/profiles、/api/clan/members、/api/grand/winning 的实际查询结果，对比：
+- 序列化耗时：jsonable_encoder + json.dumps（FastAPI 默认）与 orjson（responses.dumps）
+- 传输字节：未压缩、gzip、brotli（未安装 brotli 时跳过）
+
+用法：
+    python scripts/bench_responses.py
+    python scripts/bench_responses.py --repeat 20 --winning-limit 1000
+"""
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入 src.pcrdb 模块
+script_dir = Path(__file__).parent
+project_root = script_dir.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from fastapi.encoders import jsonable_encoder
+
+from pcrdb.analysis.clan import get_top_clan_profiles, get_clan_members, get_top_clans
+from pcrdb.analysis.grand import get_winning_ranking
+from pcrdb.responses import dumps, brotli, GZIP_LEVEL, BROTLI_QUALITY
+
+
+def default_dumps(content) -> bytes:
+    """FastAPI 默认 JSONResponse 的序列化路径"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def measure(func, content, repeat: int) -> float:
+    """平均耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='大结果接口序列化 / 压缩基准测试')
+    parser.add_argument('--repeat', type=int, default=10, help='每项重复次数')
+    parser.add_argument('--winning-limit', type=int, default=500, help='胜场榜返回数量')
+    args = parser.parse_args()
+
+    top = get_top_clans()
+    top_clan_id = top['clans'][0]['clan_id'] if top.get('clans') else None
+
+    cases = [
+        ('clan/profiles', lambda: get_top_clan_profiles()),
+        ('clan/members', lambda: get_clan_members(clan_id=top_clan_id)),
+        ('grand/winning?group=0', lambda: get_winning_ranking(0, args.winning_limit)),
+    ]
+
+    print(f"{'接口':<24} {'默认 ms':>8} {'orjson ms':>10} {'原始 KB':>9} {'gzip KB':>8} {'gzip ms':>8} "
+          f"{'br KB':>7} {'br ms':>6}")
+    for name, fetch in cases:
+        content = fetch()
+        body = dumps(content)
+        default_ms = measure(default_dumps, content, args.repeat)
+        orjson_ms = measure(dumps, content, args.repeat)
+
+        gzip_ms = measure(lambda b: gzip.compress(b, compresslevel=GZIP_LEVEL), body, args.repeat)
+        gzip_kb = len(gzip.compress(body, compresslevel=GZIP_LEVEL)) / 1024
+        if brotli is not None:
+            br_ms = measure(lambda b: brotli.compress(b, quality=BROTLI_QUALITY), body, args.repeat)
+            br_kb = f"{len(brotli.compress(body, quality=BROTLI_QUALITY)) / 1024:>7.1f}"
+            br_ms = f"{br_ms:>6.1f}"
+        else:
+            br_kb, br_ms = f"{'-':>7}", f"{'-':>6}"
+
+        print(f"{name:<24} {default_ms:>8.1f} {orjson_ms:>10.1f} {len(body) / 1024:>9.1f} "
+              f"{gzip_kb:>8.1f} {gzip_ms:>8.1f} {br_kb} {br_ms}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+建立采集运行目录 collection_runs 并回填历史运行
+
+旧数据每个 TaskQueue 批次各取一个 datetime.now()，同一次运行分散在大量时间戳上。
+本脚本按时间间隔把历史时间戳聚合成运行（相邻时间戳间隔超过 --gap-hours 视为新的一次运行），
+写入 collection_runs，使分析查询可以直接从目录取期间和时间范围。
+
+流程：
+1. 快照表添加 run_id 列，创建 collection_runs 表（已存在则跳过）
+2. 按表聚合历史时间戳，回填运行记录（已被现有运行覆盖的时间段跳过，可重复执行）
+3. 可选：--set-run-id 为历史快照行写入 run_id（按月分区逐个更新，耗时较长）
+
+用法：
+    python scripts/migrate_collection_runs.py
+    python scripts/migrate_collection_runs.py --gap-hours 3
+    python scripts/migrate_collection_runs.py --set-run-id
+"""
+import argparse
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入 src.pcrdb 模块
+script_dir = Path(__file__).parent
+project_root = script_dir.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from pcrdb.db.connection import create_connection
+from pcrdb.db.partitions import is_partitioned, list_partitions
+
+
+# 回填时 快照表 → 任务名（每日/月度档案无法区分，统一记为 player_profile_sync）
+TASK_SOURCES = {
+    'clan_sync': ['clan_snapshots', 'player_clan_snapshots'],
+    'player_profile_sync': ['player_profile_snapshots'],
+    'grand_sync': ['grand_arena_snapshots'],
+    'arena_deck_sync': ['arena_deck_snapshots'],
+}
+
+
+CREATE_RUNS_SQL = """
+    CREATE TABLE IF NOT EXISTS collection_runs (
+        id SERIAL PRIMARY KEY,
+        task_name TEXT NOT NULL,
+        period TEXT NOT NULL,
+        collected_at TIMESTAMPTZ NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL,
+        finished_at TIMESTAMPTZ,
+        status TEXT NOT NULL DEFAULT 'running',
+        range_start TIMESTAMPTZ,
+        range_end TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS idx_runs_task ON collection_runs (task_name, collected_at DESC);
+"""
+
+
+def ensure_schema(conn):
+    """添加 run_id 列并创建 collection_runs 表"""
+    cur = conn.cursor()
+    cur.execute(CREATE_RUNS_SQL)
+    for tables in TASK_SOURCES.values():
+        for table in tables:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS run_id INTEGER")
+    conn.commit()
+    print("✓ collection_runs 表和 run_id 列已就绪")
+
+
+def group_runs(timestamps: list, gap: timedelta) -> list:
+    """按间隔把有序时间戳聚合为 [(first, last), ...]"""
+    runs = []
+    for ts in timestamps:
+        if runs and ts - runs[-1][1] <= gap:
+            runs[-1][1] = ts
+        else:
+            runs.append([ts, ts])
+    return [tuple(r) for r in runs]
+
+
+def backfill_task(conn, task_name: str, tables: list, gap: timedelta) -> int:
+    """回填单个任务的历史运行，返回新增运行数"""
+    cur = conn.cursor()
+    union = " UNION ".join(f"SELECT DISTINCT collected_at FROM {t}" for t in tables)
+    cur.execute(f"SELECT collected_at FROM ({union}) ts ORDER BY collected_at")
+    timestamps = [row[0] for row in cur.fetchall()]
+
+    created = 0
+    for first, last in group_runs(timestamps, gap):
+        range_end = last + timedelta(seconds=1)
+        cur.execute("""
+            SELECT 1 FROM collection_runs
+            WHERE task_name = %s AND range_start < %s AND range_end > %s
+            LIMIT 1
+        """, (task_name, range_end, first))
+        if cur.fetchone():
+            continue
+
+        cur.execute("""
+            INSERT INTO collection_runs
+            (task_name, period, collected_at, started_at, finished_at, status, range_start, range_end)
+            VALUES (%s, %s, %s, %s, %s, 'success', %s, %s)
+        """, (task_name, first.strftime('%Y-%m'), first, first, last, first, range_end))
+        created += 1
+
+    conn.commit()
+    print(f"  {task_name}: {len(timestamps)} 个时间戳 → 新增 {created} 次运行")
+    return created
+
+
+def set_run_ids(conn, task_name: str, tables: list):
+    """为历史快照行写入 run_id（分区表逐分区提交）"""
+    cur = conn.cursor()
+    for table in tables:
+        targets = list_partitions(cur, table) if is_partitioned(cur, table) else [table]
+        for target in targets:
+            cur.execute(f"""
+                UPDATE {target} t
+                SET run_id = r.id
+                FROM collection_runs r
+                WHERE t.run_id IS NULL
+                  AND r.task_name = %s
+                  AND t.collected_at >= r.range_start
+                  AND t.collected_at < r.range_end
+            """, (task_name,))
+            conn.commit()
+            print(f"  {target}: 更新 {cur.rowcount} 行")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='建立采集运行目录并回填历史运行')
+    parser.add_argument('--gap-hours', type=float, default=6, help='相邻时间戳间隔超过该值视为新的一次运行')
+    parser.add_argument('--set-run-id', action='store_true', help='同时为历史快照行写入 run_id')
+    args = parser.parse_args()
+
+    conn = create_connection()
+    try:
+        ensure_schema(conn)
+
+        print("\n回填历史运行...")
+        gap = timedelta(hours=args.gap_hours)
+        for task_name, tables in TASK_SOURCES.items():
+            backfill_task(conn, task_name, tables, gap)
+
+        if args.set_run_id:
+            print("\n写入历史快照 run_id...")
+            for task_name, tables in TASK_SOURCES.items():
+                set_run_ids(conn, task_name, tables)
+    except Exception as e:
+        conn.rollback()
+        print(f"\n❌ 迁移失败: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print("\n✅ 完成")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
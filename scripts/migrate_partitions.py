@@ -0,0 +1,204 @@
+"""
+将快照表在线迁移为按月分区表
+
+流程（每张表）：
+1. 创建分区新表 {table}_partitioned（列与原表一致，PARTITION BY RANGE (collected_at)）
+2. 按原表数据范围创建月分区，并预建下月分区
+3. 按 id 分批复制数据，每批独立提交（迁移期间原表照常读写；中断后重跑可续传）
+4. 短暂锁表（只阻塞写入），补齐复制期间新写入的数据，然后改名切换：
+   {table} -> {table}_old, {table}_partitioned -> {table}
+5. 确认数据无误后手动 DROP TABLE {table}_old
+
+用法：
+    python scripts/migrate_partitions.py                          # 迁移全部快照表
+    python scripts/migrate_partitions.py player_clan_snapshots    # 只迁移指定表
+    python scripts/migrate_partitions.py --batch-size 50000
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入 src.pcrdb 模块
+script_dir = Path(__file__).parent
+project_root = script_dir.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from pcrdb.db.connection import create_connection
+from pcrdb.db.partitions import (
+    PARTITIONED_TABLES, add_months, create_partition, is_partitioned, month_start
+)
+
+
+# 与 schema.sql 保持一致的索引定义 {table: [(index_name, columns_sql), ...]}
+TABLE_INDEXES = {
+    'player_clan_snapshots': [
+        ('idx_pclan_viewer', '(viewer_id, collected_at DESC)'),
+        ('idx_pclan_clan', '(join_clan_id)'),
+        ('idx_pclan_collected', 'USING BRIN (collected_at)'),
+    ],
+    'player_profile_snapshots': [
+        ('idx_pprofile_viewer', '(viewer_id, collected_at DESC)'),
+        ('idx_pprofile_collected', 'USING BRIN (collected_at)'),
+    ],
+    'grand_arena_snapshots': [
+        ('idx_grand_viewer', '(viewer_id, collected_at DESC)'),
+        ('idx_grand_collected', 'USING BRIN (collected_at)'),
+    ],
+    'arena_deck_snapshots': [
+        ('idx_deck_viewer', '(viewer_id, collected_at DESC)'),
+        ('idx_deck_collected', 'USING BRIN (collected_at)'),
+    ],
+}
+
+
+def create_partitioned_copy(conn, table: str, new_table: str):
+    """创建分区新表及其约束、索引、月分区"""
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass(%s)", (new_table,))
+    if cur.fetchone()[0] is not None:
+        print(f"  {new_table} 已存在，继续复制")
+        return
+
+    cur.execute(f"""
+        CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS)
+        PARTITION BY RANGE (collected_at)
+    """)
+    cur.execute(f"ALTER TABLE {new_table} ADD PRIMARY KEY (id, collected_at)")
+    cur.execute(f"ALTER TABLE {new_table} ADD UNIQUE (viewer_id, collected_at)")
+
+    # 索引先用临时名，切换时再改为 schema.sql 中的名字
+    for index_name, columns_sql in TABLE_INDEXES[table]:
+        cur.execute(f"CREATE INDEX {index_name}_new ON {new_table} {columns_sql}")
+
+    # 覆盖原表全部数据的月分区 + 下月分区
+    cur.execute(f"SELECT MIN(collected_at) FROM {table}")
+    first = cur.fetchone()[0] or datetime.now()
+    month = month_start(first)
+    last = add_months(month_start(datetime.now()), 1)
+    count = 0
+    while month <= last:
+        if create_partition(cur, new_table, month):
+            count += 1
+        month = add_months(month, 1)
+
+    conn.commit()
+    print(f"  已创建 {new_table}（{count} 个月分区）")
+
+
+def copy_rows(conn, table: str, new_table: str, batch_size: int) -> int:
+    """按 id 分批复制，每批提交一次；返回已复制到的最大 id"""
+    cur = conn.cursor()
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {new_table}")
+    last_id = cur.fetchone()[0]
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    high_id = cur.fetchone()[0]
+    conn.commit()
+
+    start = time.time()
+    copied = 0
+    while last_id < high_id:
+        upper = last_id + batch_size
+        cur.execute(f"""
+            INSERT INTO {new_table}
+            SELECT * FROM {table} WHERE id > %s AND id <= %s
+            ON CONFLICT DO NOTHING
+        """, (last_id, upper))
+        copied += cur.rowcount
+        conn.commit()
+        last_id = upper
+
+        pct = min(last_id / high_id, 1) if high_id else 1
+        sys.stdout.write(f"\r  复制中 {pct:.1%} ({copied} 行, {time.time() - start:.0f}s)")
+        sys.stdout.flush()
+
+    print(f"\r  已复制 {copied} 行，耗时 {time.time() - start:.1f}s" + " " * 20)
+    return min(last_id, high_id)
+
+
+def swap_tables(conn, table: str, new_table: str, copied_id: int):
+    """锁表补齐增量后改名切换（单个事务）"""
+    old_table = f"{table}_old"
+    cur = conn.cursor()
+
+    # SHARE ROW EXCLUSIVE: 阻塞写入，允许读取
+    cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f"""
+        INSERT INTO {new_table}
+        SELECT * FROM {table} WHERE id > %s
+        ON CONFLICT DO NOTHING
+    """, (copied_id,))
+    print(f"  补齐增量 {cur.rowcount} 行")
+
+    cur.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+    cur.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+    # 分区名跟随父表改名
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    for (partition,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE {partition} RENAME TO {partition.replace(new_table, table, 1)}")
+
+    for index_name, _ in TABLE_INDEXES[table]:
+        cur.execute(f"ALTER INDEX IF EXISTS {index_name} RENAME TO {index_name}_old")
+        cur.execute(f"ALTER INDEX {index_name}_new RENAME TO {index_name}")
+
+    # 序列归属新表，之后 DROP 旧表不会连带删除序列
+    cur.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    conn.commit()
+    print(f"  切换完成：{table} 已是分区表，原表保留为 {old_table}")
+
+
+def migrate_table(table: str, batch_size: int):
+    """迁移单张表"""
+    print(f"\n=== {table} ===")
+    conn = create_connection()
+    try:
+        cur = conn.cursor()
+        if is_partitioned(cur, table):
+            print("  已是分区表，跳过")
+            return
+        conn.commit()
+
+        new_table = f"{table}_partitioned"
+        create_partitioned_copy(conn, table, new_table)
+        copied_id = copy_rows(conn, table, new_table, batch_size)
+        swap_tables(conn, table, new_table, copied_id)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将快照表在线迁移为按月分区表')
+    parser.add_argument('tables', nargs='*', help=f'要迁移的表（默认: {", ".join(PARTITIONED_TABLES)}）')
+    parser.add_argument('--batch-size', type=int, default=100000, help='每批复制的 id 范围')
+    args = parser.parse_args()
+
+    tables = args.tables or PARTITIONED_TABLES
+    unknown = [t for t in tables if t not in PARTITIONED_TABLES]
+    if unknown:
+        print(f"❌ 不支持的表: {unknown}")
+        return 1
+
+    for table in tables:
+        try:
+            migrate_table(table, args.batch_size)
+        except Exception as e:
+            print(f"\n❌ {table} 迁移失败: {e}")
+            return 1
+
+    print("\n✅ 迁移完成。确认数据无误后可执行 DROP TABLE <table>_old 释放空间。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
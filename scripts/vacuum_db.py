@@ -1,42 +1,86 @@
-import psycopg2
-import yaml
-import os
+"""
+VACUUM FULL 压缩表空间
 
-def get_db_config():
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'database.yaml')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
-    return config['postgresql']
+快照表已按月分区时逐个分区执行，每次只锁一个分区；
+默认跳过当月分区（仍在写入），避免阻塞采集任务。
 
-def vacuum_db():
+用法：
+    python scripts/vacuum_db.py                               # 所有快照表
+    python scripts/vacuum_db.py player_clan_snapshots         # 指定表
+    python scripts/vacuum_db.py --since 2025-06               # 只处理 2025-06 及之后的分区
+    python scripts/vacuum_db.py --include-current             # 包含当月分区
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入 src.pcrdb 模块
+script_dir = Path(__file__).parent
+project_root = script_dir.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from pcrdb.db.connection import create_connection
+from pcrdb.db.partitions import is_partitioned, list_partitions, partition_name, month_start
+
+
+TABLES = [
+    'clan_snapshots',
+    'player_clan_snapshots',
+    'player_profile_snapshots',
+    'grand_arena_snapshots',
+    'arena_deck_snapshots'
+]
+
+
+def vacuum_targets(cursor, table: str, since: str = None, include_current: bool = False) -> list:
+    """展开为实际要 VACUUM 的表/分区列表"""
+    if not is_partitioned(cursor, table):
+        return [table]
+
+    current = partition_name(table, month_start(datetime.now()))
+    lower = None
+    if since:
+        lower = partition_name(table, datetime.strptime(since, '%Y-%m'))
+
+    targets = []
+    for partition in list_partitions(cursor, table):
+        if lower and partition < lower:
+            continue
+        if partition >= current and not include_current:
+            continue
+        targets.append(partition)
+    return targets
+
+
+def vacuum_db(tables: list = None, since: str = None, include_current: bool = False):
     print("Starting VACUUM FULL to reclaim disk space...")
     try:
-        db_config = get_db_config()
-        # Connect with autocommit=True because VACUUM cannot run inside a transaction block
-        conn = psycopg2.connect(**db_config)
+        # VACUUM cannot run inside a transaction block
+        conn = create_connection()
         conn.autocommit = True
-        
+
         cursor = conn.cursor()
-        
-        tables = [
-            'clan_snapshots',
-            'player_clan_snapshots',
-            'player_profile_snapshots',
-            'grand_arena_snapshots',
-            'arena_deck_snapshots'
-        ]
-        
-        for table in tables:
-            print(f"Vacuuming {table}...")
-            cursor.execute(f"VACUUM FULL {table};")
-            print(f"✓ {table} compacted.")
-            
+
+        for table in tables or TABLES:
+            for target in vacuum_targets(cursor, table, since, include_current):
+                print(f"Vacuuming {target}...")
+                cursor.execute(f"VACUUM FULL ANALYZE {target};")
+                print(f"✓ {target} compacted.")
+
         cursor.close()
         conn.close()
         print("\n✅ Database optimization completed.")
-            
+
     except Exception as e:
         print(f"Error: {e}")
 
+
 if __name__ == "__main__":
-    vacuum_db()
+    parser = argparse.ArgumentParser(description='VACUUM FULL 压缩快照表（分区表逐分区执行）')
+    parser.add_argument('tables', nargs='*', help='要处理的表（默认全部快照表）')
+    parser.add_argument('--since', help='只处理该月份及之后的分区 (YYYY-MM)')
+    parser.add_argument('--include-current', action='store_true', help='包含当月（正在写入的）分区')
+    args = parser.parse_args()
+
+    vacuum_db(args.tables, args.since, args.include_current)
@@ -91,6 +91,7 @@ def get_db_structure(conn) -> dict:
     """从数据库获取实际表结构"""
     cur = conn.cursor()
     
+    # 月分区与父表结构相同，不单独比较
     cur.execute("""
         SELECT 
             table_schema || '.' || table_name as full_name,
@@ -98,6 +99,11 @@ def get_db_structure(conn) -> dict:
             data_type
         FROM information_schema.columns
         WHERE table_schema IN ('public', 'auth')
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_class c
+              JOIN pg_namespace n ON n.oid = c.relnamespace
+              WHERE n.nspname = table_schema AND c.relname = table_name AND c.relispartition
+          )
         ORDER BY table_schema, table_name, ordinal_position
     """)
     
@@ -3,7 +3,18 @@
 """
 from typing import Dict, List, Optional
 
-from ..db.connection import get_connection
+from ..db.connection import pooled_connection
+from ..db.aio import to_async
+from ..db.slow_queries import TimedCursor
+from ..db.collection_runs import (
+    CLAN_TASKS, PROFILE_TASKS, get_latest_period, get_run_dates, period_range, date_range
+)
+from ..db.partitions import month_range
+from ..db.aliases import like_pattern
+from .paging import (
+    MAX_PAGE_SIZE, cursor_scope, decode_cursor, keyset_condition, order_by, page_size, parse_fields, parse_sort, project,
+    sort_columns, split_page
+)
 
 
 def get_clan_history(clan_id: int = None, clan_name: str = None, limit: int = 10) -> Dict:
@@ -17,167 +28,195 @@ def get_clan_history(clan_id: int = None, clan_name: str = None, limit: int = 10
     Returns:
         {clan_id, clan_name, history: [{period, ranking, is_estimate, member_num, leader_name, leader_viewer_id}, ...]}
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # 如果传入 clan_name，先查找对应的 clan_id
-    if clan_id is None and clan_name:
-        cursor.execute("""
-            SELECT DISTINCT ON (clan_id) clan_id, clan_name, current_period_ranking
-            FROM clan_snapshots
-            WHERE clan_name = %s AND exist = TRUE
-            ORDER BY clan_id, collected_at DESC
-        """, (clan_name,))
-        rows = cursor.fetchall()
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=TimedCursor)
+    
+        # 如果传入 clan_name，先查找对应的 clan_id（含曾用名）
+        if clan_id is None and clan_name:
+            cursor.execute("""
+                SELECT a.clan_id, l.clan_name, l.current_period_ranking
+                FROM clan_aliases a
+                JOIN clan_latest l ON l.clan_id = a.clan_id
+                WHERE a.name = %s AND l.exist = TRUE
+            """, (clan_name,))
+            rows = cursor.fetchall()
         
-        if not rows:
-            return {"error": f"未找到公会: {clan_name}"}
+            if not rows:
+                return {"error": f"未找到公会: {clan_name}"}
         
-        # 选排名最高且≠0的
-        valid = [(r[0], r[1], r[2]) for r in rows if r[2] and r[2] > 0]
-        if valid:
-            valid.sort(key=lambda x: x[2])  # 按排名升序
-            clan_id = valid[0][0]
-        else:
-            clan_id = rows[0][0]
-    
-    if clan_id is None:
-        return {"error": "请提供 clan_id 或 clan_name"}
-    
-    # 获取该公会所有快照，按时间排序
-    cursor.execute("""
-        SELECT 
-            collected_at,
-            current_period_ranking,
-            grade_rank,
-            member_num,
-            clan_name,
-            leader_name,
-            leader_viewer_id
-        FROM clan_snapshots
-        WHERE clan_id = %s AND exist = TRUE
-        ORDER BY collected_at ASC
-    """, (clan_id,))
-    
-    rows = cursor.fetchall()
-    if not rows:
-        return {"clan_id": clan_id, "clan_name": None, "history": []}
-    
-    # 按会战周期分组（相隔 20 天以上视为不同期）
-    periods = []
-    last_date = None
-    month_count = {}  # 记录每月出现次数
-    
-    for row in rows:
-        collected_at = row[0]
-        
-        if last_date is None or (collected_at - last_date).days >= 20:
-            month_str = collected_at.strftime('%Y-%m')
-            
-            # 处理同月多次的情况
-            if month_str in month_count:
-                month_count[month_str] += 1
-                period_str = f"{month_str}/{month_count[month_str]}"
+            # 选排名最高且≠0的
+            valid = [(r[0], r[1], r[2]) for r in rows if r[2] and r[2] > 0]
+            if valid:
+                valid.sort(key=lambda x: x[2])  # 按排名升序
+                clan_id = valid[0][0]
             else:
-                month_count[month_str] = 1
-                period_str = month_str
-            
-            periods.append({
-                'period': period_str,
-                'collected_at': collected_at,
-                'current_period_ranking': row[1],
-                'grade_rank': row[2],
-                'member_num': row[3],
-                'clan_name': row[4],
-                'leader_name': row[5],
-                'leader_viewer_id': row[6]
-            })
-            last_date = collected_at
-    
-    # 计算最终排名：用下一期的 grade_rank
-    history = []
-    for i, p in enumerate(periods):
-        if i + 1 < len(periods):
-            # 有下一期，用下一期的 grade_rank
-            ranking = periods[i + 1]['grade_rank']
-            is_estimate = False
-        else:
-            # 最近一期，用 current_period_ranking
-            ranking = p['current_period_ranking']
-            is_estimate = True
-        
-        history.append({
-            'period': p['period'],
-            'ranking': ranking,
-            'is_estimate': is_estimate,
-            'member_num': p['member_num'],
-            'leader_name': p['leader_name'],
-            'leader_viewer_id': p['leader_viewer_id'],
-            'clan_name': p['clan_name']
-        })
+                clan_id = rows[0][0]
     
-    # 按倒序排列（最新的在前面）
-    history.reverse()
-
-    # 获取最新的公会名
-    # latest_name = periods_raw[-1]['clan_name'] if periods_raw else None # This line is no longer needed as clan_name is taken from the first item in reversed history
+        if clan_id is None:
+            return {"error": "请提供 clan_id 或 clan_name"}
     
+        history = _fetch_clan_histories(cursor, [clan_id], limit).get(clan_id, [])
+
+        return {
+            'clan_id': clan_id,
+            'clan_name': history[0]['clan_name'] if history else (clan_name or "Unknown"),
+            'history': history
+        }
+
+
+MAX_BATCH_IDS = 100
+
+
+def _fetch_clan_histories(cursor, clan_ids: List[int], limit: int = 0) -> Dict[int, List[Dict]]:
+    """按 clan_id 批量读取月度汇总（clan_sync 后写入，最终排名已按下一期 grade_rank 解析），limit <= 0 不限"""
+    cursor.execute("""
+        SELECT clan_id, period, ranking, is_estimate, member_num, leader_name, leader_viewer_id, clan_name
+        FROM (
+            SELECT 
+                clan_id,
+                period,
+                CASE WHEN is_final THEN final_ranking ELSE current_period_ranking END as ranking,
+                NOT is_final as is_estimate,
+                member_num,
+                leader_name,
+                leader_viewer_id,
+                clan_name,
+                ROW_NUMBER() OVER (PARTITION BY clan_id ORDER BY period DESC) as n
+            FROM clan_period_summary
+            WHERE clan_id = ANY(%s) AND exist = TRUE
+        ) t
+        WHERE %s <= 0 OR n <= %s
+        ORDER BY clan_id, period DESC
+    """, (list(clan_ids), limit, limit))
+
+    histories: Dict[int, List[Dict]] = {}
+    for row in cursor.fetchall():
+        histories.setdefault(row[0], []).append({
+            'period': row[1],
+            'ranking': row[2],
+            'is_estimate': row[3],
+            'member_num': row[4],
+            'leader_name': row[5],
+            'leader_viewer_id': row[6],
+            'clan_name': row[7]
+        })
+    return histories
+
+
+def get_clan_history_batch(clan_ids: List[int], limit: int = 10) -> Dict:
+    """
+    批量获取公会月度历史（一次查询）
     
-    # Apply limit if specified
-    if limit > 0:
-        history = history[:limit]
+    Args:
+        clan_ids: 公会 ID 列表（最多 MAX_BATCH_IDS 个）
+        limit: 每个公会返回的期数，<= 0 不限
+        
+    Returns:
+        {clans: {clan_id: {clan_id, clan_name, history: [...]}}}，没有数据的公会 history 为空
+    """
+    clan_ids = sorted(set(clan_ids))
+    if len(clan_ids) > MAX_BATCH_IDS:
+        return {"error": f"一次最多查询 {MAX_BATCH_IDS} 个公会"}
 
-    return {
-        'clan_id': clan_id,
-        'clan_name': history[0]['clan_name'] if history else (clan_name or "Unknown"),
-        'history': history
-    }
+    with pooled_connection() as conn:
+        histories = _fetch_clan_histories(conn.cursor(cursor_factory=TimedCursor), clan_ids, limit)
+
+    clans = {}
+    for clan_id in clan_ids:
+        history = histories.get(clan_id, [])
+        clans[clan_id] = {
+            'clan_id': clan_id,
+            'clan_name': history[0]['clan_name'] if history else None,
+            'history': history
+        }
+    return {"clans": clans}
 
 
-def get_clan_power_ranking(limit: int = 50) -> List[Dict]:
+# member_count >= 10 的汇总行战力列均已聚合（非 NULL），直接用原列以利用 idx_cps_period_power
+CLAN_POWER_SORTS = {
+    'avg_power': 'avg_power',
+    'member_count': 'member_count',
+    'total_power': 'total_power',
+}
+DEFAULT_CLAN_POWER_SORT = '-avg_power'
+CLAN_POWER_FIELDS = ['rank', 'clan_id', 'clan_name', 'avg_power', 'member_count', 'total_power']
+
+
+def get_clan_power_ranking(limit: int = 50, sort: str = None, cursor: str = None, fields: str = None) -> Dict:
     """
-    获取最近一期公会按平均战力排名
+    获取最近一期公会按平均战力排名，keyset 分页
+    
+    Args:
+        limit: 每页数量（最多 MAX_PAGE_SIZE）
+        sort: 排序字段（CLAN_POWER_SORTS），'-' 前缀倒序，默认 DEFAULT_CLAN_POWER_SORT
+        cursor: 上一页的 next_cursor
+        fields: 逗号分隔的返回字段（CLAN_POWER_FIELDS），默认全部
+        
+    Returns:
+        {period, sort, clans: [{rank, clan_id, clan_name, avg_power, member_count, total_power}, ...], next_cursor}
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    limit = page_size(limit, 50)
+    sort = sort or DEFAULT_CLAN_POWER_SORT
+    try:
+        keys = parse_sort(sort, CLAN_POWER_SORTS, DEFAULT_CLAN_POWER_SORT, [('clan_id', False)])
+        columns = parse_fields(fields, CLAN_POWER_FIELDS, required=('clan_id',))
+    except ValueError as e:
+        return {"error": str(e)}
+
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=TimedCursor)
+        cur.execute("SELECT MAX(period) FROM clan_period_summary")
+        period = cur.fetchone()[0]
+        if period is None:
+            return {"period": None, "sort": sort, "clans": [], "next_cursor": None}
+        # 游标绑定排序和期间：新一期汇总生成后旧游标失效
+        scope = cursor_scope(sort, period)
+        try:
+            after, offset = decode_cursor(cursor, len(keys), scope)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        # 最近一期月度汇总中的平均战力（至少10人才统计）
+        where = "period = %s AND member_count >= 10"
+        params = [period]
+        if after is not None:
+            condition, condition_params = keyset_condition(keys, after)
+            where += f" AND {condition}"
+            params.extend(condition_params)
+        params.append(limit + 1)
+
+        cur.execute(f"""
+            SELECT 
+                clan_id,
+                clan_name,
+                avg_power,
+                member_count,
+                total_power,
+                {sort_columns(keys)}
+            FROM clan_period_summary
+            WHERE {where}
+            ORDER BY {order_by(keys)}
+            LIMIT %s
+        """, params)
+        rows, next_cursor = split_page(cur.fetchall(), limit, len(keys), offset, scope)
     
-    # 基于最近的 player_clan_snapshots 计算平均战力
-    cursor.execute("""
-        WITH latest_data AS (
-            SELECT DISTINCT ON (viewer_id)
-                viewer_id,
-                join_clan_id,
-                join_clan_name,
-                total_power
-            FROM player_clan_snapshots
-            WHERE collected_at > NOW() - INTERVAL '7 days'
-              AND join_clan_id IS NOT NULL
-              AND total_power > 0
-            ORDER BY viewer_id, collected_at DESC
-        )
-        SELECT 
-            join_clan_id,
-            join_clan_name,
-            ROUND(AVG(total_power)) as avg_power,
-            COUNT(*) as member_count
-        FROM latest_data
-        GROUP BY join_clan_id, join_clan_name
-        HAVING COUNT(*) >= 10  -- 至少10人才统计
-        ORDER BY avg_power DESC
-        LIMIT %s
-    """, (limit,))
-    
-    result = []
-    for i, row in enumerate(cursor.fetchall(), 1):
-        result.append({
+    clans = []
+    for i, row in enumerate(rows, offset + 1):
+        clans.append(project({
             'rank': i,
             'clan_id': row[0],
             'clan_name': row[1],
             'avg_power': int(row[2]),
-            'member_count': row[3]
-        })
+            'member_count': row[3],
+            'total_power': row[4]
+        }, columns))
     
-    return result
+    return {
+        "period": period,
+        "sort": sort,
+        "clans": clans,
+        "next_cursor": next_cursor
+    }
 
 
 def get_clan_members(clan_id: int = None, clan_name: str = None, period: str = None) -> Dict:
@@ -192,90 +231,90 @@ def get_clan_members(clan_id: int = None, clan_name: str = None, period: str = N
     Returns:
         {clan_id, clan_name, member_count, members: [{viewer_id, name, level, ...}]}
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # 1. 确定 period
+    # 1. 确定 period（查采集运行目录，不扫快照表）
     if not period:
-        cursor.execute("""
-            SELECT DISTINCT to_char(collected_at, 'YYYY-MM') as period
-            FROM player_clan_snapshots
-            ORDER BY period DESC
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if not row:
+        period = get_latest_period(CLAN_TASKS)
+        if not period:
             return {"error": "暂无数据"}
-        period = row[0]
+    
+    # 该月采集运行覆盖的半开区间，只扫描该月分区
+    try:
+        period_start, period_end = period_range(CLAN_TASKS, period)
+    except ValueError:
+        return {"error": f"无效的月份: {period}"}
+    
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=TimedCursor)
         
-    # 2. 如果只给了 clan_name，先找 clan_id (在指定月份存在)
-    if clan_id is None and clan_name:
-        cursor.execute("""
-            SELECT DISTINCT join_clan_id
-            FROM player_clan_snapshots
-            WHERE to_char(collected_at, 'YYYY-MM') = %s
-              AND join_clan_name = %s
-            LIMIT 1
-        """, (period, clan_name))
-        row = cursor.fetchone()
-        if not row:
-            return {"error": f"未找到公会: {clan_name} 在 {period}"}
-        clan_id = row[0]
+        # 2. 如果只给了 clan_name，先找 clan_id (该名字在指定月份使用过)
+        if clan_id is None and clan_name:
+            cursor.execute("""
+                SELECT clan_id
+                FROM clan_aliases
+                WHERE name = %s
+                  AND first_seen < %s AND last_seen >= %s
+                ORDER BY last_seen DESC
+                LIMIT 1
+            """, (clan_name, period_end, period_start))
+            row = cursor.fetchone()
+            if not row:
+                return {"error": f"未找到公会: {clan_name} 在 {period}"}
+            clan_id = row[0]
         
-    if clan_id is None:
-        return {"error": "请提供 clan_id 或 clan_name"}
+        if clan_id is None:
+            return {"error": "请提供 clan_id 或 clan_name"}
 
-    # 3. 查询成员列表 (每个成员取该月最新的快照)
-    # role: 40=会长, 30=副会长
-    cursor.execute("""
-        SELECT DISTINCT ON (viewer_id)
-            viewer_id,
-            name,
-            level,
-            total_power,
-            role,
-            join_clan_name
-        FROM player_clan_snapshots
-        WHERE to_char(collected_at, 'YYYY-MM') = %s
-          AND join_clan_id = %s
-        ORDER BY viewer_id, collected_at DESC
-    """, (period, clan_id))
-    
-    rows = cursor.fetchall()
-    
-    members = []
-    clan_name_actual = None
+        # 3. 查询成员列表 (每个成员取该月最新的快照)
+        # role: 40=会长, 30=副会长
+        cursor.execute("""
+            SELECT DISTINCT ON (viewer_id)
+                viewer_id,
+                name,
+                level,
+                total_power,
+                role,
+                join_clan_name
+            FROM player_clan_snapshots
+            WHERE collected_at >= %s AND collected_at < %s
+              AND join_clan_id = %s
+            ORDER BY viewer_id, collected_at DESC
+        """, (period_start, period_end, clan_id))
     
-    for row in rows:
-        vid, name, level, power, role_val, cname = row
-        if clan_name_actual is None:
-            clan_name_actual = cname
+        rows = cursor.fetchall()
+    
+        members = []
+        clan_name_actual = None
+    
+        for row in rows:
+            vid, name, level, power, role_val, cname = row
+            if clan_name_actual is None:
+                clan_name_actual = cname
             
-        role_str = ""
-        if role_val == 40:
-            role_str = "会长"
-        elif role_val == 30:
-            role_str = "副会长"
+            role_str = ""
+            if role_val == 40:
+                role_str = "会长"
+            elif role_val == 30:
+                role_str = "副会长"
             
-        members.append({
-            "viewer_id": vid,
-            "name": name,
-            "level": level,
-            "total_power": power,
-            "role": role_str,
-            "role_val": role_val or 0
-        })
+            members.append({
+                "viewer_id": vid,
+                "name": name,
+                "level": level,
+                "total_power": power,
+                "role": role_str,
+                "role_val": role_val or 0
+            })
         
-    # 按职务排序 (会长>副会长>普通)，再按战力降序
-    members.sort(key=lambda x: (x['role_val'], x['total_power']), reverse=True)
+        # 按职务排序 (会长>副会长>普通)，再按战力降序
+        members.sort(key=lambda x: (x['role_val'], x['total_power']), reverse=True)
 
-    return {
-        "clan_id": clan_id,
-        "clan_name": clan_name_actual or clan_name,
-        "period": period,
-        "member_count": len(members),
-        "members": members
-    }
+        return {
+            "clan_id": clan_id,
+            "clan_name": clan_name_actual or clan_name,
+            "period": period,
+            "member_count": len(members),
+            "members": members
+        }
 
 
 def _exp_to_knight_level(exp: int) -> str:
@@ -352,7 +391,7 @@ def _count_talent_quest(talent_data) -> int:
 
 def get_top_clans(period: str = None, limit: int = 30) -> Dict:
     """
-    Get top clans (by ranking) for a given period from clan_snapshots.
+    Get top clans (by ranking) for a given period from clan_period_summary.
     
     Args:
         period: Month (YYYY-MM), defaults to latest
@@ -361,155 +400,262 @@ def get_top_clans(period: str = None, limit: int = 30) -> Dict:
     Returns:
         {period, clans: [{clan_id, clan_name, ranking}, ...]}
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Determine period
+    # Determine period from the collection run catalog
     if not period:
-        cursor.execute("""
-            SELECT DISTINCT to_char(collected_at, 'YYYY-MM') as period
-            FROM clan_snapshots
-            ORDER BY period DESC
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if not row:
+        period = get_latest_period(CLAN_TASKS)
+        if not period:
             return {"error": "暂无数据"}
-        period = row[0]
     
-    # Get top clans by ranking for the period
-    cursor.execute("""
-        SELECT DISTINCT ON (clan_id)
-            clan_id,
-            clan_name,
-            current_period_ranking
-        FROM clan_snapshots
-        WHERE to_char(collected_at, 'YYYY-MM') = %s
-          AND current_period_ranking > 0
-          AND current_period_ranking <= %s
-          AND exist = TRUE
-        ORDER BY clan_id, collected_at DESC
-    """, (period, limit))
-    
-    rows = cursor.fetchall()
+    try:
+        month_range(period)
+    except ValueError:
+        return {"error": f"无效的月份: {period}"}
     
-    clans = []
-    for row in rows:
-        clans.append({
-            "clan_id": row[0],
-            "clan_name": row[1],
-            "ranking": row[2]
-        })
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=TimedCursor)
     
-    # Sort by ranking
-    clans.sort(key=lambda x: x['ranking'])
+        # Get top clans by ranking from the monthly summary
+        cursor.execute("""
+            SELECT clan_id, clan_name, current_period_ranking
+            FROM clan_period_summary
+            WHERE period = %s
+              AND current_period_ranking > 0
+              AND current_period_ranking <= %s
+              AND exist = TRUE
+            ORDER BY current_period_ranking
+        """, (period, limit))
+    
+        clans = []
+        for row in cursor.fetchall():
+            clans.append({
+                "clan_id": row[0],
+                "clan_name": row[1],
+                "ranking": row[2]
+            })
     
-    return {
-        "period": period,
-        "clans": clans
-    }
+        return {
+            "period": period,
+            "clans": clans
+        }
+
+
+def search_clans_by_name(name_pattern: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """
+    模糊搜索公会名（含曾用名），按相似度、当期排名排列
+    
+    Args:
+        name_pattern: 公会名模糊匹配
+        limit: 返回数量
+        offset: 分页偏移
+        
+    Returns:
+        [{clan_id, clan_name, matched_name, ranking, member_num}, ...]
+    """
+    if not name_pattern:
+        return []
+    
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=TimedCursor)
+        cursor.execute("""
+            WITH matches AS (
+                SELECT DISTINCT ON (clan_id)
+                    clan_id,
+                    name as matched_name,
+                    similarity(name, %(q)s) as score
+                FROM clan_aliases
+                WHERE name ILIKE %(like)s
+                ORDER BY clan_id, score DESC
+            )
+            SELECT m.clan_id, l.clan_name, m.matched_name, l.current_period_ranking, l.member_num
+            FROM matches m
+            JOIN clan_latest l ON l.clan_id = m.clan_id
+            WHERE l.exist = TRUE
+            ORDER BY m.score DESC, NULLIF(l.current_period_ranking, 0) ASC NULLS LAST, m.clan_id
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, {'q': name_pattern, 'like': like_pattern(name_pattern), 'limit': limit, 'offset': offset})
+        rows = cursor.fetchall()
+    
+    return [
+        {
+            'clan_id': row[0],
+            'clan_name': row[1],
+            'matched_name': row[2],
+            'ranking': row[3],
+            'member_num': row[4]
+        }
+        for row in rows
+    ]
+
+
+def get_profile_dates() -> List[str]:
+    """
+    获取有玩家档案数据的日期列表
+    
+    Returns:
+        ["2024-12-31", "2024-12-30", ...] 按时间倒序
+    """
+    return get_run_dates(PROFILE_TASKS)
+
+
+PROFILE_SORTS = {
+    'total_power': 'COALESCE(p.total_power, 0)',
+    'team_level': 'COALESCE(p.team_level, 0)',
+    'unit_num': 'COALESCE(p.unit_num, 0)',
+    'arena_rank': 'COALESCE(p.arena_rank, 0)',
+    'grand_arena_rank': 'COALESCE(p.grand_arena_rank, 0)',
+    'knight_exp': 'COALESCE(p.princess_knight_rank_total_exp, 0)',
+    'viewer_id': 'p.viewer_id',
+}
+DEFAULT_PROFILE_SORT = '-total_power'
+PROFILE_FIELDS = [
+    'viewer_id', 'user_name', 'join_clan_name', 'team_level', 'unit_num', 'total_power',
+    'knight_level', 'talent_done', 'arena_rank', 'grand_arena_rank'
+]
 
 
-def get_top_clan_profiles(date: str = None, clan_id: int = None) -> Dict:
+def get_top_clan_profiles(date: str = None, clan_id: int = None, limit: int = MAX_PAGE_SIZE,
+                          sort: str = None, cursor: str = None, fields: str = None) -> Dict:
     """
-    Get player profiles for top 30 clans (synced daily by player_profile_sync).
+    Get player profiles for top 30 clans (synced daily by player_profile_sync), keyset paginated.
     
     Args:
         date: Date (YYYY-MM-DD), defaults to latest
         clan_id: Clan ID to filter by
+        limit: Page size (at most MAX_PAGE_SIZE; top 30 clans fit in one page)
+        sort: Sort key (PROFILE_SORTS), '-' prefix for descending, defaults to DEFAULT_PROFILE_SORT
+        cursor: next_cursor of the previous page
+        fields: Comma separated fields to return (PROFILE_FIELDS), defaults to all
         
     Returns:
-        {date, talent_total, players: [{viewer_id, user_name, join_clan_name, ...}]}
+        {date, talent_total, sort, count, clan_id, clan_name, players: [{viewer_id, user_name, ...}], next_cursor}
+        count is the total number of players for the date (all pages)
     """
     import os
     talent_total = int(os.getenv('TALENT_QUEST_TOTAL', 250))
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Determine date
+
+    limit = page_size(limit, MAX_PAGE_SIZE)
+    sort = sort or DEFAULT_PROFILE_SORT
+    try:
+        keys = parse_sort(sort, PROFILE_SORTS, DEFAULT_PROFILE_SORT, [('p.viewer_id', False)])
+        columns = parse_fields(fields, PROFILE_FIELDS, required=('viewer_id',))
+    except ValueError as e:
+        return {"error": str(e)}
+    
+    # Determine date from the collection run catalog
     if not date:
-        cursor.execute("""
-            SELECT DISTINCT to_char(collected_at, 'YYYY-MM-DD') as date
-            FROM player_profile_snapshots
-            ORDER BY date DESC
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if not row:
+        dates = get_run_dates(PROFILE_TASKS)
+        if not dates:
             return {"error": "暂无数据"}
-        date = row[0]
-    
-    # Get players for the date
+        date = dates[0]
+
+    # The cursor is bound to sort, date and clan filter
+    scope = cursor_scope(sort, date, clan_id)
+    try:
+        after, offset = decode_cursor(cursor, len(keys), scope)
+    except ValueError as e:
+        return {"error": str(e)}
+    
+    # Half-open range covering that day's runs, prunes to one partition
+    try:
+        day_start, day_end = date_range(PROFILE_TASKS, date)
+    except ValueError:
+        return {"error": f"无效的日期: {date}"}
+
+    # JSONB talent data and knight exp are only read when their derived fields are requested
+    need_talent = 'talent_done' in columns
+    need_knight = 'knight_level' in columns
+    params = [day_start, day_end]
+    clan_filter = ""
     if clan_id:
-        cursor.execute("""
-            SELECT DISTINCT ON (viewer_id)
-                viewer_id,
-                user_name,
-                join_clan_name,
-                team_level,
-                unit_num,
-                total_power,
-                princess_knight_rank_total_exp,
-                talent_quest_clear,
-                arena_rank,
-                grand_arena_rank
-            FROM player_profile_snapshots
-            WHERE to_char(collected_at, 'YYYY-MM-DD') = %s
-              AND join_clan_id = %s
-            ORDER BY viewer_id, collected_at DESC
-        """, (date, clan_id))
-    else:
-        cursor.execute("""
-            SELECT DISTINCT ON (viewer_id)
-                viewer_id,
-                user_name,
-                join_clan_name,
-                team_level,
-                unit_num,
-                total_power,
-                princess_knight_rank_total_exp,
-                talent_quest_clear,
-                arena_rank,
-                grand_arena_rank
+        clan_filter = "AND join_clan_id = %s"
+        params.append(clan_id)
+    count_params = list(params)
+    where = ""
+    if after is not None:
+        condition, condition_params = keyset_condition(keys, after)
+        where = f"WHERE {condition}"
+        params.extend(condition_params)
+    params.append(limit + 1)
+    
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=TimedCursor)
+    
+        # Latest profile per player for the date, sorted and paged in SQL
+        cur.execute(f"""
+            SELECT
+                p.viewer_id,
+                p.user_name,
+                p.join_clan_name,
+                p.team_level,
+                p.unit_num,
+                p.total_power,
+                {"p.princess_knight_rank_total_exp" if need_knight else "NULL"},
+                {"p.talent_quest_clear" if need_talent else "NULL"},
+                p.arena_rank,
+                p.grand_arena_rank,
+                {sort_columns(keys)}
+            FROM (
+                SELECT DISTINCT ON (viewer_id) *
+                FROM player_profile_snapshots
+                WHERE collected_at >= %s AND collected_at < %s
+                  {clan_filter}
+                ORDER BY viewer_id, collected_at DESC
+            ) p
+            {where}
+            ORDER BY {order_by(keys)}
+            LIMIT %s
+        """, params)
+        rows, next_cursor = split_page(cur.fetchall(), limit, len(keys), offset, scope)
+
+        # Total number of players for the date (count is the total, not the page length)
+        cur.execute(f"""
+            SELECT COUNT(DISTINCT viewer_id)
             FROM player_profile_snapshots
-            WHERE to_char(collected_at, 'YYYY-MM-DD') = %s
-            ORDER BY viewer_id, collected_at DESC
-        """, (date,))
-    
-    rows = cursor.fetchall()
+            WHERE collected_at >= %s AND collected_at < %s
+              {clan_filter}
+        """, count_params)
+        total = cur.fetchone()[0]
     
     players = []
+    clan_name_result = None
     for row in rows:
         (viewer_id, user_name, clan_name, team_level, unit_num, 
          total_power, knight_exp, talent_data, arena_rank, grand_rank) = row
-        
-        players.append({
+        # 获取公会名（如果指定了 clan_id）
+        if clan_id and clan_name_result is None:
+            clan_name_result = clan_name
+    
+        players.append(project({
             "viewer_id": viewer_id,
             "user_name": user_name,
             "join_clan_name": clan_name,
             "team_level": team_level or 0,
             "unit_num": unit_num or 0,
             "total_power": total_power or 0,
-            "knight_level": _exp_to_knight_level(knight_exp),
-            "talent_done": _count_talent_quest(talent_data),
+            "knight_level": _exp_to_knight_level(knight_exp) if need_knight else None,
+            "talent_done": _count_talent_quest(talent_data) if need_talent else None,
             "arena_rank": arena_rank or 0,
             "grand_arena_rank": grand_rank or 0
-        })
-    
-    # Default sort by total_power descending
-    players.sort(key=lambda x: x['total_power'], reverse=True)
-    
-    # 获取公会名（如果指定了 clan_id）
-    clan_name_result = None
-    if clan_id and players:
-        clan_name_result = players[0].get('join_clan_name')
+        }, columns))
     
     return {
         "date": date,
         "talent_total": talent_total,
-        "count": len(players),
+        "sort": sort,
+        "count": total,
         "clan_id": clan_id,  # 可能为 None
         "clan_name": clan_name_result,  # 可能为 None
-        "players": players
+        "players": players,
+        "next_cursor": next_cursor
     }
+
+
+# 异步版本（供 server.py 中的 async 路由 await）
+get_clan_history_async = to_async(get_clan_history)
+get_clan_history_batch_async = to_async(get_clan_history_batch)
+get_clan_power_ranking_async = to_async(get_clan_power_ranking)
+get_clan_members_async = to_async(get_clan_members)
+get_top_clans_async = to_async(get_top_clans)
+get_top_clan_profiles_async = to_async(get_top_clan_profiles)
+get_profile_dates_async = to_async(get_profile_dates)
+search_clans_by_name_async = to_async(search_clans_by_name)
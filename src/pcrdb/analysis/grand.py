@@ -1,131 +1,169 @@
 """
 PJJC 分析模块
 """
+from datetime import datetime, timedelta
 from typing import Dict, List
 
-from ..db.connection import get_connection
+from ..db.connection import pooled_connection
+from ..db.aio import to_async
+from ..db.slow_queries import TimedCursor
+from ..db.collection_runs import GRAND_TASKS, latest_run_start
+from .paging import (
+    cursor_scope, decode_cursor, encode_cursor, keyset_condition, order_by, page_size, parse_fields, parse_sort, project,
+    sort_columns, split_page
+)
 
 
-def get_winning_ranking(group: int, limit: int = 100) -> List[Dict]:
+# 分场编号上限（0 为全部分场）
+MAX_GRAND_GROUP = 10
+
+# 各分场最新快照的回溯窗口（某分场本次采集失败时仍能取到其上一次快照）
+LATEST_LOOKBACK = timedelta(days=7)
+
+
+WINNING_SORTS = {
+    'winning_number': 'COALESCE(g.winning_number, 0)',
+    'grand_arena_rank': 'COALESCE(g.grand_arena_rank, 2147483647)',
+    'viewer_id': 'g.viewer_id',
+}
+DEFAULT_WINNING_SORT = '-winning_number'
+WINNING_TIEBREAKERS = [(WINNING_SORTS['grand_arena_rank'], False), ('g.viewer_id', False)]
+WINNING_FIELDS = ['rank', 'viewer_id', 'user_name', 'winning_number', 'grand_arena_rank', 'grand_arena_group']
+
+
+def get_winning_ranking(group: int, limit: int = 100, sort: str = None, cursor: str = None,
+                        fields: str = None) -> Dict:
     """
-    获取 PJJC 胜场排名（关联玩家名字）
+    获取 PJJC 胜场排名（关联玩家名字），keyset 分页
     
     Args:
-        group: 分场编号
-        limit: 返回数量
+        group: 分场编号，0 为全部分场
+        limit: 每页数量（最多 MAX_PAGE_SIZE）
+        sort: 排序字段（WINNING_SORTS），'-' 前缀倒序，默认 DEFAULT_WINNING_SORT
+        cursor: 上一页的 next_cursor
+        fields: 逗号分隔的返回字段（WINNING_FIELDS），默认全部
         
     Returns:
-        [{rank, viewer_id, user_name, winning_number, grand_arena_rank}, ...]
+        {group, sort, collected_at, rankings: [{rank, viewer_id, user_name, winning_number, grand_arena_rank,
+         grand_arena_group}, ...], next_cursor}；collected_at 为最近一次采集运行的时间，游标只在同一次运行内有效
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # 获取最新的胜场排名
-    # 注意：grand_rankings 表中没有 user_name，需要关联 player_profile_snapshots 或 player_clan_snapshots
-    # 优先关联 player_profile (更可能包含准确名字)，其次 player_clan
-    
+    limit = page_size(limit, 100)
+    sort = sort or DEFAULT_WINNING_SORT
+    try:
+        keys = parse_sort(sort, WINNING_SORTS, DEFAULT_WINNING_SORT, WINNING_TIEBREAKERS)
+        columns = parse_fields(fields, WINNING_FIELDS, required=('viewer_id',))
+    except ValueError as e:
+        return {"error": str(e)}
 
+    # 以最近一次采集运行为基准限定扫描范围，避免 MAX(collected_at) 扫全表
+    latest = latest_run_start(GRAND_TASKS)
+    since = latest - LATEST_LOOKBACK if latest else datetime(1970, 1, 1)
+    collected_at = latest.isoformat() if latest else None
+    scope = cursor_scope(sort, group, collected_at)
+    try:
+        after, offset = decode_cursor(cursor, len(keys), scope)
+    except ValueError as e:
+        return {"error": str(e)}
     
     if group == 0:
-        # 查询所有分场
-        # 使用全服最近一次采集时间作为基准
-        # 或者每个分场各自取最新？考虑到可能不在同一时间更新，最好是取每个分场的最新快照
-        
-        query = """
-        WITH latest_per_group AS (
-            SELECT grand_arena_group, MAX(collected_at) as max_time
-            FROM grand_arena_snapshots
-            GROUP BY grand_arena_group
-        ),
-        latest_grand AS (
-            SELECT DISTINCT ON (viewer_id)
-                viewer_id,
-                winning_number,
-                grand_arena_rank,
-                t.grand_arena_group
-            FROM grand_arena_snapshots t
-            JOIN latest_per_group l ON t.grand_arena_group = l.grand_arena_group 
-                                   AND t.collected_at = l.max_time
-            ORDER BY viewer_id, collected_at DESC
-        ),
-        player_names AS (
-            SELECT DISTINCT ON (viewer_id) viewer_id, user_name
-            FROM player_profile_snapshots
-            ORDER BY viewer_id, collected_at DESC
-        ),
-        clan_names AS (
-            SELECT DISTINCT ON (viewer_id) viewer_id, name as user_name
-            FROM player_clan_snapshots
-            ORDER BY viewer_id, collected_at DESC
-        )
-        SELECT 
-            g.viewer_id,
-            COALESCE(p.user_name, c.user_name, 'Unknown') as user_name,
-            g.winning_number,
-            g.grand_arena_rank,
-            g.grand_arena_group
-        FROM latest_grand g
-        LEFT JOIN player_names p ON g.viewer_id = p.viewer_id
-        LEFT JOIN clan_names c ON g.viewer_id = c.viewer_id
-        ORDER BY g.winning_number DESC, g.grand_arena_rank ASC
-        LIMIT %s
+        # 查询所有分场：每个分场各自取最新快照（各分场可能不在同一时间更新）
+        latest_sql = """
+            WITH latest_per_group AS (
+                SELECT grand_arena_group, MAX(collected_at) as max_time
+                FROM grand_arena_snapshots
+                WHERE collected_at >= %s
+                GROUP BY grand_arena_group
+            ),
+            latest_grand AS (
+                SELECT DISTINCT ON (viewer_id)
+                    viewer_id,
+                    winning_number,
+                    grand_arena_rank,
+                    t.grand_arena_group
+                FROM grand_arena_snapshots t
+                JOIN latest_per_group l ON t.grand_arena_group = l.grand_arena_group 
+                                       AND t.collected_at = l.max_time
+                WHERE t.collected_at >= %s
+                ORDER BY viewer_id, collected_at DESC
+            )
         """
-        params = (limit,)
-    
+        params = [since, since]
     else:
         # 查询单个分场
-        query = """
-        WITH latest_time AS (
-            SELECT MAX(collected_at) as max_time
-            FROM grand_arena_snapshots
-            WHERE grand_arena_group = %s
-        ),
-        latest_grand AS (
-            SELECT DISTINCT ON (viewer_id)
-                viewer_id,
-                winning_number,
-                grand_arena_rank,
-                grand_arena_group
-            FROM grand_arena_snapshots, latest_time
-            WHERE grand_arena_group = %s
-              AND collected_at = latest_time.max_time
-            ORDER BY viewer_id, collected_at DESC
-        ),
-        player_names AS (
-            SELECT DISTINCT ON (viewer_id) viewer_id, user_name
-            FROM player_profile_snapshots
-            ORDER BY viewer_id, collected_at DESC
-        ),
-        clan_names AS (
-            SELECT DISTINCT ON (viewer_id) viewer_id, name as user_name
-            FROM player_clan_snapshots
-            ORDER BY viewer_id, collected_at DESC
-        )
+        latest_sql = """
+            WITH latest_time AS (
+                SELECT MAX(collected_at) as max_time
+                FROM grand_arena_snapshots
+                WHERE grand_arena_group = %s AND collected_at >= %s
+            ),
+            latest_grand AS (
+                SELECT DISTINCT ON (viewer_id)
+                    viewer_id,
+                    winning_number,
+                    grand_arena_rank,
+                    grand_arena_group
+                FROM grand_arena_snapshots, latest_time
+                WHERE grand_arena_group = %s
+                  AND collected_at = latest_time.max_time
+                ORDER BY viewer_id, collected_at DESC
+            )
+        """
+        params = [group, since, group]
+
+    # 玩家名取自 player_latest（各快照写入时维护的最新状态，按主键关联），不需要名字时不关联
+    need_name = 'user_name' in columns
+    where = ""
+    if after is not None:
+        condition, condition_params = keyset_condition(keys, after)
+        where = f"WHERE {condition}"
+        params.extend(condition_params)
+    params.append(limit + 1)
+
+    query = latest_sql + f"""
         SELECT 
             g.viewer_id,
-            COALESCE(p.user_name, c.user_name, 'Unknown') as user_name,
+            {"COALESCE(p.name, 'Unknown')" if need_name else "NULL"} as user_name,
             g.winning_number,
             g.grand_arena_rank,
-            g.grand_arena_group
+            g.grand_arena_group,
+            {sort_columns(keys)}
         FROM latest_grand g
-        LEFT JOIN player_names p ON g.viewer_id = p.viewer_id
-        LEFT JOIN clan_names c ON g.viewer_id = c.viewer_id
-        ORDER BY g.winning_number DESC, g.grand_arena_rank ASC
+        {"LEFT JOIN player_latest p ON g.viewer_id = p.viewer_id" if need_name else ""}
+        {where}
+        ORDER BY {order_by(keys)}
         LIMIT %s
-        """
-        params = (group, group, limit)
+    """
 
-    cursor.execute(query, params)
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=TimedCursor)
+        cur.execute(query, params)
+        rows, next_cursor = split_page(cur.fetchall(), limit, len(keys), offset, scope)
     
-    result = []
-    for i, row in enumerate(cursor.fetchall(), 1):
-        result.append({
+    rankings = []
+    for i, row in enumerate(rows, offset + 1):
+        rankings.append(project({
             'rank': i,
             'viewer_id': row[0],
             'user_name': row[1],
             'winning_number': row[2],
             'grand_arena_rank': row[3],
             'grand_arena_group': row[4]
-        })
+        }, columns))
     
-    return result
+    return {
+        "group": group,
+        "sort": sort,
+        "collected_at": collected_at,
+        "rankings": rankings,
+        "next_cursor": next_cursor
+    }
+
+
+def default_winning_cursor(page: Dict, row: Dict, count: int) -> str:
+    """默认排序下 page 中某一行之后的分页游标（hot_state 从缓存的整页切片时使用）"""
+    return encode_cursor([row['winning_number'] or 0, row['grand_arena_rank'] or 2147483647, row['viewer_id']], count,
+                         cursor_scope(page['sort'], page['group'], page['collected_at']))
+
+
+# 异步版本（供 server.py 中的 async 路由 await）
+get_winning_ranking_async = to_async(get_winning_ranking)
@@ -0,0 +1,148 @@
+"""
+列表接口的 keyset 分页、排序和字段投影
+
+- sort: 排序键名，前缀 '-' 为倒序（如 '-total_power'），排序在 SQL 中完成，并追加唯一键保证顺序稳定
+- cursor: 上一页返回的 next_cursor（最后一行的排序键值 + 已返回行数 + 查询范围），下一页用
+  WHERE (排序键) 在其之后 继续读取，不使用 OFFSET；查询范围（排序、期间等，见 cursor_scope）
+  与本次请求不一致的游标会被拒绝，不会静默返回错误的行
+- fields: 逗号分隔的字段名，只返回（并尽量只查询）需要的列
+
+每次查询 limit + 1 行判断是否还有下一页，单次请求的内存和耗时只与页大小有关。
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+MAX_PAGE_SIZE = 1000
+
+# (SQL 表达式, 是否倒序)
+SortKeys = List[Tuple[str, bool]]
+
+
+def page_size(limit: Optional[int], default: int) -> int:
+    """页大小限制在 [1, MAX_PAGE_SIZE]"""
+    if limit is None or limit <= 0:
+        limit = default
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_sort(sort: Optional[str], allowed: Dict[str, str], default: str,
+               tiebreakers: SortKeys) -> SortKeys:
+    """
+    解析排序参数
+
+    Args:
+        sort: 'name' 正序 / '-name' 倒序，None 为 default
+        allowed: {排序键名: SQL 表达式}（表达式应不为 NULL，可用 COALESCE）
+        default: 默认排序
+        tiebreakers: 追加的次要排序键，最后一个须为唯一键，保证排序全序
+
+    Raises:
+        ValueError: 未知的排序键
+    """
+    sort = sort or default
+    desc = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in allowed:
+        raise ValueError(f"不支持的排序字段: {name}（可选: {', '.join(allowed)}）")
+    keys = [(allowed[name], desc)]
+    keys.extend(k for k in tiebreakers if k[0] != allowed[name])
+    return keys
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str], required: Sequence[str] = ()) -> List[str]:
+    """
+    解析字段投影，None 为全部字段；required 中的字段总是返回
+
+    Raises:
+        ValueError: 未知的字段
+    """
+    if not fields:
+        return list(allowed)
+    requested = {f.strip() for f in fields.split(',') if f.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(sorted(unknown))}")
+    requested.update(required)
+    return [f for f in allowed if f in requested]
+
+
+def cursor_scope(sort: str, *context: Any) -> str:
+    """游标的查询范围：排序方式 + 影响结果集的上下文（期间、分场、筛选条件等）"""
+    return '|'.join(str(part) for part in (sort,) + context)
+
+
+def encode_cursor(values: Sequence[Any], count: int, scope: str = '') -> str:
+    raw = json.dumps({'s': scope, 'k': list(values), 'n': count}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], key_count: int, scope: str = '') -> Tuple[Optional[List[Any]], int]:
+    """
+    解析分页游标
+
+    Args:
+        scope: 本次请求的查询范围（cursor_scope），须与生成游标时一致
+
+    Returns:
+        (排序键值, 之前已返回的行数)；cursor 为空时返回 (None, 0)
+
+    Raises:
+        ValueError: 游标无效，或与本次请求的排序 / 期间不匹配
+    """
+    if not cursor:
+        return None, 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, count, cursor_scope_ = data['k'], int(data['n']), data.get('s', '')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("无效的分页游标")
+    if cursor_scope_ != scope:
+        raise ValueError("分页游标与当前的排序或数据期间不匹配，请从第一页重新查询")
+    if not isinstance(values, list) or len(values) != key_count:
+        raise ValueError("分页游标与排序方式不匹配")
+    return values, count
+
+
+def keyset_condition(keys: SortKeys, values: Sequence[Any]) -> Tuple[str, List[Any]]:
+    """
+    生成 "排在 values 之后" 的条件（支持各键方向不同）
+
+    (a DESC, b ASC) → (a < %s OR (a = %s AND b > %s))
+    """
+    expr, desc = keys[0]
+    op = '<' if desc else '>'
+    if len(keys) == 1:
+        return f"{expr} {op} %s", [values[0]]
+    rest_sql, rest_params = keyset_condition(keys[1:], values[1:])
+    return f"({expr} {op} %s OR ({expr} = %s AND {rest_sql}))", [values[0], values[0]] + rest_params
+
+
+def order_by(keys: SortKeys) -> str:
+    return ', '.join(f"{expr} {'DESC' if desc else 'ASC'}" for expr, desc in keys)
+
+
+def sort_columns(keys: SortKeys) -> str:
+    """把排序键值作为额外列查询出来（_k0, _k1, ...），用于生成下一页游标"""
+    return ', '.join(f"{expr} AS _k{i}" for i, (expr, _) in enumerate(keys))
+
+
+def split_page(rows: list, limit: int, key_count: int, offset: int, scope: str = '') -> Tuple[list, Optional[str]]:
+    """
+    截取一页并生成下一页游标（rows 按 limit + 1 查询，末尾 key_count 列为排序键值，scope 同 decode_cursor）
+
+    Returns:
+        (去掉排序键列的行, next_cursor 或 None)
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1][-key_count:], offset + len(rows), scope)
+    return [row[:-key_count] for row in rows], next_cursor
+
+
+def project(record: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    return {f: record[f] for f in fields}
@@ -3,7 +3,15 @@
 """
 from typing import Dict, List
 
-from ..db.connection import get_connection
+from ..db.connection import pooled_connection
+from ..db.aio import to_async
+from ..db.slow_queries import TimedCursor
+from ..db.collection_runs import CLAN_TASKS, get_periods, period_range
+from ..db.aliases import like_pattern
+from .paging import (
+    cursor_scope, decode_cursor, keyset_condition, order_by, page_size, parse_fields, parse_sort, project, sort_columns,
+    split_page
+)
 
 
 def get_available_periods() -> List[str]:
@@ -13,86 +21,70 @@ def get_available_periods() -> List[str]:
     Returns:
         ["2024-12", "2024-11", ...] 按时间倒序
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT DISTINCT to_char(collected_at, 'YYYY-MM') as period
-        FROM player_clan_snapshots
-        ORDER BY period DESC
-    """)
-    
-    rows = cursor.fetchall()
-    return [row[0] for row in rows]
+    return get_periods(CLAN_TASKS)
 
 
-def get_player_clan_history(viewer_id: int) -> Dict:
+MAX_BATCH_IDS = 100
+
+
+def _fetch_player_histories(cursor, viewer_ids: List[int]) -> Dict[int, Dict]:
     """
-    获取玩家的公会归属历史 + 当期公会排名
-    
-    Args:
-        viewer_id: 玩家 ID
-        
+    按 viewer_id 批量读取公会归属历史
+
     Returns:
-        {viewer_id, user_name, history: [{period, clan_id, clan_name, clan_ranking, level, total_power}, ...]}
+        {viewer_id: {viewer_id, user_name, history: [...]}}，只包含有数据的玩家
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # 获取玩家公会历史，按月分组
+    # 获取玩家公会历史，按玩家、月分组；公会排名用 LATERAL 一次性解析（避免逐月查询）
+    # 排名规则：取该快照之后公会的下一期 grade_rank，没有则取公会最近的 current_period_ranking
     cursor.execute("""
-        SELECT DISTINCT ON (to_char(collected_at, 'YYYY-MM'))
-            to_char(collected_at, 'YYYY-MM') as period,
-            join_clan_id,
-            join_clan_name,
-            level,
-            total_power,
-            collected_at,
-            name
-        FROM player_clan_snapshots
-        WHERE viewer_id = %s AND join_clan_id IS NOT NULL
-        ORDER BY to_char(collected_at, 'YYYY-MM') ASC, collected_at DESC
-    """, (viewer_id,))
-    
-    player_history = cursor.fetchall()
-    
-    if not player_history:
-        return {"viewer_id": viewer_id, "user_name": None, "history": []}
-    
-    # 获取最新的玩家名
-    latest_name = player_history[-1][6] if player_history else None
-    
-    history = []
-    for row in player_history:
-        period, clan_id, clan_name, level, total_power, collected_at, name = row
-        
-        # 获取该时期公会的排名（取最接近的快照的下一期 grade_rank）
-        cursor.execute("""
-            SELECT grade_rank, current_period_ranking
-            FROM clan_snapshots
-            WHERE clan_id = %s 
-              AND collected_at > %s
-            ORDER BY collected_at ASC
+        WITH history AS (
+            SELECT DISTINCT ON (viewer_id, to_char(collected_at, 'YYYY-MM'))
+                viewer_id,
+                to_char(collected_at, 'YYYY-MM') as period,
+                join_clan_id,
+                join_clan_name,
+                level,
+                total_power,
+                collected_at,
+                name
+            FROM player_clan_snapshots
+            WHERE viewer_id = ANY(%s) AND join_clan_id IS NOT NULL
+            ORDER BY viewer_id, to_char(collected_at, 'YYYY-MM') ASC, collected_at DESC
+        )
+        SELECT
+            h.viewer_id,
+            h.period,
+            h.join_clan_id,
+            h.join_clan_name,
+            h.level,
+            h.total_power,
+            h.name,
+            COALESCE(NULLIF(nxt.grade_rank, 0), cur.current_period_ranking) as clan_ranking
+        FROM history h
+        LEFT JOIN LATERAL (
+            SELECT grade_rank
+            FROM clan_snapshots c
+            WHERE c.clan_id = h.join_clan_id
+              AND c.collected_at > h.collected_at
+            ORDER BY c.collected_at ASC
             LIMIT 1
-        """, (clan_id, collected_at))
-        
-        ranking_row = cursor.fetchone()
-        if ranking_row and ranking_row[0]:
-            # 有下一期，用 grade_rank
-            clan_ranking = ranking_row[0]
-        else:
-            # 没有下一期，用最近的 current_period_ranking
-            cursor.execute("""
-                SELECT current_period_ranking
-                FROM clan_snapshots
-                WHERE clan_id = %s
-                ORDER BY collected_at DESC
-                LIMIT 1
-            """, (clan_id,))
-            r = cursor.fetchone()
-            clan_ranking = r[0] if r else None
-        
-        history.append({
+        ) nxt ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT current_period_ranking
+            FROM clan_snapshots c
+            WHERE c.clan_id = h.join_clan_id
+            ORDER BY c.collected_at DESC
+            LIMIT 1
+        ) cur ON TRUE
+        ORDER BY h.viewer_id, h.period DESC
+    """, (list(viewer_ids),))
+
+    players: Dict[int, Dict] = {}
+    for row in cursor.fetchall():
+        viewer_id, period, clan_id, clan_name, level, total_power, name, clan_ranking = row
+        # 按倒序排列（最新的在前面），第一条即最新的玩家名
+        player = players.setdefault(viewer_id, {'viewer_id': viewer_id, 'user_name': name, 'history': []})
+        player['history'].append({
             'period': period,
             'clan_id': clan_id,
             'clan_name': clan_name,
@@ -101,75 +93,170 @@ def get_player_clan_history(viewer_id: int) -> Dict:
             'total_power': total_power,
             'player_name': name
         })
+    return players
+
+
+def get_player_clan_history(viewer_id: int) -> Dict:
+    """
+    获取玩家的公会归属历史 + 当期公会排名
     
-    # 按倒序排列（最新的在前面）
-    history.reverse()
+    Args:
+        viewer_id: 玩家 ID
+        
+    Returns:
+        {viewer_id, user_name, history: [{period, clan_id, clan_name, clan_ranking, level, total_power}, ...]}
+    """
+    with pooled_connection() as conn:
+        players = _fetch_player_histories(conn.cursor(cursor_factory=TimedCursor), [viewer_id])
+
+    return players.get(viewer_id, {"viewer_id": viewer_id, "user_name": None, "history": []})
+
+
+def get_player_clan_history_batch(viewer_ids: List[int]) -> Dict:
+    """
+    批量获取玩家公会归属历史（一次查询）
+    
+    Args:
+        viewer_ids: 玩家 ID 列表（最多 MAX_BATCH_IDS 个）
+        
+    Returns:
+        {players: {viewer_id: {viewer_id, user_name, history: [...]}}}，没有数据的玩家 history 为空
+    """
+    viewer_ids = sorted(set(viewer_ids))
+    if len(viewer_ids) > MAX_BATCH_IDS:
+        return {"error": f"一次最多查询 {MAX_BATCH_IDS} 个玩家"}
+
+    with pooled_connection() as conn:
+        found = _fetch_player_histories(conn.cursor(cursor_factory=TimedCursor), viewer_ids)
 
-    return {
-        'viewer_id': viewer_id,
-        'user_name': latest_name,
-        'history': history
+    players = {
+        vid: found.get(vid, {"viewer_id": vid, "user_name": None, "history": []})
+        for vid in viewer_ids
     }
+    return {"players": players}
+
+
+PLAYER_SEARCH_SORTS = {
+    'relevance': 'm.score',
+    'total_power': 'COALESCE(x.total_power, 0)',
+    'level': 'COALESCE(x.level, 0)',
+    'viewer_id': 'm.viewer_id',
+}
+DEFAULT_PLAYER_SEARCH_SORT = '-relevance'
+PLAYER_SEARCH_TIEBREAKERS = [(PLAYER_SEARCH_SORTS['total_power'], True), ('m.viewer_id', False)]
+PLAYER_SEARCH_FIELDS = ['viewer_id', 'name', 'matched_name', 'level', 'total_power', 'clan_name']
 
 
-def search_players_by_name(name_pattern: str, period: str = None, limit: int = 50) -> List[Dict]:
+def search_players_by_name(name_pattern: str, period: str = None, limit: int = 50, sort: str = None,
+                           cursor: str = None, fields: str = None) -> Dict:
     """
-    模糊搜索玩家名，按战力倒序排列
+    模糊搜索玩家名（含曾用名），默认按相似度、战力倒序排列，keyset 分页
     
     Args:
         name_pattern: 玩家名模糊匹配
-        period: 月份 (YYYY-MM)，None 为最近一期
-        limit: 返回数量
+        period: 月份 (YYYY-MM)，None 为玩家当前状态
+        limit: 每页数量（最多 MAX_PAGE_SIZE）
+        sort: 排序字段（PLAYER_SEARCH_SORTS），'-' 前缀倒序，默认 DEFAULT_PLAYER_SEARCH_SORT
+        cursor: 上一页的 next_cursor
+        fields: 逗号分隔的返回字段（PLAYER_SEARCH_FIELDS），默认全部
     
     Returns:
-        [{viewer_id, name, level, total_power, clan_name}, ...]
+        {players: [{viewer_id, name, matched_name, level, total_power, clan_name}, ...], next_cursor}
+        matched_name 为命中的名字（可能是曾用名）
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    empty = {"players": [], "next_cursor": None}
+    if not name_pattern:
+        return empty
+
+    limit = page_size(limit, 50)
+    sort = sort or DEFAULT_PLAYER_SEARCH_SORT
+    # 游标绑定排序、搜索词和月份
+    scope = cursor_scope(sort, name_pattern, period)
+    try:
+        keys = parse_sort(sort, PLAYER_SEARCH_SORTS, DEFAULT_PLAYER_SEARCH_SORT, PLAYER_SEARCH_TIEBREAKERS)
+        columns = parse_fields(fields, PLAYER_SEARCH_FIELDS, required=('viewer_id',))
+        after, offset = decode_cursor(cursor, len(keys), scope)
+    except ValueError as e:
+        return {"error": str(e)}
     
-    # 如果没有指定 period，获取最近的月份
-    if not period:
-        cursor.execute("""
-            SELECT DISTINCT to_char(collected_at, 'YYYY-MM') as period
-            FROM player_clan_snapshots
-            ORDER BY period DESC
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if not row:
-            return []
-        period = row[0]
+    # 在别名表中匹配（pg_trgm GIN 索引），每个玩家取相似度最高的名字
+    # score 转为 float8，游标中的值才能精确往返（real 与 float8 比较会有精度误差）
+    matches_sql = """
+        WITH matches AS (
+            SELECT DISTINCT ON (viewer_id)
+                viewer_id,
+                name as matched_name,
+                similarity(name, %s)::float8 as score
+            FROM player_aliases
+            WHERE name ILIKE %s
+              {period_filter}
+            ORDER BY viewer_id, score DESC
+        )
+    """
+    params = [name_pattern, like_pattern(name_pattern)]
     
-    # 搜索匹配的玩家，每个玩家只返回该月份最新的一条记录
-    # 使用 DISTINCT ON 去重，按战力倒序排列
-    cursor.execute("""
-        SELECT DISTINCT ON (viewer_id)
-            viewer_id,
-            name,
-            level,
-            total_power,
-            join_clan_name
-        FROM player_clan_snapshots
-        WHERE to_char(collected_at, 'YYYY-MM') = %s
-          AND name ILIKE %s
-        ORDER BY viewer_id, collected_at DESC
-    """, (period, f'%{name_pattern}%'))
+    if period:
+        try:
+            period_start, period_end = period_range(CLAN_TASKS, period)
+        except ValueError:
+            return empty
+        # 该名字在该月出现过；玩家信息取该月最新一条快照
+        params.extend([period_end, period_start, period_start, period_end])
+        query = matches_sql.format(period_filter="AND first_seen < %s AND last_seen >= %s") + """
+            SELECT m.viewer_id, x.name, m.matched_name, x.level, x.total_power, x.join_clan_name, {sort_columns}
+            FROM matches m
+            CROSS JOIN LATERAL (
+                SELECT name, level, total_power, join_clan_name
+                FROM player_clan_snapshots
+                WHERE viewer_id = m.viewer_id
+                  AND collected_at >= %s AND collected_at < %s
+                ORDER BY collected_at DESC
+                LIMIT 1
+            ) x
+            {where}
+            ORDER BY {order_by}
+            LIMIT %s
+        """
+    else:
+        # 玩家当前状态取自 player_latest
+        query = matches_sql.format(period_filter="") + """
+            SELECT m.viewer_id, x.name, m.matched_name, x.level, x.total_power, x.join_clan_name, {sort_columns}
+            FROM matches m
+            JOIN player_latest x ON x.viewer_id = m.viewer_id
+            {where}
+            ORDER BY {order_by}
+            LIMIT %s
+        """
+
+    where = ""
+    if after is not None:
+        condition, condition_params = keyset_condition(keys, after)
+        where = f"WHERE {condition}"
+        params.extend(condition_params)
+    params.append(limit + 1)
+    query = query.format(sort_columns=sort_columns(keys), where=where, order_by=order_by(keys))
     
-    rows = cursor.fetchall()
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=TimedCursor)
+        cur.execute(query, params)
+        rows, next_cursor = split_page(cur.fetchall(), limit, len(keys), offset, scope)
     
-    # 按战力倒序排序
     results = []
     for row in rows:
-        results.append({
+        results.append(project({
             'viewer_id': row[0],
             'name': row[1],
-            'level': row[2],
-            'total_power': row[3],
-            'clan_name': row[4]
-        })
-    
-    # 按战力倒序排列
-    results.sort(key=lambda x: x['total_power'] or 0, reverse=True)
+            'matched_name': row[2],
+            'level': row[3],
+            'total_power': row[4],
+            'clan_name': row[5]
+        }, columns))
     
-    return results[:limit]
+    return {"players": results, "next_cursor": next_cursor}
+
 
+# 异步版本（供 server.py 中的 async 路由 await）
+get_available_periods_async = to_async(get_available_periods)
+get_player_clan_history_async = to_async(get_player_clan_history)
+get_player_clan_history_batch_async = to_async(get_player_clan_history_batch)
+search_players_by_name_async = to_async(search_players_by_name)
@@ -0,0 +1,109 @@
+"""
+API 调用日志缓冲
+请求内只把日志追加到内存环形缓冲区，后台任务每隔 FLUSH_INTERVAL 秒或攒满 FLUSH_ROWS 条时
+批量写入 auth.api_logs，接口耗时不再包含日志写入。
+
+- 缓冲区满时丢弃最旧的记录，数据库不可用时丢弃整批记录，均计入 dropped
+- 服务关闭时先写完缓冲区再关闭连接池
+"""
+import asyncio
+import json
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from psycopg2.extras import execute_values
+
+from .db.aio import run_db
+from .db.connection import pooled_cursor
+
+
+CAPACITY = 10000
+FLUSH_ROWS = 500
+FLUSH_INTERVAL = 1.0
+
+
+def _insert_rows(rows: list):
+    with pooled_cursor(commit=True) as cursor:
+        execute_values(
+            cursor,
+            "INSERT INTO auth.api_logs (user_id, endpoint, query_params, created_at) VALUES %s",
+            rows,
+            page_size=len(rows)
+        )
+
+
+class ApiLogBuffer:
+    """内存环形缓冲区 + 后台批量写入"""
+
+    def __init__(self, capacity: int = CAPACITY, flush_rows: int = FLUSH_ROWS,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque(maxlen=capacity)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, user_id: int, endpoint: str, query_params: Optional[Dict] = None):
+        """追加一条日志（在事件循环中调用，不阻塞）"""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((
+            user_id,
+            endpoint,
+            json.dumps(query_params) if query_params else None,
+            datetime.now(timezone.utc)
+        ))
+        if self._wake is not None and len(self._buffer) >= self.flush_rows:
+            self._wake.set()
+
+    async def flush(self):
+        """写入缓冲区中的全部记录"""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.flush_rows))]
+            try:
+                await run_db(_insert_rows, batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"[api_log] 写入 {len(batch)} 条调用日志失败，已丢弃: {e}")
+                return
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        """启动后台写入任务（需在事件循环中调用）"""
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写完剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wake = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+
+# 全局实例
+api_log_buffer = ApiLogBuffer()
@@ -2,7 +2,13 @@
 pcrdb 认证模块
 JWT Token 生成与验证、用户管理
 """
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -11,7 +17,9 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from src.pcrdb.db.connection import create_connection
+from src.pcrdb.db.connection import pooled_connection
+from src.pcrdb.db.aio import run_db, to_async
+from src.pcrdb.api_log import api_log_buffer
 
 # 配置
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "pcrdb_secret_key_change_in_production")
@@ -21,10 +29,66 @@ ACCESS_TOKEN_EXPIRE_DAYS = 30
 # Bearer token 提取
 security = HTTPBearer(auto_error=False)
 
-
+# 已认证用户缓存（token → 用户），用户状态/密码变更时失效，跨进程的变更最多延迟 TTL 秒生效
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+
+
+class UserCache:
+    """LRU + TTL 用户缓存，按 token 查找，按用户 id 失效"""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: dict, token_exp: Optional[float] = None):
+        """缓存用户，过期时间不晚于 token 本身的 exp"""
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._entries[token] = (user, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """移除该用户的全部缓存项（状态、密码、角色变更后调用）"""
+        with self._lock:
+            for token in [t for t, (u, _) in self._entries.items() if u["id"] == user_id]:
+                del self._entries[token]
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache()
+
+
+@contextmanager
 def get_auth_db():
-    """获取认证数据库连接"""
-    return create_connection(cursor_factory=RealDictCursor)
+    """获取认证数据库连接（连接池），游标请使用 RealDictCursor"""
+    with pooled_connection() as conn:
+        yield conn
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -37,6 +101,73 @@ def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
+# bcrypt 每次约 100-300ms CPU，放在独立线程池执行（bcrypt 计算时释放 GIL），
+# 不占用事件循环和数据库线程池；排队超过上限时直接返回 503，避免登录洪峰拖慢其他接口
+HASH_WORKERS = int(os.getenv("PCRDB_HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("PCRDB_HASH_QUEUE_LIMIT", "16"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='pcrdb-bcrypt')
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+
+class LatencyStats:
+    """耗时统计（次数 / 平均 / 最大 / 拒绝数）"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rejected = 0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0,
+            "max_ms": round(self.max * 1000, 1),
+            "rejected": self.rejected,
+        }
+
+
+# 密码哈希（含排队）耗时、登录接口总耗时，与其他 API 分开统计
+hash_latency = LatencyStats()
+login_latency = LatencyStats()
+
+
+async def run_hash(func, *args):
+    """在 bcrypt 线程池中执行，队列已满时抛出 503"""
+    if not _hash_slots.acquire(blocking=False):
+        hash_latency.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_slots.release()
+        hash_latency.record(time.perf_counter() - start)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_hash(verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_hash(hash_password, password)
+
+
+def shutdown_hash_executor():
+    """停止 bcrypt 线程池（服务关闭时调用）"""
+    _hash_executor.shutdown(wait=True)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建 JWT token"""
     to_encode = data.copy()
@@ -47,32 +178,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def get_user_by_username(username: str) -> Optional[dict]:
     """通过用户名查询用户"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("SELECT * FROM auth.users WHERE username = %s", (username,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 def get_user_by_qq(qq_number: str) -> Optional[dict]:
     """通过 QQ 号查询用户"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("SELECT * FROM auth.users WHERE qq_number = %s", (qq_number,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
-def create_user(username: str, password: str, qq_number: str) -> dict:
-    """创建新用户"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
-        password_hash = hash_password(password)
+def insert_user(username: str, password_hash: str, qq_number: str) -> dict:
+    """写入新用户（密码已哈希）"""
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         # 检查是否是第一个用户
         cursor.execute("SELECT COUNT(*) as count FROM auth.users")
@@ -92,18 +215,32 @@ def create_user(username: str, password: str, qq_number: str) -> dict:
         )
         conn.commit()
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
-def authenticate_user(login_id: str, password: str) -> Optional[dict]:
-    """验证用户登录（支持用户名或 QQ 号）"""
+def create_user(username: str, password: str, qq_number: str) -> dict:
+    """创建新用户"""
+    return insert_user(username, hash_password(password), qq_number)
+
+
+async def create_user_async(username: str, password: str, qq_number: str) -> dict:
+    """创建新用户（哈希在 bcrypt 线程池，写库在数据库线程池）"""
+    password_hash = await hash_password_async(password)
+    return await run_db(insert_user, username, password_hash, qq_number)
+
+
+def find_login_user(login_id: str) -> Optional[dict]:
+    """按用户名或 QQ 号查找登录用户"""
     # 先尝试用户名
     user = get_user_by_username(login_id)
     # 再尝试 QQ 号
     if not user:
         user = get_user_by_qq(login_id)
-    
+    return user
+
+
+def authenticate_user(login_id: str, password: str) -> Optional[dict]:
+    """验证用户登录（支持用户名或 QQ 号）"""
+    user = find_login_user(login_id)
     if not user:
         return None
     if not verify_password(password, user["password_hash"]):
@@ -111,20 +248,39 @@ def authenticate_user(login_id: str, password: str) -> Optional[dict]:
     return user
 
 
-def update_password(user_id: int, new_password: str) -> bool:
-    """更新用户密码"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
-        password_hash = hash_password(new_password)
+async def authenticate_user_async(login_id: str, password: str) -> Optional[dict]:
+    """验证用户登录（查库在数据库线程池，校验密码在 bcrypt 线程池）"""
+    user = await run_db(find_login_user, login_id)
+    if not user:
+        return None
+    if not await verify_password_async(password, user["password_hash"]):
+        return None
+    return user
+
+
+def set_password_hash(user_id: int, password_hash: str) -> bool:
+    """写入新的密码哈希"""
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute(
             "UPDATE auth.users SET password_hash = %s WHERE id = %s",
             (password_hash, user_id)
         )
         conn.commit()
-        return cursor.rowcount > 0
-    finally:
-        conn.close()
+        updated = cursor.rowcount > 0
+    user_cache.invalidate(user_id)
+    return updated
+
+
+def update_password(user_id: int, new_password: str) -> bool:
+    """更新用户密码"""
+    return set_password_hash(user_id, hash_password(new_password))
+
+
+async def update_password_async(user_id: int, new_password: str) -> bool:
+    """更新用户密码（哈希在 bcrypt 线程池，写库在数据库线程池）"""
+    password_hash = await hash_password_async(new_password)
+    return await run_db(set_password_hash, user_id, password_hash)
 
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
@@ -138,18 +294,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if credentials is None:
         raise credentials_exception
     
+    token = credentials.credentials
+    user = user_cache.get(token)
+    if user is not None:
+        return user
+    
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_username(username)
+    user = await run_db(get_user_by_username, username)
     if user is None:
         raise credentials_exception
     
+    user_cache.put(token, user, payload.get("exp"))
     return user
 
 
@@ -171,47 +333,32 @@ async def get_current_admin_user(current_user: dict = Depends(get_current_active
 
 def get_all_users() -> list:
     """获取所有用户列表（管理员用）"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("SELECT id, username, qq_number, role, status, created_at FROM auth.users ORDER BY created_at DESC")
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 def approve_user_status(user_id: int) -> bool:
     """批准用户（设为 active）"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("UPDATE auth.users SET status = 'active' WHERE id = %s", (user_id,))
         conn.commit()
-        return cursor.rowcount > 0
-    finally:
-        conn.close()
+        updated = cursor.rowcount > 0
+    user_cache.invalidate(user_id)
+    return updated
 
 
 def log_api_call(user_id: int, endpoint: str, query_params: dict = None):
-    """记录 API 调用日志"""
-    import json
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO auth.api_logs (user_id, endpoint, query_params) VALUES (%s, %s, %s)",
-            (user_id, endpoint, json.dumps(query_params) if query_params else None)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    """记录 API 调用日志（写入内存缓冲区，由后台任务批量入库，见 api_log.py）"""
+    api_log_buffer.record(user_id, endpoint, query_params)
 
 
 def get_user_api_stats() -> list:
     """获取所有用户的 API 调用统计"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT 
                 u.id,
@@ -225,15 +372,12 @@ def get_user_api_stats() -> list:
             ORDER BY total_calls DESC
         """)
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 def get_user_api_details(user_id: int, limit: int = 50) -> list:
     """获取指定用户的 API 调用详情"""
-    conn = get_auth_db()
-    try:
-        cursor = conn.cursor()
+    with get_auth_db() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT endpoint, query_params, created_at
             FROM auth.api_logs
@@ -242,5 +386,12 @@ def get_user_api_details(user_id: int, limit: int = 50) -> list:
             LIMIT %s
         """, (user_id, limit))
         return cursor.fetchall()
-    finally:
-        conn.close()
+
+
+# 异步版本（供 server.py 中的 async 路由 await）
+get_user_by_username_async = to_async(get_user_by_username)
+get_user_by_qq_async = to_async(get_user_by_qq)
+get_all_users_async = to_async(get_all_users)
+approve_user_status_async = to_async(approve_user_status)
+get_user_api_stats_async = to_async(get_user_api_stats)
+get_user_api_details_async = to_async(get_user_api_details)
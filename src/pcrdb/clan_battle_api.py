@@ -0,0 +1,122 @@
+"""
+会战 API 上游客户端
+/proxy/* 接口共用一个 httpx.AsyncClient（连接池复用、限制并发和超时），并缓存上游响应：
+- 会战时间点 / 历史月份列表一天变化一次，长 TTL 缓存
+- search / scoreline 按请求体短 TTL 缓存，相同请求并发到达时只请求上游一次（single-flight）
+
+测试时可把 base_url 指向本地桩服务，或传入 httpx.MockTransport。
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Awaitable, Dict, Optional, Tuple
+
+import httpx
+
+
+TIME_LIST_TTL = 600
+SEARCH_TTL = 30
+MAX_ENTRIES = 512
+
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30)
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+
+class UpstreamError(Exception):
+    """上游返回非 2xx 或响应不是 JSON"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ClanBattleClient:
+    """共享上游客户端 + TTL 缓存 + single-flight"""
+
+    def __init__(self, base_url: str, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_entries: int = MAX_ENTRIES):
+        self.base_url = base_url
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.max_entries = max_entries
+        self._cache: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, limits=LIMITS, timeout=TIMEOUT, transport=self._transport
+            )
+        return self._client
+
+    async def _fetch(self, method: str, path: str, body: Any = None) -> Any:
+        resp = await self.client.request(method, path, json=body)
+        if resp.status_code >= 400:
+            raise UpstreamError(resp.status_code, f"上游返回 {resp.status_code}")
+        try:
+            return resp.json()
+        except ValueError:
+            raise UpstreamError(502, "上游响应不是 JSON")
+
+    async def _cached(self, key: str, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        # 上游请求放在独立任务中：发起者断开不会取消其他等待者共享的请求
+        pending = self._inflight.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._fetch_and_store(key, ttl, fetch))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda task: self._done(key, task))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(pending)
+
+    async def _fetch_and_store(self, key: str, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self._store(key, ttl, value)
+        return value
+
+    def _done(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def _store(self, key: str, ttl: float, value: Any):
+        now = time.monotonic()
+        self._cache[key] = (now + ttl, value)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_entries:
+            for k in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[k]
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    async def get(self, path: str, ttl: float = TIME_LIST_TTL) -> Any:
+        return await self._cached(f"GET {path}", ttl, lambda: self._fetch("GET", path))
+
+    async def post(self, path: str, body: Any, ttl: float = SEARCH_TTL) -> Any:
+        key = f"POST {path} {json.dumps(body, sort_keys=True, ensure_ascii=False)}"
+        return await self._cached(key, ttl, lambda: self._fetch("POST", path, body))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -5,6 +5,10 @@ Provides PostgreSQL connection management and helper functions
 from .connection import (
     get_connection,
     get_cursor,
+    get_pool,
+    pooled_connection,
+    pooled_cursor,
+    close_pool,
     get_config,
     get_accounts,
     close_connection,
@@ -13,6 +17,10 @@ from .connection import (
 __all__ = [
     'get_connection',
     'get_cursor', 
+    'get_pool',
+    'pooled_connection',
+    'pooled_cursor',
+    'close_pool',
     'get_config',
     'get_accounts',
     'close_connection',
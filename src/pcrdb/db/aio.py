@@ -0,0 +1,113 @@
+"""
+Async Database Access
+Runs blocking psycopg2 calls on a dedicated thread pool so FastAPI
+endpoints can await them without stalling the uvicorn event loop
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .connection import get_config
+
+
+# Module-level executor (sized to the connection pool)
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Get the DB thread pool (created on first use)
+
+    One worker per pooled connection, so concurrency scales with PCRDB_POOL_MAX.
+    The pool is shared with other borrowers (the hot_state listener refresh,
+    the slow-query EXPLAIN thread and, in single mode, the scheduler's task
+    threads), so a worker can still wait up to PCRDB_POOL_TIMEOUT for a
+    connection while those hold one.
+    """
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_config()['pool_max'],
+                thread_name_prefix='pcrdb-db'
+            )
+    return _executor
+
+
+class DbTimer:
+    """Accumulates time spent inside run_db calls for one request (see use_db_timer)"""
+    __slots__ = ('seconds', 'calls')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+
+_db_timer: contextvars.ContextVar[Optional[DbTimer]] = contextvars.ContextVar('pcrdb_db_timer', default=None)
+
+
+def use_db_timer() -> DbTimer:
+    """Start accounting DB time for the current context (metrics middleware)"""
+    timer = DbTimer()
+    _db_timer.set(timer)
+    return timer
+
+
+def _timed(timer: DbTimer, call: Callable) -> Any:
+    start = time.perf_counter()
+    try:
+        return call()
+    finally:
+        # Concurrent run_db calls of one request may overlap, so the sum can exceed wall time
+        timer.seconds += time.perf_counter() - start
+        timer.calls += 1
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """
+    Await a blocking DB function on the DB thread pool
+
+    Context variables are copied into the worker so request-scoped
+    state survives the thread hop. Time spent in the worker is added to
+    the request's DbTimer, if one is active.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    timer = _db_timer.get()
+    if timer is not None:
+        call = functools.partial(_timed, timer, call)
+    return await loop.run_in_executor(get_db_executor(), call)
+
+
+def to_async(func: Callable) -> Callable:
+    """
+    Build an awaitable variant of a blocking DB function
+
+    Usage:
+        get_clan_history_async = to_async(get_clan_history)
+        result = await get_clan_history_async(clan_id=1)
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    wrapper.__name__ = f"{func.__name__}_async"
+    wrapper.__qualname__ = wrapper.__name__
+    return wrapper
+
+
+def shutdown_db_executor(wait: bool = True):
+    """Stop the DB thread pool (called on server shutdown)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,86 @@
+"""
+名字别名表 (player_aliases / clan_aliases)
+记录每个玩家/公会用过的所有名字及首次/最后出现时间，带 pg_trgm GIN 索引，
+名字搜索（含曾用名）直接查询别名表，不再对快照表做 ILIKE 全表扫描。
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extras import execute_values
+
+
+# 快照表 → (别名表, 主键列, 名字列)
+ALIAS_SOURCES = {
+    'clan_snapshots': ('clan_aliases', 'clan_id', 'clan_name'),
+    'player_clan_snapshots': ('player_aliases', 'viewer_id', 'name'),
+    'player_profile_snapshots': ('player_aliases', 'viewer_id', 'user_name'),
+    'grand_arena_snapshots': ('player_aliases', 'viewer_id', 'user_name'),
+}
+
+
+def _upsert_sql(target: str, key: str, source: str) -> str:
+    """生成 upsert 语句，source 为 'VALUES %s' 或 SELECT 子查询"""
+    return f"""
+        INSERT INTO {target} ({key}, name, first_seen, last_seen)
+        {source}
+        ON CONFLICT ({key}, name) DO UPDATE SET
+            first_seen = LEAST({target}.first_seen, EXCLUDED.first_seen),
+            last_seen = GREATEST({target}.last_seen, EXCLUDED.last_seen)
+    """
+
+
+def upsert_aliases(cursor, table: str, records: List[Dict[str, Any]], collected_at: datetime):
+    """
+    用一批快照记录更新别名表（由 insert_snapshots_batch 在同一事务内调用）
+
+    Args:
+        cursor: 快照写入所用游标（调用方负责提交）
+        table: 快照表名
+        records: 快照记录
+        collected_at: 快照时间
+    """
+    source = ALIAS_SOURCES.get(table)
+    if not source:
+        return
+    target, key, name_col = source
+
+    # 同一批次内去重（ON CONFLICT 不能在一条语句中两次更新同一行）
+    rows = {}
+    for record in records:
+        name = record.get(name_col)
+        if name:
+            rows[(record[key], name)] = (record[key], name, collected_at, collected_at)
+    if not rows:
+        return
+
+    # 按 (key, name) 顺序加锁，避免并发采集进程互相死锁
+    execute_values(cursor, _upsert_sql(target, key, 'VALUES %s'), [rows[k] for k in sorted(rows)])
+
+
+def rebuild_aliases(cursor, table: str, relation: Optional[str] = None) -> int:
+    """
+    从一张快照表（或其一个分区）回填别名表
+
+    Args:
+        cursor: 数据库游标
+        table: 快照表名（决定别名表和名字列）
+        relation: 实际扫描的表/分区名，默认同 table
+
+    Returns:
+        upsert 的行数
+    """
+    target, key, name_col = ALIAS_SOURCES[table]
+    source = f"""
+        SELECT {key}, {name_col}, MIN(collected_at), MAX(collected_at)
+        FROM {relation or table}
+        WHERE {name_col} IS NOT NULL AND {name_col} <> ''
+        GROUP BY {key}, {name_col}
+    """
+    cursor.execute(_upsert_sql(target, key, source))
+    return cursor.rowcount
+
+
+def like_pattern(text: str) -> str:
+    """用户输入 → ILIKE 子串匹配模式（转义 % _ \\）"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
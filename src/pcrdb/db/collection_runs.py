@@ -0,0 +1,169 @@
+"""
+采集运行目录 (collection_runs)
+每次任务运行登记一条记录，该次运行写入的所有快照共用同一个 collected_at 并引用 run_id。
+分析查询通过此表确定期间和时间范围，避免在快照表上 to_char(collected_at) 全表扫描。
+只有成功的运行参与期间 / 日期 / 范围的计算：中途失败的运行只有部分数据，不应成为"最新一期"。
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from .connection import pooled_connection
+from .partitions import month_range, day_range
+
+
+# 写入同一组快照表的任务
+CLAN_TASKS = ('clan_sync',)
+PROFILE_TASKS = ('player_profile_sync', 'player_profile_sync_monthly')
+GRAND_TASKS = ('grand_sync',)
+DECK_TASKS = ('arena_deck_sync',)
+
+
+@dataclass
+class CollectionRun:
+    """一次采集运行"""
+    id: int
+    task_name: str
+    period: str
+    collected_at: datetime
+
+
+def start_run(task_name: str) -> CollectionRun:
+    """
+    登记一次新的采集运行
+
+    Returns:
+        CollectionRun，其 collected_at 用作本次运行所有快照的时间戳
+    """
+    collected_at = datetime.now()
+    period = collected_at.strftime('%Y-%m')
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO collection_runs (task_name, period, collected_at, started_at, status)
+            VALUES (%s, %s, %s, NOW(), 'running')
+            RETURNING id
+        """, (task_name, period, collected_at))
+        run_id = cursor.fetchone()[0]
+        conn.commit()
+
+    return CollectionRun(id=run_id, task_name=task_name, period=period, collected_at=collected_at)
+
+
+def finish_run(run_id: int, status: str):
+    """
+    结束采集运行，记录时间范围 [range_start, range_end)
+
+    本次运行的快照 collected_at 均等于 run.collected_at，
+    range_end 取其后 1 秒，形成半开区间。
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE collection_runs
+            SET finished_at = NOW(),
+                status = %s,
+                range_start = collected_at,
+                range_end = collected_at + INTERVAL '1 second'
+            WHERE id = %s
+        """, (status, run_id))
+        conn.commit()
+
+
+def get_periods(tasks: Sequence[str]) -> List[str]:
+    """有成功运行的月份列表（倒序）"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT period
+            FROM collection_runs
+            WHERE task_name = ANY(%s) AND status = 'success'
+            ORDER BY period DESC
+        """, (list(tasks),))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_latest_period(tasks: Sequence[str]) -> Optional[str]:
+    """最近一次成功运行的月份"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT period
+            FROM collection_runs
+            WHERE task_name = ANY(%s) AND status = 'success'
+            ORDER BY collected_at DESC
+            LIMIT 1
+        """, (list(tasks),))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def get_run_dates(tasks: Sequence[str]) -> List[str]:
+    """有成功运行的日期列表 YYYY-MM-DD（倒序）"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT to_char(collected_at, 'YYYY-MM-DD') as date
+            FROM collection_runs
+            WHERE task_name = ANY(%s) AND status = 'success'
+            ORDER BY date DESC
+        """, (list(tasks),))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _runs_range(tasks: Sequence[str], start: datetime, end: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """[start, end) 内所有成功运行覆盖的时间范围"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT MIN(range_start), MAX(range_end)
+            FROM collection_runs
+            WHERE task_name = ANY(%s)
+              AND status = 'success'
+              AND collected_at >= %s AND collected_at < %s
+        """, (list(tasks), start, end))
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    return row[0], row[1]
+
+
+def period_range(tasks: Sequence[str], period: str) -> Tuple[datetime, datetime]:
+    """
+    月份 → 快照查询用的半开时间区间
+
+    优先使用该月采集运行覆盖的范围（每次运行的快照共用一个时间戳，范围很窄），
+    没有运行记录（目录建立前且未回填的历史数据）时退回整月范围。
+
+    Raises:
+        ValueError: period 格式无效
+    """
+    start, end = month_range(period)
+    return _runs_range(tasks, start, end) or (start, end)
+
+
+def date_range(tasks: Sequence[str], day: str) -> Tuple[datetime, datetime]:
+    """
+    日期 → 快照查询用的半开时间区间（规则同 period_range）
+
+    Raises:
+        ValueError: day 格式无效
+    """
+    start, end = day_range(day)
+    return _runs_range(tasks, start, end) or (start, end)
+
+
+def latest_run_start(tasks: Sequence[str]) -> Optional[datetime]:
+    """最近一次成功运行的起始时间"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT range_start
+            FROM collection_runs
+            WHERE task_name = ANY(%s) AND status = 'success'
+            ORDER BY collected_at DESC
+            LIMIT 1
+        """, (list(tasks),))
+        row = cursor.fetchone()
+        return row[0] if row else None
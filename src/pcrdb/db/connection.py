@@ -2,21 +2,33 @@
 PostgreSQL Connection Management
 Provides connection pooling and helper functions for pcrdb
 """
+import contextvars
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
 from dataclasses import dataclass
 from datetime import datetime
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from dotenv import load_dotenv
 
+from .latest import upsert_latest
+from .aliases import upsert_aliases
+
 
 # Module-level connection cache
 _connection = None
 _config = None
 
+# Module-level connection pool
+_pool = None
+_pool_lock = threading.Lock()
+
 
 @dataclass
 class Account:
@@ -55,6 +67,9 @@ def get_config() -> Dict[str, Any]:
     sync_num = int(os.getenv('PCRDB_SYNC_NUM', '10'))
     batch_size = int(os.getenv('PCRDB_BATCH_SIZE', '30'))
     access_key = os.getenv('PCRDB_ACCESS_KEY', '')
+    pool_min = int(os.getenv('PCRDB_POOL_MIN', '1'))
+    pool_max = int(os.getenv('PCRDB_POOL_MAX', '10'))
+    pool_timeout = float(os.getenv('PCRDB_POOL_TIMEOUT', '30'))
 
     _config = {
         'host': host,
@@ -64,7 +79,10 @@ def get_config() -> Dict[str, Any]:
         'password': password,
         'sync_num': sync_num,
         'batch_size': batch_size,
-        'access_key': access_key
+        'access_key': access_key,
+        'pool_min': pool_min,
+        'pool_max': pool_max,
+        'pool_timeout': pool_timeout
     }
     return _config
 
@@ -91,9 +109,227 @@ def create_connection(**kwargs):
     return psycopg2.connect(**conn_args)
 
 
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool
+
+    Wraps psycopg2's ThreadedConnectionPool with:
+    - blocking checkout (waits up to `timeout` seconds instead of raising PoolError)
+    - health check on checkout (connections idle longer than `ping_idle` are pinged)
+    - reconnect on failure (broken connections are discarded and replaced)
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 30.0,
+                 ping_idle: float = 30.0, **conn_args):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **conn_args)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_idle = ping_idle
+
+    def _is_healthy(self, conn) -> bool:
+        """Check that a pooled connection is still usable"""
+        if conn.closed:
+            return False
+        if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.ping_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection, blocking while the pool is exhausted"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(f"connection pool exhausted (waited {self.timeout}s)")
+        try:
+            # Each broken connection is replaced; give up after cycling the whole pool
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+            raise psycopg2.OperationalError("could not obtain a healthy database connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection to the pool (closed and replaced if broken)"""
+        try:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                # ThreadedConnectionPool rolls back any open transaction
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except psycopg2.pool.PoolError:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Context manager: check out a connection and always return it"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # A cancelled statement (statement_timeout / QueryScope.cancel) leaves the connection usable
+            broken = not isinstance(e, psycopg2.extensions.QueryCanceledError)
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        """Close all connections in the pool"""
+        self._pool.closeall()
+        self._last_used.clear()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Get the process-wide connection pool (created on first use)
+    Sized by PCRDB_POOL_MIN / PCRDB_POOL_MAX
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None:
+            config = get_config()
+            _pool = ConnectionPool(
+                config['pool_min'],
+                config['pool_max'],
+                timeout=config['pool_timeout'],
+                host=config['host'],
+                port=config['port'],
+                database=config['database'],
+                user=config['user'],
+                password=config['password']
+            )
+    return _pool
+
+
+class QueryScope:
+    """
+    Request-scoped limits for pooled queries
+
+    While a scope is active (see use_query_scope), every connection borrowed
+    through pooled_connection() gets `SET LOCAL statement_timeout` and is
+    registered so cancel() can abort its running statement from another
+    thread (e.g. when the HTTP client disconnects).
+    """
+
+    def __init__(self, statement_timeout_ms: Optional[int] = None):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.cancelled = False
+        self._connections: Set[Any] = set()
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise psycopg2.extensions.QueryCanceledError("query scope cancelled")
+            self._connections.add(conn)
+        if self.statement_timeout_ms:
+            with conn.cursor() as cursor:
+                # LOCAL: reset with the transaction, i.e. when the connection goes back to the pool
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(self.statement_timeout_ms),))
+
+    def detach(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def cancel(self):
+        """Cancel running statements on every attached connection; later checkouts fail"""
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.cancel()
+            except psycopg2.Error:
+                pass
+
+
+_query_scope: contextvars.ContextVar[Optional[QueryScope]] = contextvars.ContextVar('pcrdb_query_scope', default=None)
+
+
+def use_query_scope(scope: Optional[QueryScope]):
+    """Activate a QueryScope for the current context (copied into DB threads by run_db)"""
+    _query_scope.set(scope)
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the pool
+
+    Usage:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(...)
+            conn.commit()
+
+    Uncommitted work is rolled back when the connection is returned.
+    """
+    scope = _query_scope.get()
+    with get_pool().connection() as conn:
+        if scope is None:
+            yield conn
+            return
+        scope.attach(conn)
+        try:
+            yield conn
+        finally:
+            scope.detach(conn)
+
+
+@contextmanager
+def pooled_cursor(cursor_factory=None, commit: bool = False):
+    """
+    Borrow a connection from the pool and yield a cursor on it
+
+    Args:
+        cursor_factory: Optional cursor class (e.g. RealDictCursor)
+        commit: Commit the transaction when the block exits cleanly
+    """
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cursor:
+            yield cursor
+        if commit:
+            conn.commit()
+
+
+def close_pool():
+    """Close every pooled connection"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
 def get_connection():
     """
     Get PostgreSQL connection (cached)
+
+    Single shared connection for one-off scripts only. Code that can run
+    concurrently (server, scheduler, tasks) must use pooled_connection().
     """
     global _connection
     if _connection is not None and not _connection.closed:
@@ -124,16 +360,15 @@ def get_accounts(active_only: bool = True) -> List[Account]:
     Args:
         active_only: Only return active accounts
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    if active_only:
-        cursor.execute("SELECT * FROM accounts WHERE is_active = TRUE ORDER BY id")
-    else:
-        cursor.execute("SELECT * FROM accounts ORDER BY id")
+    with pooled_cursor() as cursor:
+        if active_only:
+            cursor.execute("SELECT * FROM accounts WHERE is_active = TRUE ORDER BY id")
+        else:
+            cursor.execute("SELECT * FROM accounts ORDER BY id")
+        rows = cursor.fetchall()
     
     accounts = []
-    for row in cursor.fetchall():
+    for row in rows:
         accounts.append(Account(
             id=row[0],
             uid=row[1],
@@ -185,9 +420,6 @@ def update_account(uid: int, **kwargs):
     if not kwargs:
         return
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     set_clauses = []
     values = []
     for key, value in kwargs.items():
@@ -198,11 +430,11 @@ def update_account(uid: int, **kwargs):
     values.append(uid)
     
     query = f"UPDATE accounts SET {', '.join(set_clauses)} WHERE uid = %s"
-    cursor.execute(query, values)
-    conn.commit()
+    with pooled_cursor(commit=True) as cursor:
+        cursor.execute(query, values)
 
 
-def insert_snapshot(table: str, data: Dict[str, Any], collected_at: datetime = None):
+def insert_snapshot(table: str, data: Dict[str, Any], collected_at: datetime = None) -> int:
     """
     Insert a snapshot record
     
@@ -210,10 +442,10 @@ def insert_snapshot(table: str, data: Dict[str, Any], collected_at: datetime = N
         table: Target table name
         data: Column values
         collected_at: Timestamp (default: NOW())
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
     
+    Returns:
+        1 if inserted, 0 if it conflicted with an existing snapshot
+    """
     if collected_at is None:
         collected_at = datetime.now()
     
@@ -235,11 +467,16 @@ def insert_snapshot(table: str, data: Dict[str, Any], collected_at: datetime = N
         ON CONFLICT ({conflict_cols}) DO NOTHING
     """
     
-    cursor.execute(query, [data[col] for col in columns])
-    conn.commit()
+    with pooled_cursor(commit=True) as cursor:
+        cursor.execute(query, [data[col] for col in columns])
+        inserted = cursor.rowcount
+        upsert_latest(cursor, table, [data], collected_at)
+        upsert_aliases(cursor, table, [data], collected_at)
+    return inserted
 
 
-def insert_snapshots_batch(table: str, records: List[Dict[str, Any]], collected_at: datetime = None):
+def insert_snapshots_batch(table: str, records: List[Dict[str, Any]], collected_at: datetime = None,
+                           run_id: Optional[int] = None) -> int:
     """
     Batch insert snapshot records
     
@@ -247,19 +484,22 @@ def insert_snapshots_batch(table: str, records: List[Dict[str, Any]], collected_
         table: Target table name
         records: List of column value dicts
         collected_at: Timestamp for all records (default: NOW())
+        run_id: collection_runs.id the records belong to
+    
+    Returns:
+        Number of rows actually inserted (rows skipped by ON CONFLICT are not counted)
     """
     if not records:
-        return
-    
-    conn = get_connection()
-    cursor = conn.cursor()
+        return 0
     
     if collected_at is None:
         collected_at = datetime.now()
     
-    # Add collected_at to all records
+    # Add collected_at (and run_id) to all records
     for record in records:
         record['collected_at'] = collected_at
+        if run_id is not None:
+            record['run_id'] = run_id
     
     columns = list(records[0].keys())
     placeholders = ', '.join(['%s'] * len(columns))
@@ -278,5 +518,11 @@ def insert_snapshots_batch(table: str, records: List[Dict[str, Any]], collected_
     """
     
     values = [[record[col] for col in columns] for record in records]
-    cursor.executemany(query, values)
-    conn.commit()
+    with pooled_cursor(commit=True) as cursor:
+        cursor.executemany(query, values)
+        # psycopg2 sums rowcount over all executemany() statements
+        inserted = cursor.rowcount
+        # 同一事务内更新 player_latest / clan_latest 和名字别名表
+        upsert_latest(cursor, table, records, collected_at)
+        upsert_aliases(cursor, table, records, collected_at)
+    return inserted
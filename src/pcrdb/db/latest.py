@@ -0,0 +1,137 @@
+"""
+实体最新状态目录 (player_latest / clan_latest)
+每次快照写入时在同一事务内 upsert，"每个玩家/公会的最新一条" 查询变为主键查找，
+不再对快照表做 DISTINCT ON (viewer_id) 全表扫描。
+
+合并规则：较新的快照覆盖非空字段，较旧的快照只补空字段，
+因此各来源表、回填顺序互不影响。
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+
+# 快照表 → {player_latest 列: 快照列}
+PLAYER_SOURCES = {
+    'player_clan_snapshots': {
+        'name': 'name',
+        'level': 'level',
+        'total_power': 'total_power',
+        'join_clan_id': 'join_clan_id',
+        'join_clan_name': 'join_clan_name',
+        'last_login_time': 'last_login_time',
+    },
+    'player_profile_snapshots': {
+        'name': 'user_name',
+        'level': 'team_level',
+        'total_power': 'total_power',
+        'join_clan_id': 'join_clan_id',
+        'join_clan_name': 'join_clan_name',
+        'arena_group': 'arena_group',
+        'grand_arena_group': 'grand_arena_group',
+    },
+    'grand_arena_snapshots': {
+        'name': 'user_name',
+        'level': 'team_level',
+        'grand_arena_group': 'grand_arena_group',
+    },
+    'arena_deck_snapshots': {
+        'level': 'team_level',
+        'arena_group': 'arena_group',
+    },
+}
+
+# 空字符串视为缺失的文本列
+TEXT_COLUMNS = {'name', 'user_name', 'join_clan_name', 'clan_name', 'leader_name'}
+
+# clan_snapshots → clan_latest 的列（同名）
+CLAN_COLUMNS = [
+    'clan_name', 'leader_viewer_id', 'leader_name', 'member_num',
+    'current_period_ranking', 'grade_rank', 'exist',
+]
+
+
+def _upsert_sql(target: str, key: str, columns: List[str], source: str) -> str:
+    """生成 upsert 语句，source 为 'VALUES %s' 或 SELECT 子查询"""
+    merge = ',\n        '.join(
+        f"{c} = CASE WHEN EXCLUDED.last_seen_at >= {target}.last_seen_at "
+        f"THEN COALESCE(EXCLUDED.{c}, {target}.{c}) "
+        f"ELSE COALESCE({target}.{c}, EXCLUDED.{c}) END"
+        for c in columns
+    )
+    return f"""
+        INSERT INTO {target} ({key}, {', '.join(columns)}, last_seen_at)
+        {source}
+        ON CONFLICT ({key}) DO UPDATE SET
+        {merge},
+        last_seen_at = GREATEST({target}.last_seen_at, EXCLUDED.last_seen_at),
+        updated_at = NOW()
+    """
+
+
+def _target(table: str) -> Optional[Tuple[str, str, Dict[str, str]]]:
+    """快照表 → (目录表, 主键, 列映射)；不维护目录的表返回 None"""
+    if table == 'clan_snapshots':
+        return 'clan_latest', 'clan_id', {c: c for c in CLAN_COLUMNS}
+    if table in PLAYER_SOURCES:
+        return 'player_latest', 'viewer_id', PLAYER_SOURCES[table]
+    return None
+
+
+def _clean(value: Any) -> Any:
+    """空字符串视为缺失，避免覆盖已有名字"""
+    return None if value == '' else value
+
+
+def upsert_latest(cursor, table: str, records: List[Dict[str, Any]], collected_at: datetime):
+    """
+    用一批快照记录更新最新状态目录（由 insert_snapshots_batch 在同一事务内调用）
+
+    Args:
+        cursor: 快照写入所用游标（调用方负责提交）
+        table: 快照表名
+        records: 快照记录
+        collected_at: 快照时间
+    """
+    target = _target(table)
+    if not target:
+        return
+    target, key, mapping = target
+
+    # 同一批次内按主键去重（ON CONFLICT 不能在一条语句中两次更新同一行）
+    rows = {}
+    for record in records:
+        rows[record[key]] = [record[key]] + [_clean(record.get(src)) for src in mapping.values()] + [collected_at]
+    if not rows:
+        return
+
+    # 按主键顺序加锁：多个采集进程并发写入重叠的 viewer_id 时不会互相死锁
+    execute_values(cursor, _upsert_sql(target, key, list(mapping), 'VALUES %s'), [rows[k] for k in sorted(rows)])
+
+
+def rebuild_source(cursor, table: str, relation: Optional[str] = None) -> int:
+    """
+    从一张快照表（或其一个分区）回填最新状态目录
+
+    Args:
+        cursor: 数据库游标
+        table: 快照表名（决定列映射）
+        relation: 实际扫描的表/分区名，默认同 table
+
+    Returns:
+        upsert 的行数
+    """
+    relation = relation or table
+    target, key, mapping = _target(table)
+
+    select_cols = ', '.join(f"NULLIF({src}, '')" if src in TEXT_COLUMNS else src
+                            for src in mapping.values())
+    source = f"""
+        SELECT DISTINCT ON ({key}) {key}, {select_cols}, collected_at
+        FROM {relation}
+        ORDER BY {key}, collected_at DESC
+    """
+    cursor.execute(_upsert_sql(target, key, list(mapping), source))
+    return cursor.rowcount
+
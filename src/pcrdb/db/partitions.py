@@ -0,0 +1,137 @@
+"""
+快照表分区管理
+player_clan_snapshots 等快照表按 collected_at 月度范围分区，
+分区名格式: {table}_pYYYYMM（如 player_clan_snapshots_p202501）
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from .connection import pooled_connection
+
+
+# 按月分区的快照表
+PARTITIONED_TABLES = [
+    'player_clan_snapshots',
+    'player_profile_snapshots',
+    'grand_arena_snapshots',
+    'arena_deck_snapshots',
+]
+
+
+def month_start(value) -> date:
+    """取所在月份的第一天"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    """月份加减（结果为当月第一天）"""
+    index = value.year * 12 + (value.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(period: str) -> Tuple[datetime, datetime]:
+    """
+    月份 → 半开时间区间 [start, end)
+
+    Args:
+        period: 月份 YYYY-MM
+
+    Returns:
+        (当月1日 00:00, 次月1日 00:00)，用于 collected_at >= start AND collected_at < end，
+        可命中单个分区（分区裁剪），取代 to_char(collected_at, 'YYYY-MM') = period
+    """
+    start = datetime.strptime(period, '%Y-%m')
+    end = datetime.combine(add_months(start.date(), 1), datetime.min.time())
+    return start, end
+
+
+def day_range(day: str) -> Tuple[datetime, datetime]:
+    """
+    日期 → 半开时间区间 [start, end)
+
+    Args:
+        day: 日期 YYYY-MM-DD
+    """
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return start, start + timedelta(days=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """分区表名，如 player_clan_snapshots_p202501"""
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    """表是否为分区表（迁移前的普通表返回 False）"""
+    cursor.execute("""
+        SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)
+    """, (table,))
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def create_partition(cursor, table: str, month: date) -> Optional[str]:
+    """
+    创建单个月分区（已存在则跳过）
+
+    Returns:
+        新建的分区名，已存在时返回 None
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    if cursor.fetchone()[0] is not None:
+        return None
+
+    start = month_start(month)
+    end = add_months(start, 1)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+        f"FOR VALUES FROM (%s) TO (%s)",
+        (start.isoformat(), end.isoformat())
+    )
+    return name
+
+
+def ensure_partitions(tables: Optional[List[str]] = None, months_ahead: int = 1,
+                      since: Optional[date] = None) -> List[str]:
+    """
+    预建分区：从 since（默认当月）到当月 + months_ahead
+
+    在每个采集任务执行前调用，保证写入时分区已存在。
+    未分区（尚未迁移）的表会被跳过。
+
+    Returns:
+        新建的分区名列表
+    """
+    tables = tables or PARTITIONED_TABLES
+    current = month_start(datetime.now())
+    first = month_start(since) if since else current
+    last = add_months(current, months_ahead)
+
+    created = []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for table in tables:
+            if not is_partitioned(cursor, table):
+                continue
+            month = first
+            while month <= last:
+                name = create_partition(cursor, table, month)
+                if name:
+                    created.append(name)
+                month = add_months(month, 1)
+        conn.commit()
+
+    return created
+
+
+def list_partitions(cursor, table: str) -> List[str]:
+    """列出分区表的所有分区（按名称即时间升序）"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
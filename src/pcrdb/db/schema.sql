@@ -1,6 +1,11 @@
 -- pcrdb PostgreSQL Schema
--- Version: 2.1
--- Date: 2025-12-28
+-- Version: 2.2
+-- Date: 2026-10-19
+--
+-- 快照表 player_clan_snapshots / player_profile_snapshots / grand_arena_snapshots /
+-- arena_deck_snapshots 按 collected_at 月度范围分区。
+-- 月分区由 src/pcrdb/db/partitions.py 的 ensure_partitions() 创建（apply_schema.py 与每次任务执行前调用）；
+-- 已有数据库的迁移见 scripts/migrate_partitions.py
 
 -----------------------------------------------------------
 -- Table 1: clan_snapshots
@@ -9,6 +14,7 @@ CREATE TABLE clan_snapshots (
     id SERIAL PRIMARY KEY,
     clan_id INTEGER NOT NULL,
     collected_at TIMESTAMPTZ NOT NULL,
+    run_id INTEGER,                       -- collection_runs.id
     clan_name TEXT,
     leader_viewer_id BIGINT,
     leader_name TEXT,
@@ -25,13 +31,16 @@ CREATE TABLE clan_snapshots (
 
 CREATE INDEX idx_clan_latest ON clan_snapshots (clan_id, collected_at DESC);
 
+CREATE INDEX idx_clan_collected ON clan_snapshots USING BRIN (collected_at);
+
 -----------------------------------------------------------
 -- Table 2: player_clan_snapshots
 -----------------------------------------------------------
 CREATE TABLE player_clan_snapshots (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     viewer_id BIGINT NOT NULL,
     collected_at TIMESTAMPTZ NOT NULL,
+    run_id INTEGER,                       -- collection_runs.id
     name TEXT,
     level SMALLINT,
     role SMALLINT,
@@ -39,20 +48,24 @@ CREATE TABLE player_clan_snapshots (
     join_clan_id INTEGER,
     join_clan_name TEXT,
     last_login_time TIMESTAMPTZ,
+    PRIMARY KEY (id, collected_at),
     UNIQUE (viewer_id, collected_at)
-);
+) PARTITION BY RANGE (collected_at);
 
 CREATE INDEX idx_pclan_viewer ON player_clan_snapshots (viewer_id, collected_at DESC);
 
 CREATE INDEX idx_pclan_clan ON player_clan_snapshots (join_clan_id);
 
+CREATE INDEX idx_pclan_collected ON player_clan_snapshots USING BRIN (collected_at);
+
 -----------------------------------------------------------
 -- Table 3: player_profile_snapshots
 -----------------------------------------------------------
 CREATE TABLE player_profile_snapshots (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     viewer_id BIGINT NOT NULL,
     collected_at TIMESTAMPTZ NOT NULL,
+    run_id INTEGER,                       -- collection_runs.id
     user_name TEXT,
     team_level SMALLINT,
     unit_num SMALLINT,
@@ -68,45 +81,170 @@ CREATE TABLE player_profile_snapshots (
     talent_quest_clear JSONB,
     user_comment TEXT,
     last_login_time TIMESTAMPTZ,
+    PRIMARY KEY (id, collected_at),
     UNIQUE (viewer_id, collected_at)
-);
+) PARTITION BY RANGE (collected_at);
 
 CREATE INDEX idx_pprofile_viewer ON player_profile_snapshots (viewer_id, collected_at DESC);
 
+CREATE INDEX idx_pprofile_collected ON player_profile_snapshots USING BRIN (collected_at);
+
 -----------------------------------------------------------
 -- Table 4: grand_arena_snapshots
 -----------------------------------------------------------
 CREATE TABLE grand_arena_snapshots (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     viewer_id BIGINT NOT NULL,
     collected_at TIMESTAMPTZ NOT NULL,
+    run_id INTEGER,                       -- collection_runs.id
     user_name TEXT,
     team_level SMALLINT,
     grand_arena_rank SMALLINT,
     grand_arena_group SMALLINT,
     winning_number SMALLINT,
     favorite_unit INTEGER,
+    PRIMARY KEY (id, collected_at),
     UNIQUE (viewer_id, collected_at)
-);
+) PARTITION BY RANGE (collected_at);
 
 CREATE INDEX idx_grand_viewer ON grand_arena_snapshots (viewer_id, collected_at DESC);
 
+CREATE INDEX idx_grand_collected ON grand_arena_snapshots USING BRIN (collected_at);
+
 -----------------------------------------------------------
 -- Table 5: arena_deck_snapshots
 -----------------------------------------------------------
 CREATE TABLE arena_deck_snapshots (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     viewer_id BIGINT NOT NULL,
     collected_at TIMESTAMPTZ NOT NULL,
+    run_id INTEGER,                       -- collection_runs.id
     team_level SMALLINT,
     arena_group SMALLINT,
     arena_rank SMALLINT,
     arena_deck JSONB,
+    PRIMARY KEY (id, collected_at),
     UNIQUE (viewer_id, collected_at)
-);
+) PARTITION BY RANGE (collected_at);
 
 CREATE INDEX idx_deck_viewer ON arena_deck_snapshots (viewer_id, collected_at DESC);
 
+CREATE INDEX idx_deck_collected ON arena_deck_snapshots USING BRIN (collected_at);
+
+-----------------------------------------------------------
+-- Table 5b: collection_runs - 采集运行目录
+-- 每次任务运行一条记录；该次运行写入的快照共用 collected_at 并引用 run_id。
+-- 分析查询通过本表确定期间与时间范围，不再对快照表做 to_char(collected_at) 扫描
+-----------------------------------------------------------
+CREATE TABLE collection_runs (
+    id SERIAL PRIMARY KEY,
+    task_name TEXT NOT NULL,              -- 任务名称 (如 'clan_sync')
+    period TEXT NOT NULL,                 -- 月份 YYYY-MM
+    collected_at TIMESTAMPTZ NOT NULL,    -- 本次运行快照共用的 collected_at
+    started_at TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ,              -- NULL = 运行中
+    status TEXT NOT NULL DEFAULT 'running', -- 'running' / 'success' / 'failed'
+    range_start TIMESTAMPTZ,              -- 快照时间范围 [range_start, range_end)
+    range_end TIMESTAMPTZ
+);
+
+CREATE INDEX idx_runs_task ON collection_runs (task_name, collected_at DESC);
+
+-----------------------------------------------------------
+-- Table 5c: clan_period_summary - 公会月度汇总
+-- clan_sync 完成后由 tasks/clan_summary.py 写入（每个公会每月一行），
+-- 公会历史 / 战力排名 / 排名前列公会直接读取本表
+-----------------------------------------------------------
+CREATE TABLE clan_period_summary (
+    clan_id INTEGER NOT NULL,
+    period TEXT NOT NULL,                 -- 月份 YYYY-MM
+    run_id INTEGER,                       -- collection_runs.id
+    collected_at TIMESTAMPTZ NOT NULL,    -- 该月最新公会快照时间
+    clan_name TEXT,
+    leader_viewer_id BIGINT,
+    leader_name TEXT,
+    member_num SMALLINT,                  -- 公会自报成员数
+    current_period_ranking INTEGER,
+    grade_rank INTEGER,
+    final_ranking INTEGER,                -- 最终排名 = 下一期的 grade_rank
+    is_final BOOLEAN NOT NULL DEFAULT FALSE, -- 已有下一期（final_ranking 已解析）
+    member_count INTEGER DEFAULT 0,       -- 成员快照聚合: 人数（战力 > 0）
+    total_power BIGINT DEFAULT 0,         -- 成员快照聚合: 总战力
+    avg_power BIGINT DEFAULT 0,           -- 成员快照聚合: 平均战力
+    exist BOOLEAN DEFAULT TRUE,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (clan_id, period)
+);
+
+CREATE INDEX idx_cps_period_rank ON clan_period_summary (period, current_period_ranking);
+
+CREATE INDEX idx_cps_period_power ON clan_period_summary (period, avg_power DESC);
+
+CREATE INDEX idx_cps_name ON clan_period_summary (clan_name);
+
+-----------------------------------------------------------
+-- Table 5d: player_latest / clan_latest - 实体最新状态目录
+-- 每次快照写入时在同一事务内 upsert（src/pcrdb/db/latest.py），
+-- "每个玩家/公会的最新一条" 查询改为主键查找；回填: python cli.py latest
+-----------------------------------------------------------
+CREATE TABLE player_latest (
+    viewer_id BIGINT PRIMARY KEY,
+    name TEXT,
+    level SMALLINT,
+    total_power INTEGER,
+    join_clan_id INTEGER,
+    join_clan_name TEXT,
+    last_login_time TIMESTAMPTZ,
+    arena_group SMALLINT,
+    grand_arena_group SMALLINT,
+    last_seen_at TIMESTAMPTZ NOT NULL,    -- 最近一次出现在任一快照中的时间
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX idx_plat_login ON player_latest (last_login_time);
+
+CREATE INDEX idx_plat_clan ON player_latest (join_clan_id);
+
+CREATE TABLE clan_latest (
+    clan_id INTEGER PRIMARY KEY,
+    clan_name TEXT,
+    leader_viewer_id BIGINT,
+    leader_name TEXT,
+    member_num SMALLINT,
+    current_period_ranking INTEGER,
+    grade_rank INTEGER,
+    exist BOOLEAN,
+    last_seen_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-----------------------------------------------------------
+-- Table 5e: player_aliases / clan_aliases - 名字别名（含曾用名）
+-- 快照写入时同一事务内 upsert（src/pcrdb/db/aliases.py），pg_trgm GIN 索引支持
+-- ILIKE 子串匹配、相似度排序和精确匹配；回填: python cli.py aliases
+-----------------------------------------------------------
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE player_aliases (
+    viewer_id BIGINT NOT NULL,
+    name TEXT NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL,
+    last_seen TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (viewer_id, name)
+);
+
+CREATE INDEX idx_palias_name_trgm ON player_aliases USING GIN (name gin_trgm_ops);
+
+CREATE TABLE clan_aliases (
+    clan_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL,
+    last_seen TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (clan_id, name)
+);
+
+CREATE INDEX idx_calias_name_trgm ON clan_aliases USING GIN (name gin_trgm_ops);
+
 -----------------------------------------------------------
 -- Table 6: accounts (data collection accounts)
 -----------------------------------------------------------
@@ -173,7 +311,7 @@ CREATE TABLE task_logs (
 -- 执行统计（三个值用于对比判断问题）
 records_expected INTEGER DEFAULT 0, -- 预计获取数（基于历史或计算）
 records_fetched INTEGER DEFAULT 0, -- API实际返回的有效记录数
-records_saved INTEGER DEFAULT 0, -- 实际入库数（数据库增量）
+records_saved INTEGER DEFAULT 0, -- 实际入库数（INSERT 影响行数）
 
 -- 错误信息
 error_message TEXT, -- 错误信息（失败时）
@@ -182,4 +320,20 @@ error_message TEXT, -- 错误信息（失败时）
 details JSONB                         -- 额外详情 {"mode": "top_clans", ...}
 );
 
-CREATE INDEX idx_task_logs_name ON task_logs (task_name, started_at DESC);
\ No newline at end of file
+CREATE INDEX idx_task_logs_name ON task_logs (task_name, started_at DESC);
+
+-----------------------------------------------------------
+-- Table 8: data_versions - 各任务的数据版本
+-- 每次数据变更通知（pg_notify 'pcrdb_data_changed'）在同一事务内加一，
+-- API 服务各 worker 收到通知后读取，响应缓存 / ETag 的版本号跨进程一致
+-----------------------------------------------------------
+CREATE TABLE data_versions (
+    task_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    changed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 已有数据库：从任务日志延续版本号（可重复执行）
+INSERT INTO data_versions (task_name, version)
+SELECT task_name, MAX(id) FROM task_logs GROUP BY task_name
+ON CONFLICT (task_name) DO NOTHING;
@@ -0,0 +1,209 @@
+"""
+Slow Query Capture
+Cursor classes that time every statement and aggregate the timings by SQL
+fingerprint in a bounded in-memory store:
+
+    cursor = conn.cursor(cursor_factory=TimedCursor)
+    with pooled_cursor(cursor_factory=TimedCursor) as cursor: ...
+
+- fingerprint: whitespace collapsed, literals and placeholders replaced by '?'
+- per fingerprint: calls, total / max time, recent durations (for p95),
+  parameters of the slowest call
+- read-only statements slower than PCRDB_SLOW_QUERY_MS get an
+  EXPLAIN (ANALYZE, BUFFERS) sample, at most once per EXPLAIN_INTERVAL per
+  fingerprint, run on a background thread in a READ ONLY transaction
+
+Stats are per process: in supervisor mode tasks run in their own collector
+processes, so task queries show up only where they ran.
+"""
+import functools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import psycopg2.extensions
+import psycopg2.extras
+
+from .connection import pooled_connection
+
+
+SLOW_QUERY_MS = float(os.getenv('PCRDB_SLOW_QUERY_MS', '500'))
+EXPLAIN_INTERVAL = 600
+EXPLAIN_TIMEOUT_MS = 60000
+EXPLAIN_QUEUE_LIMIT = 4
+MAX_FINGERPRINTS = 500
+DURATION_SAMPLES = 256
+MAX_SQL_CHARS = 2000
+MAX_PARAMS_CHARS = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_WHITESPACE = re.compile(r"\s+")
+_WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|COPY|CREATE|ALTER|DROP|TRUNCATE|NOTIFY)\b", re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so calls that differ only in values share one entry"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()[:MAX_SQL_CHARS]
+
+
+def _explainable(sql: str) -> bool:
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    return head in ('SELECT', 'WITH') and not _WRITE_KEYWORDS.search(sql)
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Entry:
+    __slots__ = ('calls', 'total', 'max', 'durations', 'slowest_params', 'explain', 'explained_at', 'explain_pending')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.durations = deque(maxlen=DURATION_SAMPLES)
+        self.slowest_params: Optional[str] = None
+        self.explain: Optional[Dict[str, Any]] = None
+        self.explained_at = 0.0
+        self.explain_pending = False
+
+
+class QueryStats:
+    """Bounded per-fingerprint timing store (LRU by last call)"""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, max_fingerprints: int = MAX_FINGERPRINTS):
+        self.slow_seconds = slow_ms / 1000
+        self.max_fingerprints = max_fingerprints
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._explain_executor: Optional[ThreadPoolExecutor] = None
+        self._explain_slots = threading.BoundedSemaphore(EXPLAIN_QUEUE_LIMIT)
+
+    def record(self, cursor, query, params, seconds: float):
+        sql = query if isinstance(query, str) else query.decode() if isinstance(query, bytes) else str(query)
+        key = fingerprint(sql)
+        explain_due = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                while len(self._entries) > self.max_fingerprints:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry.calls += 1
+            entry.total += seconds
+            entry.durations.append(seconds)
+            if seconds >= entry.max:
+                entry.max = seconds
+                entry.slowest_params = repr(params)[:MAX_PARAMS_CHARS] if params is not None else None
+            if (seconds >= self.slow_seconds and not entry.explain_pending
+                    and time.time() - entry.explained_at >= EXPLAIN_INTERVAL and _explainable(sql)):
+                entry.explain_pending = explain_due = True
+
+        if explain_due:
+            self._submit_explain(entry, cursor, query, params, seconds)
+
+    def _submit_explain(self, entry: _Entry, cursor, query, params, seconds: float):
+        try:
+            statement = cursor.mogrify(query, params).decode('utf-8', 'replace')
+        except Exception:
+            entry.explain_pending = False
+            return
+        if not self._explain_slots.acquire(blocking=False):
+            entry.explain_pending = False
+            return
+        with self._lock:
+            if self._explain_executor is None:
+                self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pcrdb-explain')
+        self._explain_executor.submit(self._explain, entry, statement, seconds)
+
+    def _explain(self, entry: _Entry, statement: str, seconds: float):
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    # READ ONLY: ANALYZE executes the statement, make sure it cannot write
+                    cursor.execute("SET TRANSACTION READ ONLY")
+                    cursor.execute("SET LOCAL statement_timeout = %s", (EXPLAIN_TIMEOUT_MS,))
+                    cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+                conn.rollback()
+            entry.explain = {'plan': plan, 'observed_ms': round(seconds * 1000, 1), 'at': time.time()}
+        except Exception as e:
+            entry.explain = {'error': f"{e.__class__.__name__}: {e}", 'observed_ms': round(seconds * 1000, 1),
+                             'at': time.time()}
+        finally:
+            entry.explained_at = time.time()
+            entry.explain_pending = False
+            self._explain_slots.release()
+
+    def top(self, order: str = 'total', limit: int = 20) -> List[Dict[str, Any]]:
+        """Top fingerprints by total time or p95 ('total' / 'p95' / 'max' / 'calls')"""
+        with self._lock:
+            items = [(key, e, list(e.durations)) for key, e in self._entries.items()]
+        rows = []
+        for key, e, durations in items:
+            rows.append({
+                'fingerprint': key,
+                'calls': e.calls,
+                'total_ms': round(e.total * 1000, 1),
+                'mean_ms': round(e.total / e.calls * 1000, 2) if e.calls else 0,
+                'p95_ms': round(_percentile(durations, 0.95) * 1000, 2),
+                'max_ms': round(e.max * 1000, 1),
+                'slowest_params': e.slowest_params,
+                'explain': e.explain,
+            })
+        sort_key = {'total': 'total_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'calls': 'calls'}.get(order, 'total_ms')
+        rows.sort(key=lambda r: r[sort_key], reverse=True)
+        return rows[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'fingerprints': len(self._entries), 'slow_query_ms': self.slow_seconds * 1000}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide store
+query_stats = QueryStats()
+
+
+class TimedCursorMixin:
+    """Times execute / executemany into query_stats"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            query_stats.record(self, query, vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            query_stats.record(self, query, None, time.perf_counter() - start)
+
+
+class TimedCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class TimedRealDictCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+    pass
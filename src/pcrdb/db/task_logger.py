@@ -2,25 +2,106 @@
 任务日志工具
 记录定时任务的执行状态和统计信息
 """
+import sys
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, Optional, List
 import json
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # 北京时区
 BEIJING_TZ = timezone(timedelta(hours=8))
 
-from .connection import get_connection
+from .connection import pooled_cursor
+from .aio import to_async
+from .slow_queries import TimedCursor
+from .collection_runs import CollectionRun, start_run, finish_run
+from .task_profiler import start_profiler
+
+
+# 任务成功后发出的 NOTIFY 频道（payload 为任务名），API 服务据此刷新内存缓存
+DATA_CHANGED_CHANNEL = 'pcrdb_data_changed'
+
+def _resource_usage() -> Optional[Dict[str, float]]:
+    """本进程累计 CPU 时间与峰值 RSS（Linux ru_maxrss 单位为 KB，macOS 为字节）"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss_bytes = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return {'cpu_user': usage.ru_utime, 'cpu_system': usage.ru_stime, 'peak_rss_mb': rss_bytes / 1024 / 1024}
+
+
+class TaskMetrics:
+    """
+    任务分阶段计时与计数，保存到 task_logs.details（phases / counters / resources）
+
+    使用方式:
+        with metrics.phase('fetch'):
+            result = await client.query_clan(clan_id)
+        metrics.count('retries')
+
+    阶段耗时为累计值：并发的协程 / 线程各自计时后相加，总和可能超过任务总耗时。
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._usage_start = _resource_usage()
+        # 性能剖析（PCRDB_PROFILE），阶段结束时通知 mem 模式拍快照
+        self.profiler = None
+
+    def add_phase(self, name: str, seconds: float, count: int = 1):
+        with self._lock:
+            phase = self.phases.setdefault(name, {'seconds': 0.0, 'count': 0})
+            phase['seconds'] += seconds
+            phase['count'] += count
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+            if self.profiler is not None:
+                self.profiler.phase_end(name)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
 
+    def resources(self) -> Optional[Dict[str, float]]:
+        """任务期间的 CPU 时间，以及进程峰值 RSS（任务在独立采集进程中运行时即为本任务的峰值）"""
+        end = _resource_usage()
+        if end is None or self._usage_start is None:
+            return None
+        return {
+            'cpu_user_seconds': round(end['cpu_user'] - self._usage_start['cpu_user'], 2),
+            'cpu_system_seconds': round(end['cpu_system'] - self._usage_start['cpu_system'], 2),
+            'peak_rss_mb': round(end['peak_rss_mb'], 1),
+        }
 
-# 任务对应的数据表映射
-TASK_TABLES = {
-    'clan_sync': ['clan_snapshots', 'player_clan_snapshots'],
-    'player_profile_sync': ['player_profile_snapshots'],
-    'player_profile_sync_monthly': ['player_profile_snapshots'],
-    'grand_sync': ['grand_arena_snapshots'],
-    'arena_deck_sync': ['arena_deck_snapshots'],
-}
+    def to_details(self) -> Dict[str, Any]:
+        with self._lock:
+            details: Dict[str, Any] = {}
+            if self.phases:
+                details['phases'] = {
+                    name: {'seconds': round(p['seconds'], 3), 'count': int(p['count'])}
+                    for name, p in self.phases.items()
+                }
+            if self.counters:
+                details['counters'] = dict(self.counters)
+        resources = self.resources()
+        if resources:
+            details['resources'] = resources
+        return details
 
 
 class TaskLogger:
@@ -31,10 +112,11 @@ class TaskLogger:
         logger = TaskLogger('clan_sync')
         logger.start(records_fetched=100, details={'mode': 'active'})
         try:
-            # 执行任务...
-            logger.finish_success()
+            # 执行任务，快照使用 logger.run.collected_at / logger.run.id 写入，
+            # 累计 insert_snapshots_batch 的返回值作为入库数
+            logger.finish_success(records_fetched=fetched, records_saved=saved)
         except Exception as e:
-            logger.finish_failed(str(e))
+            logger.finish_failed(str(e), records_fetched=fetched, records_saved=saved)
     """
     
     def __init__(self, task_name: str):
@@ -43,27 +125,10 @@ class TaskLogger:
         self.records_expected: int = 0  # 预计获取数
         self.records_fetched: int = 0   # 实际获取数（在finish时传入）
         self.details: Optional[Dict] = None
-        self.initial_counts: Dict[str, int] = {}
-    
-    def _get_table_count(self, table_name: str) -> int:
-        """获取表的当前记录数"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        count = cursor.fetchone()[0]
-        cursor.close()
-        return count
-    
-    def _snapshot_counts(self) -> Dict[str, int]:
-        """获取任务相关表的记录数快照"""
-        tables = TASK_TABLES.get(self.task_name, [])
-        counts = {}
-        for table in tables:
-            try:
-                counts[table] = self._get_table_count(table)
-            except Exception:
-                counts[table] = 0
-        return counts
+        self.run: Optional[CollectionRun] = None
+        # 分阶段计时 / 计数，传给 TaskQueue 或在任务中直接使用
+        self.metrics = TaskMetrics()
+        self.profiler = None
     
     def start(self, records_expected: int = 0, details: Optional[Dict] = None):
         """
@@ -76,30 +141,28 @@ class TaskLogger:
         self.start_time = datetime.now(BEIJING_TZ)
         self.records_expected = records_expected
         self.details = details
-        self.initial_counts = self._snapshot_counts()
-    
-    def _calculate_saved(self) -> int:
-        """计算实际保存的记录数（数据库增量）"""
-        current_counts = self._snapshot_counts()
-        total_saved = 0
-        for table, initial in self.initial_counts.items():
-            current = current_counts.get(table, initial)
-            delta = current - initial
-            if delta > 0:
-                total_saved += delta
-        return total_saved
+        self.metrics = TaskMetrics()
+        # PCRDB_PROFILE=cpu|mem 时剖析本次任务（见 task_profiler）
+        self.profiler = start_profiler(self.task_name)
+        self.metrics.profiler = self.profiler
+        # 登记采集运行，本次任务的所有快照共用 run.collected_at
+        self.run = start_run(self.task_name)
     
-    def _save_log(self, status: str, records_fetched: int = 0, error_message: Optional[str] = None):
+    def _save_log(self, status: str, records_fetched: int = 0, records_saved: int = 0,
+                  error_message: Optional[str] = None):
         """保存日志到数据库"""
         if not self.start_time:
             return
             
         finished_at = datetime.now(BEIJING_TZ)
         duration = (finished_at - self.start_time).total_seconds()
-        records_saved = self._calculate_saved()
+        details = {**(self.details or {}), **self.metrics.to_details()}
+        profile = self._stop_profiler()
+        if profile:
+            details['profile'] = profile
         
-        conn = get_connection()
-        cursor = conn.cursor()
+        if self.run:
+            finish_run(self.run.id, status)
         
         sql = """
             INSERT INTO task_logs 
@@ -108,39 +171,162 @@ class TaskLogger:
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         
-        cursor.execute(sql, (
-            self.task_name,
-            self.start_time,
-            finished_at,
-            round(duration, 2),
-            status,
-            self.records_expected,
-            records_fetched,
-            records_saved,
-            error_message,
-            json.dumps(self.details) if self.details else None
-        ))
-        
-        conn.commit()
-        cursor.close()
+        with pooled_cursor(cursor_factory=TimedCursor, commit=True) as cursor:
+            cursor.execute(sql, (
+                self.task_name,
+                self.start_time,
+                finished_at,
+                round(duration, 2),
+                status,
+                self.records_expected,
+                records_fetched,
+                records_saved,
+                error_message,
+                json.dumps(details) if details else None
+            ))
+            # 失败 / 部分完成的任务也已提交了快照和 latest / 别名表，同样通知；
+            # 随日志一起提交，监听方收到通知时数据已可见
+            _publish_change(cursor, self.task_name)
+    
+    def _stop_profiler(self) -> Optional[Dict]:
+        """结束剖析并写出产物，返回 Top-N 摘要（剖析失败不影响任务日志）"""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return None
+        self.metrics.profiler = None
+        try:
+            summary = profiler.stop()
+        except Exception as e:
+            return {'mode': profiler.mode, 'error': f"{e.__class__.__name__}: {e}"}
+        print(f"性能剖析产物: {', '.join(summary['artefacts'])}")
+        return summary
     
-    def finish_success(self, records_fetched: int = 0):
+    def finish_success(self, records_fetched: int = 0, records_saved: int = 0):
         """
         标记任务成功完成
         
         Args:
             records_fetched: API实际返回的有效记录数
+            records_saved: 实际插入的快照行数（insert_snapshots_batch 返回值之和）
         """
-        self._save_log('success', records_fetched)
+        self._save_log('success', records_fetched, records_saved)
     
-    def finish_failed(self, error_message: str, records_fetched: int = 0):
+    def finish_failed(self, error_message: str, records_fetched: int = 0, records_saved: int = 0):
         """标记任务失败"""
-        self._save_log('failed', records_fetched, error_message)
+        self._save_log('failed', records_fetched, records_saved, error_message)
+
+
+def _publish_change(cursor, task_name: str):
+    """数据版本加一并发出通知（调用方提交，两者在同一事务内生效）"""
+    cursor.execute("""
+        INSERT INTO data_versions (task_name, version) VALUES (%s, 1)
+        ON CONFLICT (task_name) DO UPDATE SET
+            version = data_versions.version + 1,
+            changed_at = NOW()
+    """, (task_name,))
+    cursor.execute("SELECT pg_notify(%s, %s)", (DATA_CHANGED_CHANNEL, task_name))
+
+
+def notify_data_changed(task_name: str):
+    """
+    手动发出数据变更通知（不经 TaskLogger 的数据重建，如 clan_summary 回填）
+    """
+    with pooled_cursor(cursor_factory=TimedCursor, commit=True) as cursor:
+        _publish_change(cursor, task_name)
+
+
+def get_task_versions() -> Dict[str, int]:
+    """
+    各任务的数据版本（data_versions，每次数据变更通知加一，含失败的运行：其已写入的数据同样可见），
+    用作响应缓存 / ETag 的版本号，各进程读到的值一致
+
+    Returns:
+        {task_name: version}
+    """
+    with pooled_cursor(cursor_factory=TimedCursor) as cursor:
+        cursor.execute("SELECT task_name, version FROM data_versions")
+        return dict(cursor.fetchall())
+
+
+def _change_pct(current, previous) -> Optional[float]:
+    if current is None or not previous:
+        return None
+    return round((float(current) - float(previous)) / float(previous) * 100, 1)
+
+
+def _compare_top(current: List[Dict], previous: List[Dict], key: str, value: str) -> List[Dict]:
+    """按 key（函数 / 代码位置）对比两次剖析的 Top-N，上次不在 Top-N 中的 previous 为 None"""
+    prev_values = {item[key]: item.get(value) for item in previous or []}
+    return [
+        {key: item[key], value: item.get(value), 'previous': prev_values.get(item[key]),
+         'change_pct': _change_pct(item.get(value), prev_values.get(item[key]))}
+        for item in current or []
+    ]
+
+
+def compare_profiles(current: Optional[Dict], previous: Optional[Dict]) -> Optional[Dict]:
+    """对比两次同模式的剖析摘要（details['profile']）"""
+    if not current or not previous or current.get('mode') != previous.get('mode') or 'error' in current:
+        return None
+    if current['mode'] == 'cpu':
+        return {
+            'mode': 'cpu',
+            'total_seconds_change_pct': _change_pct(current.get('total_seconds'), previous.get('total_seconds')),
+            'top': _compare_top(current.get('top'), previous.get('top'), 'function', 'tottime'),
+        }
+    return {
+        'mode': 'mem',
+        'peak_mb_change_pct': _change_pct(current.get('peak_mb'), previous.get('peak_mb')),
+        'top': _compare_top(current.get('top'), previous.get('top'), 'location', 'size_kb'),
+    }
+
+
+def compare_runs(current: Dict, previous: Optional[Dict], previous_profile: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    与同一任务上一次运行对比（耗时、入库数、各阶段耗时、CPU / 内存）
+
+    Args:
+        previous_profile: 上一次同模式剖析的摘要（上一次运行未开启剖析时由调用方单独查询）
+
+    Returns:
+        {previous_id, duration_change_pct, records_saved_change_pct, phases: {name: {seconds, previous, change_pct}},
+         resources: {...}, profile: {...} 或 None}；没有上一次运行时返回 None
+    """
+    if previous is None:
+        return None
+    cur_details = current.get('details') or {}
+    prev_details = previous.get('details') or {}
+
+    phases = {}
+    prev_phases = prev_details.get('phases') or {}
+    for name, phase in (cur_details.get('phases') or {}).items():
+        prev_seconds = (prev_phases.get(name) or {}).get('seconds')
+        phases[name] = {
+            'seconds': phase.get('seconds'),
+            'previous': prev_seconds,
+            'change_pct': _change_pct(phase.get('seconds'), prev_seconds),
+        }
+
+    resources = {}
+    prev_resources = prev_details.get('resources') or {}
+    for key, value in (cur_details.get('resources') or {}).items():
+        resources[key] = {'value': value, 'previous': prev_resources.get(key),
+                          'change_pct': _change_pct(value, prev_resources.get(key))}
+
+    return {
+        'previous_id': previous['id'],
+        'previous_status': previous['status'],
+        'duration_change_pct': _change_pct(current['duration_seconds'], previous['duration_seconds']),
+        'records_saved_change_pct': _change_pct(current['records_saved'], previous['records_saved']),
+        'phases': phases,
+        'resources': resources,
+        'profile': compare_profiles(cur_details.get('profile'), previous_profile or prev_details.get('profile')),
+    }
 
 
 def get_recent_logs(limit: int = 50, task_name: Optional[str] = None) -> List[Dict]:
     """
-    获取最近的任务日志
+    获取最近的任务日志（附与同一任务上一次运行的对比 comparison；剖析摘要与上一次同模式的剖析对比）
     
     Args:
         limit: 返回数量
@@ -149,35 +335,43 @@ def get_recent_logs(limit: int = 50, task_name: Optional[str] = None) -> List[Di
     Returns:
         日志列表
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    if task_name:
-        sql = """
-            SELECT id, task_name, started_at, finished_at, duration_seconds,
-                   status, records_expected, records_fetched, records_saved, error_message, details
-            FROM task_logs
-            WHERE task_name = %s
-            ORDER BY started_at DESC
-            LIMIT %s
-        """
-        cursor.execute(sql, (task_name, limit))
-    else:
-        sql = """
-            SELECT id, task_name, started_at, finished_at, duration_seconds,
-                   status, records_expected, records_fetched, records_saved, error_message, details
-            FROM task_logs
-            ORDER BY started_at DESC
-            LIMIT %s
-        """
-        cursor.execute(sql, (limit,))
+    where = "WHERE t.task_name = %s" if task_name else ""
+    params = (task_name, limit) if task_name else (limit,)
+    # 上一次运行按 (task_name, started_at DESC) 索引逐行查找
+    sql = f"""
+        SELECT t.id, t.task_name, t.started_at, t.finished_at, t.duration_seconds,
+               t.status, t.records_expected, t.records_fetched, t.records_saved, t.error_message, t.details,
+               prev.id, prev.status, prev.duration_seconds, prev.records_saved, prev.details,
+               prev_profile.profile
+        FROM task_logs t
+        LEFT JOIN LATERAL (
+            SELECT p.id, p.status, p.duration_seconds, p.records_saved, p.details
+            FROM task_logs p
+            WHERE p.task_name = t.task_name AND p.started_at < t.started_at
+            ORDER BY p.started_at DESC
+            LIMIT 1
+        ) prev ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT p.details->'profile' AS profile
+            FROM task_logs p
+            WHERE t.details ? 'profile'
+              AND p.task_name = t.task_name AND p.started_at < t.started_at
+              AND p.details->'profile'->>'mode' = t.details->'profile'->>'mode'
+            ORDER BY p.started_at DESC
+            LIMIT 1
+        ) prev_profile ON TRUE
+        {where}
+        ORDER BY t.started_at DESC
+        LIMIT %s
+    """
     
-    rows = cursor.fetchall()
-    cursor.close()
+    with pooled_cursor(cursor_factory=TimedCursor) as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
     
     logs = []
     for row in rows:
-        logs.append({
+        log = {
             'id': row[0],
             'task_name': row[1],
             'started_at': row[2].isoformat() if row[2] else None,
@@ -189,6 +383,21 @@ def get_recent_logs(limit: int = 50, task_name: Optional[str] = None) -> List[Di
             'records_saved': row[8] or 0,
             'error_message': row[9],
             'details': row[10]
-        })
+        }
+        previous = None
+        if row[11] is not None:
+            previous = {
+                'id': row[11],
+                'status': row[12],
+                'duration_seconds': float(row[13]) if row[13] else 0,
+                'records_saved': row[14] or 0,
+                'details': row[15]
+            }
+        log['comparison'] = compare_runs(log, previous, previous_profile=row[16])
+        logs.append(log)
     
     return logs
+
+
+# 异步版本
+get_recent_logs_async = to_async(get_recent_logs)
@@ -0,0 +1,185 @@
+"""
+采集任务的性能剖析（按需开启）
+环境变量 PCRDB_PROFILE=cpu|mem 时，TaskLogger.start() 启动剖析，任务结束时把产物写入 PCRDB_PROFILE_DIR
+（默认项目根目录下 profiles/），Top-N 摘要保存到 task_logs.details['profile']：
+
+- cpu: cProfile，只统计任务所在线程（事件循环、解码与同步入库），产物为 .prof（pstats / snakeviz 可读）
+       和按自身耗时排序的 .txt 报告
+- mem: tracemalloc，在每个阶段（TaskMetrics.phase）第一次结束时和任务结束时拍快照，
+       产物为 .snapshot（tracemalloc.Snapshot.load 可读），可用 Snapshot.compare_to 对比两次运行
+
+开启方式:
+    python cli.py task clan_sync --profile=cpu
+    config/schedule.yaml 中任务配置 profile: "mem"
+
+摘要中的函数 / 代码位置用 "目录/文件:行号" 作为键，不同运行之间可直接对比（见 task_logger.compare_runs）。
+剖析本身有开销（cpu 约 1.5~2 倍，mem 更高），只用于排查。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+PROFILE_ENV = 'PCRDB_PROFILE'
+PROFILE_MODES = ('cpu', 'mem')
+DEFAULT_PROFILE_DIR = Path(__file__).parent.parent.parent.parent / 'profiles'
+# 每个阶段快照在摘要中只保留前几项，任务结束时的快照保留 Top-N
+PHASE_SNAPSHOT_TOP = 5
+MAX_SNAPSHOTS = 20
+
+
+def _top_n() -> int:
+    return int(os.getenv('PCRDB_PROFILE_TOP', '20'))
+
+
+def _location(filename: str, lineno: int, name: Optional[str] = None) -> str:
+    """稳定的代码位置键（不含机器相关的绝对路径）"""
+    if filename == '~':
+        # 内置函数
+        return name or '~'
+    path = Path(filename)
+    location = f"{path.parent.name}/{path.name}:{lineno}"
+    return f"{location}({name})" if name else location
+
+
+class CpuProfiler:
+    """cProfile 剖析"""
+    mode = 'cpu'
+
+    def __init__(self, prefix: Path):
+        self.prefix = prefix
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def phase_end(self, name: str):
+        pass
+
+    def stop(self) -> Dict[str, Any]:
+        self._profile.disable()
+        prof_path = self.prefix.with_suffix('.prof')
+        self._profile.dump_stats(str(prof_path))
+
+        report = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=report)
+        stats.sort_stats('tottime').print_stats(_top_n())
+        report_path = self.prefix.with_suffix('.txt')
+        report_path.write_text(report.getvalue(), encoding='utf-8')
+
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:_top_n()]
+        top = [
+            {
+                'function': _location(*func),
+                'ncalls': nc,
+                'tottime': round(tt, 4),
+                'cumtime': round(ct, 4),
+            }
+            for func, (cc, nc, tt, ct, callers) in rows
+        ]
+        return {
+            'mode': self.mode,
+            'total_seconds': round(stats.total_tt, 3),
+            'artefacts': [str(prof_path), str(report_path)],
+            'top': top,
+        }
+
+
+def _top_lines(snapshot: tracemalloc.Snapshot, limit: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            'location': _location(stat.traceback[0].filename, stat.traceback[0].lineno),
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        }
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+class MemoryProfiler:
+    """tracemalloc 剖析：每个阶段第一次结束时拍一次快照（最多 MAX_SNAPSHOTS 个），任务结束时再拍一次"""
+    mode = 'mem'
+
+    def __init__(self, prefix: Path):
+        self.prefix = prefix
+        self.snapshots: List[Dict[str, Any]] = []
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._started_here = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_here = True
+
+    def phase_end(self, name: str):
+        with self._lock:
+            if name in self._seen or len(self.snapshots) >= MAX_SNAPSHOTS:
+                return
+            self._seen.add(name)
+            self._take(name, PHASE_SNAPSHOT_TOP)
+
+    def _take(self, label: str, limit: int) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        path = Path(f"{self.prefix}_{len(self.snapshots):02d}_{label}.snapshot")
+        snapshot.dump(str(path))
+        current, peak = tracemalloc.get_traced_memory()
+        self.snapshots.append({
+            'phase': label,
+            'traced_mb': round(current / 1024 / 1024, 1),
+            'peak_mb': round(peak / 1024 / 1024, 1),
+            'artefact': str(path),
+            'top': _top_lines(snapshot, limit),
+        })
+        return snapshot
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            final = self._take('end', _top_n())
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_here:
+                tracemalloc.stop()
+        return {
+            'mode': self.mode,
+            'traced_mb': round(current / 1024 / 1024, 1),
+            'peak_mb': round(peak / 1024 / 1024, 1),
+            'snapshots': self.snapshots[:-1],
+            'artefacts': [s['artefact'] for s in self.snapshots],
+            'top': _top_lines(final, _top_n()),
+        }
+
+
+def start_profiler(task_name: str):
+    """
+    按 PCRDB_PROFILE 启动剖析
+
+    Returns:
+        CpuProfiler / MemoryProfiler，未开启或启动失败时返回 None
+    """
+    mode = os.getenv(PROFILE_ENV, '').strip().lower()
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        print(f"未知的剖析模式 {PROFILE_ENV}={mode}（可选: {', '.join(PROFILE_MODES)}），跳过剖析")
+        return None
+
+    directory = Path(os.getenv('PCRDB_PROFILE_DIR') or DEFAULT_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    prefix = directory / f"{task_name}_{datetime.now():%Y%m%d_%H%M%S}"
+    profiler = CpuProfiler(prefix) if mode == 'cpu' else MemoryProfiler(prefix)
+    try:
+        profiler.start()
+    except ValueError as e:
+        # 同一线程已有其他 profiler 在运行
+        print(f"无法启动剖析: {e}")
+        return None
+    print(f"性能剖析已开启 ({mode})，产物目录: {directory}")
+    return profiler
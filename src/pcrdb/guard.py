@@ -0,0 +1,151 @@
+"""
+分析接口的限流与查询保护
+- 按用户 ID 的令牌桶限流：每个接口消耗不同数量的令牌（ENDPOINTS），令牌不足返回 429 + Retry-After
+- 按接口类别设置 Postgres statement_timeout（STATEMENT_TIMEOUTS_MS），单个慢查询不会长期占用连接
+- 客户端断开连接后取消仍在执行的查询（QueryScope.cancel → pg cancel）
+
+限流状态在进程内；supervisor 模式下每个 API worker 各自计数，
+单个用户的实际上限约为 worker 数 × 配额。
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from .auth import get_current_active_user
+from .db.connection import QueryScope, use_query_scope
+
+
+# 每个用户的令牌桶：容量（突发请求数）与每秒补充的令牌数
+BURST = float(os.getenv('PCRDB_RATE_BURST', '60'))
+RATE = float(os.getenv('PCRDB_RATE_PER_SEC', '2'))
+MAX_BUCKETS = 10000
+
+# 接口类别 → statement_timeout（毫秒）
+STATEMENT_TIMEOUTS_MS = {
+    'light': 3000,
+    'search': 5000,
+    'heavy': 15000,
+}
+
+# 接口 → (令牌消耗, 类别)
+ENDPOINTS: Dict[str, Tuple[float, str]] = {
+    'clan_history': (1, 'light'),
+    'clan_members': (1, 'light'),
+    'top_clans': (1, 'light'),
+    'profile_dates': (1, 'light'),
+    'player_history': (1, 'light'),
+    'player_periods': (1, 'light'),
+    'clan_search': (2, 'search'),
+    'player_search': (2, 'search'),
+    'clan_power': (3, 'heavy'),
+    'grand_winning': (3, 'heavy'),
+    'clan_profiles': (5, 'heavy'),
+    'clan_history_batch': (5, 'heavy'),
+    'player_history_batch': (10, 'heavy'),
+}
+
+# 模糊搜索关键字过短时（匹配行数多）的消耗倍数
+SHORT_PATTERN_LENGTH = 2
+SHORT_PATTERN_MULTIPLIER = 3
+
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class RateLimiter:
+    """按 key 的令牌桶（LRU 淘汰长期不活跃的桶，淘汰后等同满桶）"""
+
+    def __init__(self, burst: float = BURST, rate: float = RATE, max_buckets: int = MAX_BUCKETS):
+        self.burst = burst
+        self.rate = rate
+        self.max_buckets = max_buckets
+        self._buckets: 'OrderedDict[int, Tuple[float, float]]' = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+
+    def take(self, key: int, cost: float) -> float:
+        """
+        扣除 cost 个令牌
+
+        Returns:
+            0 表示放行，否则为需要等待的秒数
+        """
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            self.rejected += 1
+            return (cost - tokens) / self.rate
+        self._buckets[key] = (tokens - cost, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> Dict:
+        return {
+            'burst': self.burst,
+            'rate_per_sec': self.rate,
+            'users': len(self._buckets),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
+
+
+# 全局实例
+rate_limiter = RateLimiter()
+
+
+def request_cost(endpoint: str, request: Request) -> float:
+    cost = ENDPOINTS[endpoint][0]
+    name = request.query_params.get('name')
+    if name is not None and len(name.strip()) < SHORT_PATTERN_LENGTH:
+        cost *= SHORT_PATTERN_MULTIPLIER
+    return cost
+
+
+async def _cancel_on_disconnect(request: Request, scope: QueryScope):
+    while True:
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        if await request.is_disconnected():
+            scope.cancel()
+            return
+
+
+def guarded(endpoint: str):
+    """
+    接口依赖：登录校验（激活账号）+ 限流 + 查询保护，返回当前用户
+
+    用法：
+        user: dict = Depends(guarded("player_search"))
+    """
+    timeout_ms = STATEMENT_TIMEOUTS_MS[ENDPOINTS[endpoint][1]]
+
+    async def dependency(request: Request, user: dict = Depends(get_current_active_user)):
+        wait = rate_limiter.take(user["id"], request_cost(endpoint, request))
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="请求过于频繁，请稍后重试",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+        # run_db 会把 contextvar 复制到数据库线程，本请求内借出的连接都受该 scope 约束
+        scope = QueryScope(statement_timeout_ms=timeout_ms)
+        use_query_scope(scope)
+        watcher = asyncio.create_task(_cancel_on_disconnect(request, scope))
+        try:
+            yield user
+        finally:
+            watcher.cancel()
+            use_query_scope(None)
+
+    return dependency
@@ -0,0 +1,217 @@
+"""
+API 服务内存热数据
+两次采集之间数据基本不变，月份列表、档案日期、前排公会、PJJC 胜场榜及其玩家名常驻内存：
+- 服务启动时加载
+- 采集任务成功后 TaskLogger 发出 NOTIFY，监听线程按任务只刷新受影响的部分
+- 未命中（尚未加载或超出缓存范围）时回退到数据库查询
+同时维护各任务的数据版本号，供响应缓存 / ETag 使用（见 response_cache.py）。
+"""
+import select
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .analysis.clan import get_top_clans, get_profile_dates
+from .analysis.grand import MAX_GRAND_GROUP, get_winning_ranking, default_winning_cursor
+from .analysis.player import get_available_periods
+from .db.aio import run_db
+from .db.connection import create_connection, pooled_cursor
+from .db.task_logger import DATA_CHANGED_CHANNEL, get_task_versions
+
+
+# 缓存的 PJJC 胜场榜长度，请求 limit 不超过该值时直接切片返回
+LEADERBOARD_SIZE = 200
+# 只缓存已知分场（0 为全部分场），其他值不进缓存，避免按请求参数无限增长
+LEADERBOARD_GROUPS = frozenset(range(0, MAX_GRAND_GROUP + 1))
+# 缓存的前排公会数量（/api/clan/top_clans 默认值）
+TOP_CLANS_LIMIT = 30
+
+# 任务 → 受影响的缓存部分
+TASK_PARTS = {
+    'clan_sync': ('periods', 'top_clans', 'names'),
+    'clan_summary': ('top_clans',),
+    'player_profile_sync': ('profile_dates', 'names'),
+    'player_profile_sync_monthly': ('profile_dates', 'names'),
+    'grand_sync': ('leaderboards',),
+    # cli.py latest 回填 player_latest 后榜单中的玩家名可能变化
+    'latest_backfill': ('names',),
+}
+ALL_PARTS = ('periods', 'profile_dates', 'top_clans', 'leaderboards', 'versions')
+
+
+class HotState:
+    """
+    内存热数据
+
+    所有缓存值只做整体替换（不原地修改），读路径无需加锁。
+    """
+
+    def __init__(self):
+        self.periods: Optional[List[str]] = None
+        self.profile_dates: Optional[List[str]] = None
+        self.top_clans: Optional[Dict] = None
+        # 分场 → 默认排序的前 LEADERBOARD_SIZE 名（get_winning_ranking 的整页结果）
+        self.leaderboards: Dict[int, Dict] = {}
+        # 任务 → 数据版本（data_versions，跨进程一致）
+        self.versions: Dict[str, int] = {}
+        self.loaded_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+
+    # --- 加载 / 刷新（在线程中执行，阻塞调用） ---
+
+    def _load_periods(self):
+        self.periods = get_available_periods()
+
+    def _load_profile_dates(self):
+        self.profile_dates = get_profile_dates()
+
+    def _load_top_clans(self):
+        result = get_top_clans(limit=TOP_CLANS_LIMIT)
+        self.top_clans = None if 'error' in result else result
+
+    def _load_leaderboards(self):
+        # 只预热全服榜，各分场榜首次请求时加载
+        groups = set(self.leaderboards) | {0}
+        self.leaderboards = {g: get_winning_ranking(g, LEADERBOARD_SIZE) for g in groups}
+
+    def _load_versions(self):
+        self.versions = get_task_versions()
+
+    def _refresh_names(self):
+        """玩家名变更：只更新已缓存榜单中的名字，不重算榜单"""
+        viewer_ids = {row['viewer_id'] for page in self.leaderboards.values() for row in page['rankings']}
+        if not viewer_ids:
+            return
+        with pooled_cursor() as cursor:
+            cursor.execute("""
+                SELECT viewer_id, name FROM player_latest WHERE viewer_id = ANY(%s)
+            """, (list(viewer_ids),))
+            names = {vid: name for vid, name in cursor.fetchall() if name}
+        self.leaderboards = {
+            group: {**page, 'rankings': [
+                dict(row, user_name=names.get(row['viewer_id'], row['user_name'])) for row in page['rankings']
+            ]}
+            for group, page in self.leaderboards.items()
+        }
+
+    def refresh(self, parts=ALL_PARTS):
+        """刷新指定部分（单个部分失败不影响其他部分）"""
+        loaders = {
+            'periods': self._load_periods,
+            'profile_dates': self._load_profile_dates,
+            'top_clans': self._load_top_clans,
+            'leaderboards': self._load_leaderboards,
+            'names': self._refresh_names,
+            'versions': self._load_versions,
+        }
+        with self._refresh_lock:
+            for part in parts:
+                try:
+                    loaders[part]()
+                except Exception as e:
+                    print(f"[hot_state] 刷新 {part} 失败: {e}")
+            self.loaded_at = time.time()
+
+    def refresh_for_task(self, task_name: str):
+        parts = TASK_PARTS.get(task_name, ())
+        if parts:
+            print(f"[hot_state] {task_name} 完成，刷新 {', '.join(parts)}")
+        # 数据先于版本号刷新，版本号变化时缓存数据已是新的
+        self.refresh(parts + ('versions',))
+
+    def data_version(self, tasks: Iterable[str]) -> str:
+        """若干任务的组合数据版本号，任一任务完成后改变"""
+        versions = self.versions
+        return ','.join(str(versions.get(t, 0)) for t in tasks)
+
+    # --- 读取（async 路由使用） ---
+
+    async def get_periods(self) -> List[str]:
+        if self.periods is None:
+            await run_db(self._load_periods)
+        return self.periods
+
+    async def get_profile_dates(self) -> List[str]:
+        if self.profile_dates is None:
+            await run_db(self._load_profile_dates)
+        return self.profile_dates
+
+    async def get_top_clans(self, period: Optional[str] = None, limit: int = TOP_CLANS_LIMIT) -> Optional[Dict]:
+        """最新一期前排公会；其他月份或更大的 limit 返回 None（由调用方查库）"""
+        if limit > TOP_CLANS_LIMIT:
+            return None
+        if self.top_clans is None:
+            await run_db(self._load_top_clans)
+        cached = self.top_clans
+        if cached is None or (period and period != cached['period']):
+            return None
+        return {'period': cached['period'], 'clans': cached['clans'][:limit]}
+
+    async def get_winning_ranking(self, group: int, limit: int) -> Optional[Dict]:
+        """PJJC 胜场榜第一页（默认排序、全部字段）；limit 超出缓存长度或分场未知时返回 None（由调用方查库）"""
+        if limit > LEADERBOARD_SIZE or group not in LEADERBOARD_GROUPS:
+            return None
+        page = self.leaderboards.get(group)
+        if page is None:
+            page = await run_db(get_winning_ranking, group, LEADERBOARD_SIZE)
+            self.leaderboards = {**self.leaderboards, group: page}
+        if limit == LEADERBOARD_SIZE:
+            return page
+        rows = page['rankings']
+        next_cursor = default_winning_cursor(page, rows[limit - 1], limit) if len(rows) > limit else None
+        return {**page, 'rankings': rows[:limit], 'next_cursor': next_cursor}
+
+    # --- LISTEN / NOTIFY ---
+
+    def _listen(self):
+        """监听线程：独立连接 LISTEN，断线后重连并全量刷新（期间可能漏掉通知）"""
+        first = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = create_connection()
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {DATA_CHANGED_CHANNEL}")
+                if not first:
+                    self.refresh()
+                first = False
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    tasks = []
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        if payload not in tasks:
+                            tasks.append(payload)
+                    for task_name in tasks:
+                        self.refresh_for_task(task_name)
+            except Exception as e:
+                print(f"[hot_state] 监听连接异常: {e}，5 秒后重连")
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        """加载全部数据并启动监听线程"""
+        self.refresh()
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name='pcrdb-hot-state', daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._listener:
+            self._listener.join(timeout=10)
+            self._listener = None
+
+
+# 全局实例
+hot_state = HotState()
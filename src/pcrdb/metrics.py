@@ -0,0 +1,164 @@
+"""
+HTTP 请求指标（Prometheus 文本格式）
+MetricsMiddleware 按路由模板（如 /api/clan/members）记录：
+- 请求数（按状态码）、处理中的请求数
+- 耗时、响应体字节数直方图
+- 数据库时间（run_db 线程中的耗时）与其余 Python 时间
+缓存命中率等运行时统计在抓取时由 server.py 作为 gauge 附加。
+
+指标在进程内，开销为每个请求几次 perf_counter 和字典查找；
+supervisor 模式下每次抓取只反映响应该请求的那个 worker。
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db.aio import use_db_timer
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """固定桶直方图（桶内计数，输出时累加）"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> Iterable[str]:
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RouteStats:
+    __slots__ = ('latency', 'size', 'db_seconds', 'python_seconds', 'db_calls')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_seconds = 0.0
+        self.python_seconds = 0.0
+        self.db_calls = 0
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """进程内指标（只在事件循环线程中更新，不加锁）"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.routes: Dict[str, RouteStats] = {}
+
+    def record(self, method: str, route: str, status: int, seconds: float, size: int,
+               db_seconds: float, db_calls: int):
+        self.requests[(method, route, status)] += 1
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        stats.latency.observe(seconds)
+        stats.size.observe(size)
+        stats.db_seconds += db_seconds
+        stats.python_seconds += max(seconds - db_seconds, 0.0)
+        stats.db_calls += db_calls
+
+    def render(self, gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """
+        输出 Prometheus 文本格式
+
+        Args:
+            gauges: 附加的 gauge {指标名: {标签串（如 'cache="response"'）: 值}}
+        """
+        lines: List[str] = [
+            '# TYPE pcrdb_process_start_time_seconds gauge',
+            f'pcrdb_process_start_time_seconds {self.started_at}',
+            '# TYPE pcrdb_http_requests_in_flight gauge',
+            f'pcrdb_http_requests_in_flight {self.in_flight}',
+            '# TYPE pcrdb_http_requests_total counter',
+        ]
+        for (method, route, status), n in sorted(self.requests.items()):
+            lines.append(f'pcrdb_http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {n}')
+
+        routes = sorted(self.routes.items())
+        lines.append('# TYPE pcrdb_http_request_duration_seconds histogram')
+        for route, stats in routes:
+            lines.extend(stats.latency.lines('pcrdb_http_request_duration_seconds', f'route="{_escape(route)}"'))
+        lines.append('# TYPE pcrdb_http_response_size_bytes histogram')
+        for route, stats in routes:
+            lines.extend(stats.size.lines('pcrdb_http_response_size_bytes', f'route="{_escape(route)}"'))
+        for name, attr in (('pcrdb_http_db_seconds_total', 'db_seconds'),
+                           ('pcrdb_http_python_seconds_total', 'python_seconds'),
+                           ('pcrdb_http_db_calls_total', 'db_calls')):
+            lines.append(f'# TYPE {name} counter')
+            for route, stats in routes:
+                lines.append(f'{name}{{route="{_escape(route)}"}} {getattr(stats, attr)}')
+
+        for name, values in (gauges or {}).items():
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in values.items():
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全局实例
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """ASGI 中间件：按路由模板记录请求指标（未匹配路由的请求记为 "unmatched"）"""
+
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        registry = self.registry
+        registry.in_flight += 1
+        timer = use_db_timer()
+        status = 500
+        size = 0
+        start = time.perf_counter()
+
+        async def wrapped_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            registry.in_flight -= 1
+            # 路由匹配后 FastAPI 把 APIRoute 写入 scope["route"]，用模板而不是原始路径避免标签爆炸
+            route = scope.get("route")
+            registry.record(
+                scope["method"], getattr(route, "path", "unmatched"), status,
+                time.perf_counter() - start, size, timer.seconds, timer.calls
+            )
@@ -0,0 +1,151 @@
+"""
+分析接口响应缓存
+按 (接口, 规范化参数) 缓存序列化后的 JSON，缓存项绑定接口所依赖任务的数据版本（见 hot_state.data_version）：
+- ETag 只由缓存键和数据版本计算，客户端带 If-None-Match 重复请求时一次哈希比较即可返回 304
+- 版本未变时直接返回缓存的响应体，不查库、不序列化
+- 相关任务完成后版本号改变，旧缓存项自然失效
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from .hot_state import hot_state
+from .responses import dumps
+
+
+PROFILE_TASKS = ('player_profile_sync', 'player_profile_sync_monthly')
+# cli.py latest / aliases 从历史回填目录表后发出的通知
+LATEST_BACKFILL = 'latest_backfill'
+ALIASES_BACKFILL = 'aliases_backfill'
+
+# 接口 → 数据来源任务
+ENDPOINT_TASKS = {
+    'clan_history': ('clan_sync', 'clan_summary', LATEST_BACKFILL, ALIASES_BACKFILL),
+    'clan_history_batch': ('clan_sync', 'clan_summary'),
+    'clan_search': ('clan_sync', LATEST_BACKFILL, ALIASES_BACKFILL),
+    'clan_members': ('clan_sync', ALIASES_BACKFILL),
+    'clan_profiles': PROFILE_TASKS,
+    'top_clans': ('clan_sync', 'clan_summary'),
+    'profile_dates': PROFILE_TASKS,
+    'clan_power': ('clan_sync', 'clan_summary'),
+    'grand_winning': ('grand_sync', 'clan_sync', LATEST_BACKFILL) + PROFILE_TASKS,
+    'player_history': ('clan_sync',),
+    'player_history_batch': ('clan_sync',),
+    'player_search': ('clan_sync', 'grand_sync', LATEST_BACKFILL, ALIASES_BACKFILL) + PROFILE_TASKS,
+    'player_periods': ('clan_sync',),
+}
+
+# 需要登录的数据，只允许浏览器缓存，且每次使用前须用 ETag 验证
+CACHE_CONTROL = 'private, no-cache'
+
+MAX_ENTRIES = 1024
+# 超过该大小的响应体不缓存（仍返回 ETag）
+MAX_BODY_BYTES = 2 * 1024 * 1024
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """参数规范化：去掉 None、字符串去首尾空白、按名字排序"""
+    items = []
+    for key in sorted(params):
+        value = params[key]
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        items.append((key, value))
+    return urlencode(items)
+
+
+# 压缩中间件给 ETag 加的编码后缀（见 responses.CompressionMiddleware）
+ENCODING_SUFFIXES = ('-gzip"', '-br"')
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 比较（弱比较，忽略 W/ 前缀和编码后缀）"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    for tag in header.split(','):
+        tag = tag.strip().removeprefix('W/')
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU 响应缓存：键 → (数据版本, ETag, 响应体)"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[str, str, bytes]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(key: str, version: str) -> str:
+        digest = hashlib.blake2b(f"{key}|{version}".encode('utf-8'), digest_size=16).hexdigest()
+        return f'"{digest}"'
+
+    def _store(self, key: str, version: str, etag: str, body: bytes):
+        if len(body) > MAX_BODY_BYTES:
+            return
+        self._entries[key] = (version, etag, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def respond(self, request: Request, endpoint: str, params: Dict[str, Any],
+                      compute: Callable[[], Awaitable[Any]]) -> Response:
+        """
+        返回缓存的响应；304 / 缓存命中 / 重新计算
+
+        Args:
+            request: 当前请求（读取 If-None-Match）
+            endpoint: 接口名（ENDPOINT_TASKS 的键）
+            params: 影响结果的全部参数
+            compute: 缓存未命中时计算结果的协程函数
+        """
+        key = f"{endpoint}?{normalize_params(params)}"
+        version = hot_state.data_version(ENDPOINT_TASKS[endpoint])
+        etag = self.etag(key, version)
+        headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+
+        if _etag_matches(request.headers.get('if-none-match'), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            body = entry[2]
+        else:
+            self.misses += 1
+            body = dumps(await compute())
+            self._store(key, version, etag, body)
+
+        return Response(content=body, media_type='application/json', headers=headers)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+
+# 全局实例
+response_cache = ResponseCache()
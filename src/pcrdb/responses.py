@@ -0,0 +1,132 @@
+"""
+JSON 序列化与响应压缩
+- dumps(): orjson 序列化（datetime / date 原生支持，Decimal 与 jsonable_encoder 规则一致）
+- FastJSONResponse: server.py 的默认响应类
+- CompressionMiddleware: 超过 MIN_SIZE 的单块响应按 Accept-Encoding 做 brotli / gzip 压缩
+  （brotli 为可选依赖，未安装时只用 gzip）
+"""
+import gzip
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript")
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        # 与 fastapi.encoders.decimal_encoder 一致：整数值转 int，否则转 float
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为 JSON bytes"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 序列化的 JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def compress(body: bytes, accept_encoding: str):
+    """按 Accept-Encoding 压缩，返回 (编码, 压缩后内容)；不压缩返回 (None, body)"""
+    accepted = {part.split(';')[0].strip() for part in accept_encoding.lower().split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br', brotli.compress(body, quality=BROTLI_QUALITY)
+    if 'gzip' in accepted:
+        return 'gzip', gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return None, body
+
+
+class CompressionMiddleware:
+    """
+    ASGI 压缩中间件
+
+    只处理一次性发送完的响应（JSON 接口）；流式响应、304、已编码的响应原样透传。
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        if not accept_encoding:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def wrapped_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                return await send(message)
+
+            held, start_message = start_message, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._compressible(held, body):
+                await send(held)
+                return await send(message)
+
+            encoding, compressed = compress(body, accept_encoding)
+            if encoding is None:
+                await send(held)
+                return await send(message)
+
+            headers = []
+            for k, v in held.get("headers", []):
+                k = k.lower()
+                if k == b"content-length":
+                    continue
+                if k == b"etag":
+                    # 强 ETag 按编码区分（response_cache 比较时去掉后缀）
+                    v = v[:-1] + b"-" + encoding.encode() + b'"' if v.endswith(b'"') else v
+                headers.append((k, v))
+            headers.append((b"content-encoding", encoding.encode()))
+            headers.append((b"content-length", str(len(compressed)).encode()))
+            headers.append((b"vary", b"Accept-Encoding"))
+            await send({**held, "headers": headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, wrapped_send)
+
+    def _compressible(self, start_message, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start_message["status"] < 200 or start_message["status"] in (204, 304):
+            return False
+        content_type = b""
+        for key, value in start_message.get("headers", []):
+            key = key.lower()
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type":
+                content_type = value.lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
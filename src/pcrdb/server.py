@@ -2,10 +2,13 @@
 pcrdb Web API 服务
 提供公会、玩家、PJJC 数据查询接口
 """
-from fastapi import FastAPI, Query, Depends
+import asyncio
+from fastapi import FastAPI, Query, Depends, Request, Response
+import psycopg2.extensions
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import time
 import sys
 from pathlib import Path
 
@@ -15,23 +18,56 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from dotenv import load_dotenv
 load_dotenv(Path(__file__).parent.parent.parent / '.env')
 
-from src.pcrdb.analysis.clan import get_clan_history, get_clan_power_ranking, get_clan_members, get_top_clans, get_top_clan_profiles
-from src.pcrdb.analysis.grand import get_winning_ranking
-from src.pcrdb.analysis.player import get_player_clan_history, search_players_by_name, get_available_periods
+from src.pcrdb.analysis.clan import (
+    get_clan_history_async, get_clan_history_batch_async, get_clan_power_ranking_async, get_clan_members_async,
+    get_top_clans_async, get_top_clan_profiles_async,
+    search_clans_by_name_async
+)
+from src.pcrdb.analysis.grand import MAX_GRAND_GROUP, get_winning_ranking_async
+from src.pcrdb.analysis.paging import MAX_PAGE_SIZE
+from src.pcrdb.analysis.player import (
+    get_player_clan_history_async, get_player_clan_history_batch_async, search_players_by_name_async
+)
 from src.pcrdb.auth import (
-    authenticate_user, create_user, create_access_token,
-    get_current_user, get_user_by_username, get_user_by_qq,
-    log_api_call, verify_password, update_password,
-    get_current_active_user, get_current_admin_user, get_all_users, approve_user_status,
-    get_user_api_stats, get_user_api_details
+    authenticate_user_async, create_user_async, create_access_token,
+    get_current_user, get_user_by_username_async, get_user_by_qq_async,
+    log_api_call, verify_password_async, update_password_async,
+    get_current_admin_user, get_all_users_async, approve_user_status_async,
+    get_user_api_stats_async, get_user_api_details_async,
+    hash_latency, login_latency, shutdown_hash_executor, user_cache
 )
+from src.pcrdb.db.aio import run_db, shutdown_db_executor
+from src.pcrdb.db.connection import close_pool
+from src.pcrdb.db.slow_queries import query_stats
+from src.pcrdb.api_log import api_log_buffer
+from src.pcrdb.guard import guarded, rate_limiter
+from src.pcrdb.hot_state import hot_state
+from src.pcrdb.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, metrics
+from src.pcrdb.response_cache import response_cache
+from src.pcrdb.responses import CompressionMiddleware, FastJSONResponse
 
 app = FastAPI(
     title="pcrdb API",
     description="公主连结渠道服数据查询 API",
-    version="1.0.1"
+    version="1.0.1",
+    default_response_class=FastJSONResponse
 )
 
+# 超过 1KB 的 JSON 响应按 Accept-Encoding 压缩（brotli / gzip）
+app.add_middleware(CompressionMiddleware)
+
+# 请求指标（在压缩中间件外层，响应大小为实际传输字节数），见 /metrics
+app.add_middleware(MetricsMiddleware)
+
+# 公会历史最多返回的期数（limit 参数上限）
+MAX_HISTORY_PERIODS = 120
+
+
+@app.exception_handler(psycopg2.extensions.QueryCanceledError)
+async def query_canceled_handler(request: Request, exc: psycopg2.extensions.QueryCanceledError):
+    """查询超过 statement_timeout（或客户端已断开被取消）"""
+    return FastJSONResponse(status_code=503, content={"error": "查询超时，请缩小查询范围后重试"})
+
 # CORS 配置 - 允许本地前端访问
 app.add_middleware(
     CORSMiddleware,
@@ -47,6 +83,23 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup_background():
+    """加载内存热数据并开始监听数据变更通知，启动调用日志后台写入"""
+    api_log_buffer.start()
+    await run_db(hot_state.start)
+
+
+@app.on_event("shutdown")
+async def shutdown_db():
+    """写完调用日志，关闭数据库线程池和连接池（会阻塞的步骤放到线程中执行，不卡住事件循环）"""
+    await asyncio.to_thread(hot_state.stop)
+    await api_log_buffer.stop()
+    await asyncio.to_thread(shutdown_hash_executor)
+    await asyncio.to_thread(shutdown_db_executor)
+    await asyncio.to_thread(close_pool)
+
+
 @app.get("/")
 async def root():
     """版本信息"""
@@ -82,13 +135,13 @@ async def register(req: RegisterRequest):
     if not req.qq_number.isdigit() or len(req.qq_number) < 5:
         return {"error": "请输入有效的 QQ 号"}
     
-    if get_user_by_username(req.username):
+    if await get_user_by_username_async(req.username):
         return {"error": "用户名已存在"}
     
-    if get_user_by_qq(req.qq_number):
+    if await get_user_by_qq_async(req.qq_number):
         return {"error": "该 QQ 号已注册"}
     
-    user = create_user(req.username, req.password, req.qq_number)
+    user = await create_user_async(req.username, req.password, req.qq_number)
     token = create_access_token({"sub": user["username"]})
     return {
         "success": True, 
@@ -102,7 +155,11 @@ async def register(req: RegisterRequest):
 @app.post("/api/auth/login")
 async def login(req: LoginRequest):
     """用户登录（支持用户名或 QQ 号）"""
-    user = authenticate_user(req.login_id, req.password)
+    start = time.perf_counter()
+    try:
+        user = await authenticate_user_async(req.login_id, req.password)
+    finally:
+        login_latency.record(time.perf_counter() - start)
     if not user:
         return {"error": "用户名/QQ号或密码错误"}
     
@@ -120,13 +177,13 @@ async def login(req: LoginRequest):
 async def change_password(req: ChangePasswordRequest, user: dict = Depends(get_current_user)):
     """修改密码（需要登录）"""
     # 验证旧密码
-    if not verify_password(req.old_password, user["password_hash"]):
+    if not await verify_password_async(req.old_password, user["password_hash"]):
         return {"error": "原密码错误"}
     
     if len(req.new_password) < 6:
         return {"error": "新密码至少 6 位"}
     
-    if update_password(user["id"], req.new_password):
+    if await update_password_async(user["id"], req.new_password):
         return {"success": True, "message": "密码修改成功"}
     else:
         return {"error": "密码修改失败"}
@@ -149,21 +206,43 @@ async def get_me(user: dict = Depends(get_current_user)):
 @app.get("/api/admin/users")
 async def admin_get_users(user: dict = Depends(get_current_admin_user)):
     """获取所有用户列表"""
-    return {"users": get_all_users()}
+    return {"users": await get_all_users_async()}
 
 
 @app.post("/api/admin/approve/{user_id}")
 async def admin_approve_user(user_id: int, user: dict = Depends(get_current_admin_user)):
     """批准用户"""
-    if approve_user_status(user_id):
+    if await approve_user_status_async(user_id):
         return {"success": True}
     return {"error": "操作失败"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint(user: dict = Depends(get_current_admin_user)):
+    """Prometheus 指标（管理员）"""
+    caches = {
+        "response": response_cache.stats(),
+        "user": user_cache.stats(),
+        "clan_battle": clan_battle.stats(),
+    }
+    gauges = {
+        "pcrdb_cache_hits": {f'cache="{name}"': c["hits"] for name, c in caches.items()},
+        "pcrdb_cache_misses": {f'cache="{name}"': c["misses"] for name, c in caches.items()},
+        "pcrdb_cache_hit_ratio": {
+            f'cache="{name}"': c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0
+            for name, c in caches.items()
+        },
+        "pcrdb_response_cache_not_modified": {"": response_cache.not_modified},
+        "pcrdb_rate_limit_rejected": {"": rate_limiter.rejected},
+        "pcrdb_api_log_dropped": {"": api_log_buffer.dropped},
+    }
+    return Response(content=metrics.render(gauges), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/api/admin/api_stats")
 async def admin_api_stats(user: dict = Depends(get_current_admin_user)):
     """获取所有用户 API 调用统计"""
-    stats = get_user_api_stats()
+    stats = await get_user_api_stats_async()
     return {
         "stats": [
             {
@@ -174,7 +253,13 @@ async def admin_api_stats(user: dict = Depends(get_current_admin_user)):
                 "last_call_at": s["last_call_at"].isoformat() if s["last_call_at"] else None
             }
             for s in stats
-        ]
+        ],
+        "log_buffer": api_log_buffer.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "auth_latency": {
+            "login": login_latency.snapshot(),
+            "password_hash": hash_latency.snapshot()
+        }
     }
 
 
@@ -185,7 +270,7 @@ async def admin_api_details(
     user: dict = Depends(get_current_admin_user)
 ):
     """获取指定用户 API 调用详情"""
-    details = get_user_api_details(user_id, limit)
+    details = await get_user_api_details_async(user_id, limit)
     return {
         "details": [
             {
@@ -205,123 +290,249 @@ async def admin_task_logs(
     user: dict = Depends(get_current_admin_user)
 ):
     """获取定时任务执行日志"""
-    from src.pcrdb.db.task_logger import get_recent_logs
-    logs = get_recent_logs(limit=limit, task_name=task_name)
+    from src.pcrdb.db.task_logger import get_recent_logs_async
+    logs = await get_recent_logs_async(limit=limit, task_name=task_name)
     return {"logs": logs}
 
+
+@app.get("/api/admin/slow_queries")
+async def admin_slow_queries(
+    order: str = Query("total", description="排序：total / p95 / max / calls"),
+    limit: int = Query(20, ge=1, le=200, description="返回数量"),
+    user: dict = Depends(get_current_admin_user)
+):
+    """按 SQL 指纹汇总的查询耗时排行（本进程），慢查询附 EXPLAIN (ANALYZE, BUFFERS) 样本"""
+    return {"queries": query_stats.top(order=order, limit=limit), **query_stats.stats()}
+
 @app.get("/api/clan/history")
 async def api_clan_history(
+    request: Request,
     clan_id: Optional[int] = Query(None, description="公会 ID"),
     clan_name: Optional[str] = Query(None, description="公会名"),
-    limit: int = 0,
-    user: dict = Depends(get_current_active_user)
+    limit: int = Query(0, ge=0, le=MAX_HISTORY_PERIODS, description="返回期数，0 为全部"),
+    user: dict = Depends(guarded("clan_history"))
 ):
     """获取公会历史排名（需要激活账号）"""
     log_api_call(user["id"], "clan_history", {"clan_id": clan_id, "clan_name": clan_name})
     if not clan_id and not clan_name:
         return {"error": "请提供 clan_id 或 clan_name"}
     
-    return get_clan_history(clan_id=clan_id, clan_name=clan_name, limit=limit)
+    return await response_cache.respond(
+        request, "clan_history", {"clan_id": clan_id, "clan_name": clan_name, "limit": limit},
+        lambda: get_clan_history_async(clan_id=clan_id, clan_name=clan_name, limit=limit)
+    )
+
+
+def parse_id_list(raw: str) -> Optional[List[int]]:
+    """解析逗号分隔的 ID 列表（批量接口），去重排序；格式错误返回 None"""
+    try:
+        return sorted({int(part) for part in raw.split(',') if part.strip()})
+    except ValueError:
+        return None
+
+
+@app.get("/api/clan/history/batch")
+async def api_clan_history_batch(
+    request: Request,
+    clan_ids: str = Query(..., description="逗号分隔的公会 ID（最多 100 个）"),
+    limit: int = Query(0, ge=0, le=MAX_HISTORY_PERIODS, description="每个公会返回的期数，0 为全部"),
+    user: dict = Depends(guarded("clan_history_batch"))
+):
+    """批量获取公会历史排名，返回 {clans: {clan_id: ...}}（需要激活账号）"""
+    ids = parse_id_list(clan_ids)
+    if ids is None:
+        return {"error": "clan_ids 应为逗号分隔的整数"}
+    log_api_call(user["id"], "clan_history_batch", {"clan_ids": len(ids), "limit": limit})
+    return await response_cache.respond(
+        request, "clan_history_batch", {"clan_ids": ",".join(map(str, ids)), "limit": limit},
+        lambda: get_clan_history_batch_async(clan_ids=ids, limit=limit)
+    )
+
+
+@app.get("/api/clan/search")
+async def api_clan_search(
+    request: Request,
+    name: str = Query(..., description="公会名（模糊匹配，含曾用名）"),
+    limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    offset: int = Query(0, ge=0, le=10000, description="分页偏移"),
+    user: dict = Depends(guarded("clan_search"))
+):
+    """搜索公会（需要激活账号）"""
+    log_api_call(user["id"], "clan_search", {"name": name, "limit": limit, "offset": offset})
+    return await response_cache.respond(
+        request, "clan_search", {"name": name, "limit": limit, "offset": offset},
+        lambda: search_clans_by_name_async(name_pattern=name, limit=limit, offset=offset)
+    )
 
 
 @app.get("/api/clan/members")
 async def api_clan_members(
+    request: Request,
     clan_id: Optional[int] = Query(None, description="公会 ID"),
     clan_name: Optional[str] = Query(None, description="公会名"),
     period: Optional[str] = Query(None, description="月份 YYYY-MM"),
-    user: dict = Depends(get_current_active_user)
+    user: dict = Depends(guarded("clan_members"))
 ):
     """获取公会成员列表（需要激活账号）"""
     log_api_call(user["id"], "clan_members", {"clan_id": clan_id, "clan_name": clan_name, "period": period})
-    return get_clan_members(clan_id=clan_id, clan_name=clan_name, period=period)
+    return await response_cache.respond(
+        request, "clan_members", {"clan_id": clan_id, "clan_name": clan_name, "period": period},
+        lambda: get_clan_members_async(clan_id=clan_id, clan_name=clan_name, period=period)
+    )
 
 
 @app.get("/api/clan/profiles")
 async def api_clan_profiles(
+    request: Request,
     date: Optional[str] = Query(None, description="日期 YYYY-MM-DD"),
     clan_id: Optional[int] = Query(None, description="公会 ID"),
-    user: dict = Depends(get_current_active_user)
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE, description="每页数量（最多 1000）"),
+    sort: Optional[str] = Query(None, description="排序字段，'-' 前缀倒序"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，默认全部"),
+    user: dict = Depends(guarded("clan_profiles"))
 ):
     """获取前排公会成员详细资料（需要激活账号）"""
-    log_api_call(user["id"], "clan_profiles", {"date": date, "clan_id": clan_id})
-    return get_top_clan_profiles(date=date, clan_id=clan_id)
+    params = {"date": date, "clan_id": clan_id, "limit": limit, "sort": sort, "cursor": cursor, "fields": fields}
+    log_api_call(user["id"], "clan_profiles", params)
+    return await response_cache.respond(
+        request, "clan_profiles", params,
+        lambda: get_top_clan_profiles_async(
+            date=date, clan_id=clan_id, limit=limit, sort=sort, cursor=cursor, fields=fields
+        )
+    )
 
 
 @app.get("/api/clan/top_clans")
 async def api_top_clans(
+    request: Request,
     period: Optional[str] = Query(None, description="月份 YYYY-MM"),
-    user: dict = Depends(get_current_active_user)
+    user: dict = Depends(guarded("top_clans"))
 ):
     """获取前30公会列表（需要激活账号）"""
     log_api_call(user["id"], "top_clans", {"period": period})
-    return get_top_clans(period=period)
+
+    async def compute():
+        cached = await hot_state.get_top_clans(period=period)
+        if cached is not None:
+            return cached
+        return await get_top_clans_async(period=period)
+
+    return await response_cache.respond(request, "top_clans", {"period": period}, compute)
 
 
 @app.get("/api/clan/profile_dates")
 async def api_profile_dates(
-    user: dict = Depends(get_current_active_user)
+    request: Request,
+    user: dict = Depends(guarded("profile_dates"))
 ):
     """获取可用的 profile 日期列表"""
-    from src.pcrdb.db.connection import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT DISTINCT to_char(collected_at, 'YYYY-MM-DD') as date
-        FROM player_profile_snapshots
-        ORDER BY date DESC
-    """)
-    rows = cursor.fetchall()
-    return [row[0] for row in rows]
+    return await response_cache.respond(request, "profile_dates", {}, hot_state.get_profile_dates)
 
 
 @app.get("/api/clan/power_ranking")
 async def api_clan_power_ranking(
-    user: dict = Depends(get_current_active_user)
+    request: Request,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="每页数量（最多 1000）"),
+    sort: Optional[str] = Query(None, description="排序字段，'-' 前缀倒序"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，默认全部"),
+    user: dict = Depends(guarded("clan_power"))
 ):
     """获取公会战力/人数排名（需要激活账号）"""
-    log_api_call(user["id"], "clan_power", {})
-    return get_clan_power_ranking()
+    params = {"limit": limit, "sort": sort, "cursor": cursor, "fields": fields}
+    log_api_call(user["id"], "clan_power", params)
+    return await response_cache.respond(
+        request, "clan_power", params,
+        lambda: get_clan_power_ranking_async(limit=limit, sort=sort, cursor=cursor, fields=fields)
+    )
 
 
 @app.get("/api/grand/winning")
 async def api_grand_winning(
-    group: int = Query(0, description="分场 (1-10)"),
-    limit: int = Query(50, description="返回数量"),
-    user: dict = Depends(get_current_active_user)
+    request: Request,
+    group: int = Query(0, ge=0, le=MAX_GRAND_GROUP, description="分场 (1-10)，0 为全部分场"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="每页数量（最多 1000）"),
+    sort: Optional[str] = Query(None, description="排序字段，'-' 前缀倒序"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，默认全部"),
+    user: dict = Depends(guarded("grand_winning"))
 ):
     """获取 PJJC 胜场排名（需要激活账号）"""
-    log_api_call(user["id"], "grand_winning", {"group": group, "limit": limit})
-    return get_winning_ranking(group=group, limit=limit)
+    params = {"group": group, "limit": limit, "sort": sort, "cursor": cursor, "fields": fields}
+    log_api_call(user["id"], "grand_winning", params)
+
+    async def compute():
+        # 内存中只有默认排序的第一页
+        if sort is None and cursor is None and fields is None and limit > 0:
+            cached = await hot_state.get_winning_ranking(group, limit)
+            if cached is not None:
+                return cached
+        return await get_winning_ranking_async(group=group, limit=limit, sort=sort, cursor=cursor, fields=fields)
+
+    return await response_cache.respond(request, "grand_winning", params, compute)
 
 
 @app.get("/api/player/history")
 async def api_player_history(
+    request: Request,
     viewer_id: int = Query(..., description="玩家 ViewerId"),
-    user: dict = Depends(get_current_active_user)
+    user: dict = Depends(guarded("player_history"))
 ):
     """获取玩家公会历史（需要激活账号）"""
     log_api_call(user["id"], "player_history", {"viewer_id": viewer_id})
-    return get_player_clan_history(viewer_id=viewer_id)
+    return await response_cache.respond(
+        request, "player_history", {"viewer_id": viewer_id},
+        lambda: get_player_clan_history_async(viewer_id=viewer_id)
+    )
+
+
+@app.get("/api/player/history/batch")
+async def api_player_history_batch(
+    request: Request,
+    viewer_ids: str = Query(..., description="逗号分隔的玩家 ViewerId（最多 100 个）"),
+    user: dict = Depends(guarded("player_history_batch"))
+):
+    """批量获取玩家公会历史，返回 {players: {viewer_id: ...}}（需要激活账号）"""
+    ids = parse_id_list(viewer_ids)
+    if ids is None:
+        return {"error": "viewer_ids 应为逗号分隔的整数"}
+    log_api_call(user["id"], "player_history_batch", {"viewer_ids": len(ids)})
+    return await response_cache.respond(
+        request, "player_history_batch", {"viewer_ids": ",".join(map(str, ids))},
+        lambda: get_player_clan_history_batch_async(viewer_ids=ids)
+    )
 
 
 @app.get("/api/player/search")
 async def api_player_search(
-    name: str = Query(..., description="玩家名（模糊匹配）"),
-    period: Optional[str] = Query(None, description="月份 YYYY-MM"),
-    limit: int = Query(50, description="返回数量"),
-    user: dict = Depends(get_current_active_user)
+    request: Request,
+    name: str = Query(..., description="玩家名（模糊匹配，含曾用名）"),
+    period: Optional[str] = Query(None, description="月份 YYYY-MM，不传为当前状态"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="每页数量（最多 1000）"),
+    sort: Optional[str] = Query(None, description="排序字段，'-' 前缀倒序"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，默认全部"),
+    user: dict = Depends(guarded("player_search"))
 ):
     """搜索玩家（需要激活账号）"""
-    log_api_call(user["id"], "player_search", {"name": name, "period": period, "limit": limit})
-    return search_players_by_name(name_pattern=name, period=period, limit=limit)
+    params = {"name": name, "period": period, "limit": limit, "sort": sort, "cursor": cursor, "fields": fields}
+    log_api_call(user["id"], "player_search", params)
+    return await response_cache.respond(
+        request, "player_search", params,
+        lambda: search_players_by_name_async(
+            name_pattern=name, period=period, limit=limit, sort=sort, cursor=cursor, fields=fields
+        )
+    )
 
 
 @app.get("/api/player/periods")
 async def api_player_periods(
-    user: dict = Depends(get_current_active_user)
+    request: Request,
+    user: dict = Depends(guarded("player_periods"))
 ):
     """获取有玩家数据的月份列表（需要激活账号）"""
-    return get_available_periods()
+    return await response_cache.respond(request, "player_periods", {}, hot_state.get_periods)
 
 
 
@@ -329,43 +540,54 @@ async def api_player_periods(
 
 # === 会战 API 代理（解决跨域问题）===
 import httpx
-from fastapi import Request, Response
 
 import os
 
+from src.pcrdb.clan_battle_api import ClanBattleClient, UpstreamError
+
 CLAN_BATTLE_API = os.environ["CLAN_BATTLE_API_URL"]
 
+# 应用生命周期内共用的上游客户端
+clan_battle = ClanBattleClient(CLAN_BATTLE_API)
+
+
+@app.on_event("shutdown")
+async def shutdown_clan_battle():
+    """关闭上游连接池"""
+    await clan_battle.aclose()
+
+
+async def proxy_call(call):
+    """上游错误统一转为 502，不把异常抛给客户端"""
+    try:
+        return await call
+    except UpstreamError as e:
+        return FastJSONResponse({"error": str(e)}, status_code=502)
+    except httpx.HTTPError as e:
+        return FastJSONResponse({"error": f"上游请求失败: {e.__class__.__name__}"}, status_code=502)
+
 
 @app.get("/proxy/current/getalltime/qd")
 async def proxy_current_time():
     """代理：获取当期会战时间点"""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{CLAN_BATTLE_API}/current/getalltime/qd")
-        return resp.json()
+    return await proxy_call(clan_battle.get("/current/getalltime/qd"))
 
 
 @app.get("/proxy/history/getalltime/qd")
 async def proxy_history_time():
     """代理：获取历史会战月份"""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{CLAN_BATTLE_API}/history/getalltime/qd")
-        return resp.json()
+    return await proxy_call(clan_battle.get("/history/getalltime/qd"))
 
 
 @app.post("/proxy/search")
 async def proxy_search(request: Request):
     """代理：搜索公会排名"""
     body = await request.json()
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(f"{CLAN_BATTLE_API}/search", json=body)
-        return resp.json()
+    return await proxy_call(clan_battle.post("/search", body))
 
 
 @app.post("/proxy/search/scoreline")
 async def proxy_scoreline(request: Request):
     """代理：查档线"""
     body = await request.json()
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(f"{CLAN_BATTLE_API}/search/scoreline", json=body)
-        return resp.json()
-
+    return await proxy_call(clan_battle.post("/search/scoreline", body))
@@ -5,8 +5,7 @@ JJC 防守阵容采集任务
 import time
 import asyncio
 import os
-from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 import sys
 from pathlib import Path
@@ -14,10 +13,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from api.endpoints import PCRApi, create_client
 from db.connection import get_accounts_by_group, insert_snapshots_batch
+from db.collection_runs import CollectionRun
+from db.task_logger import TaskMetrics
 from psycopg2.extras import Json
 
-# 用于统计实际获取的记录数
-_fetch_counter = {'count': 0}
+# 用于统计实际获取 / 入库的记录数
+_fetch_counter = {'count': 0, 'saved': 0}
+# 本次采集运行（各分场快照共用同一 collected_at）
+_run: Optional[CollectionRun] = None
+# 分阶段计时 / 计数（TaskLogger.metrics）
+_metrics = TaskMetrics()
 
 
 async def query_and_save_deck(client: PCRApi, group: int, pages: int = 2):
@@ -26,7 +31,9 @@ async def query_and_save_deck(client: PCRApi, group: int, pages: int = 2):
     
     for page in range(1, pages + 1):
         try:
-            result = await client.query_arena_ranking(page)
+            _metrics.count('pages')
+            with _metrics.phase('fetch'):
+                result = await client.query_arena_ranking(page)
             ranking = result.get('ranking', [])
             
             # 过滤 NPC (vid <= 1000000000 通常是 NPC)
@@ -39,6 +46,7 @@ async def query_and_save_deck(client: PCRApi, group: int, pages: int = 2):
                 print(f"第 {group} 组第 {page} 页完成")
                 
         except Exception as e:
+            _metrics.count('page_errors')
             print(f"查询第 {group} 组第 {page} 页失败: {e}")
             
     if all_users:
@@ -50,27 +58,29 @@ def insert_deck_batch(user_list: List[Dict], group: int):
     """批量插入防守阵容数据"""
     global _fetch_counter
     records = []
-    now = datetime.now()
     
-    for user in user_list:
-        # 提取阵容: 紧凑格式 [id, rarity, level, power]
-        arena_deck = user.get('arena_deck', [])
-        deck_compact = [
-            [u['id'], u.get('unit_rarity', 0), u.get('unit_level', 0), u.get('power', 0)]
-            for u in arena_deck
-        ] if arena_deck else []
+    with _metrics.phase('decode'):
+        for user in user_list:
+            # 提取阵容: 紧凑格式 [id, rarity, level, power]
+            arena_deck = user.get('arena_deck', [])
+            deck_compact = [
+                [u['id'], u.get('unit_rarity', 0), u.get('unit_level', 0), u.get('power', 0)]
+                for u in arena_deck
+            ] if arena_deck else []
         
-        record = {
-            'viewer_id': user['viewer_id'],
-            'team_level': user.get('team_level', 0),
-            'arena_group': group,
-            'arena_rank': user.get('rank', 0),
-            'arena_deck': Json(deck_compact)
-        }
-        records.append(record)
+            record = {
+                'viewer_id': user['viewer_id'],
+                'team_level': user.get('team_level', 0),
+                'arena_group': group,
+                'arena_rank': user.get('rank', 0),
+                'arena_deck': Json(deck_compact)
+            }
+            records.append(record)
     
     if records:
-        insert_snapshots_batch('arena_deck_snapshots', records, collected_at=now)
+        with _metrics.phase('db_insert'):
+            _fetch_counter['saved'] += insert_snapshots_batch('arena_deck_snapshots', records,
+                                                             collected_at=_run.collected_at, run_id=_run.id)
         _fetch_counter['count'] += len(records)
 
 
@@ -95,10 +105,12 @@ async def run_async():
         }
         
         try:
-            client = await create_client(acc_dict)
+            with _metrics.phase('login'):
+                client = await create_client(acc_dict)
             task = asyncio.create_task(query_and_save_deck(client, group_id))
             tasks.append(task)
         except Exception as e:
+            _metrics.count('login_failures')
             print(f"分场 {group_id} (账号 {account.uid}) 初始化失败: {e}")
     
     if tasks:
@@ -108,14 +120,14 @@ async def run_async():
 def run():
     """运行 JJC 防守阵容采集任务"""
     from db.task_logger import TaskLogger
-    global _fetch_counter
+    global _fetch_counter, _run, _metrics
     
     print("=" * 60)
     print("JJC 防守阵容采集任务 (PostgreSQL)")
     print("=" * 60)
     
     # 重置计数器
-    _fetch_counter = {'count': 0}
+    _fetch_counter = {'count': 0, 'saved': 0}
     
     # 获取分场数以计算预期获取数
     accounts_map = get_accounts_by_group('arena')
@@ -129,6 +141,8 @@ def run():
         records_expected=records_expected,
         details={'groups': list(accounts_map.keys()), 'pages_per_group': pages_per_group}
     )
+    _run = task_logger.run
+    _metrics = task_logger.metrics
     
     if os.name == 'nt':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -144,9 +158,10 @@ def run():
         
         elapsed = time.time() - start
         print(f"任务完成，耗时 {elapsed:.2f} 秒")
-        task_logger.finish_success(records_fetched=_fetch_counter['count'])
+        task_logger.finish_success(records_fetched=_fetch_counter['count'], records_saved=_fetch_counter['saved'])
     except Exception as e:
-        task_logger.finish_failed(str(e), records_fetched=_fetch_counter['count'])
+        task_logger.finish_failed(str(e), records_fetched=_fetch_counter['count'],
+                                  records_saved=_fetch_counter['saved'])
         raise
 
 
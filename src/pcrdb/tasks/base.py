@@ -15,6 +15,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from api.endpoints import PCRApi, create_client
 from db.connection import get_accounts, Account
+from db.task_logger import TaskMetrics
 
 
 class TaskQueue:
@@ -29,7 +30,8 @@ class TaskQueue:
         data_processor: Callable[[Dict], Any],
         pg_inserter: Callable[[List[Dict]], None],
         sync_num: int = 10,
-        batch_size: int = 30
+        batch_size: int = 30,
+        metrics: Optional[TaskMetrics] = None
     ):
         """
         初始化任务队列
@@ -40,6 +42,7 @@ class TaskQueue:
             pg_inserter: PostgreSQL 插入函数 (接收 list of dict)
             sync_num: 并发客户端数量 (最大)
             batch_size: 每批处理数量
+            metrics: 分阶段计时 / 计数（通常为 TaskLogger.metrics）
         """
         self.query_list = query_list
         # 去重query_list，防止重复查询
@@ -50,6 +53,7 @@ class TaskQueue:
         self.pg_inserter = pg_inserter
         self.sync_num = sync_num
         self.batch_size = batch_size
+        self.metrics = metrics or TaskMetrics()
         
         # 自动判断查询类型：viewer_id > 1万亿
         self.query_type = 'profile' if self.query_list and self.query_list[0] > 1000000000000 else 'clan'
@@ -89,11 +93,15 @@ class TaskQueue:
     async def _worker(self, account_dict: Dict, client_index: int):
         """单个客户端工作协程"""
         
+        metrics = self.metrics
+
         # 1. 登录
         client = None
         try:
-            client = await create_client(account_dict)
+            with metrics.phase('login'):
+                client = await create_client(account_dict)
         except Exception as e:
+            metrics.count('login_failures')
             return
 
         # 2. 消费队列
@@ -116,20 +124,28 @@ class TaskQueue:
             for query_id in batch:
                 success = False
                 for retry in range(4):
+                    if retry:
+                        metrics.count('retries')
                     try:
-                        if self.query_type == 'clan':
-                            result = await client.query_clan(query_id)
-                        else:
-                            result = await client.query_profile(query_id)
+                        metrics.count('queries')
+                        # 重试的请求单独计时（retry_fetch），即重试浪费的时间
+                        with metrics.phase('retry_fetch' if retry else 'fetch'):
+                            if self.query_type == 'clan':
+                                result = await client.query_clan(query_id)
+                            else:
+                                result = await client.query_profile(query_id)
                         
-                        processed = self.data_processor(result)
+                        with metrics.phase('decode'):
+                            processed = self.data_processor(result)
                         if processed:
                             data_batch.append(processed)
                             success = True
                             break
                         else:
+                            metrics.count('empty_results')
                             print(f"\n[DEBUG] Processed returned None for {query_id}")
                     except Exception as e:
+                        metrics.count('query_errors')
                         print(f"\n[DEBUG] Query error for {query_id}: {e}")
                     
                 if not success and retry < 3:
@@ -139,6 +155,8 @@ class TaskQueue:
                          await client.login()
                      except Exception as e:
                          pass
+                if not success:
+                    metrics.count('failed_queries')
                 
                 self.processed_count += 1
                 self.queue.task_done()
@@ -146,9 +164,11 @@ class TaskQueue:
             if self.pg_inserter and data_batch:
                 try:
                     print(f"\n[DEBUG] Inserting {len(data_batch)} records...")
-                    self.pg_inserter(data_batch)
+                    with metrics.phase('db_insert'):
+                        self.pg_inserter(data_batch)
                     print(f"[DEBUG] Insert done.")
                 except Exception as e:
+                    metrics.count('insert_errors')
                     print(f"\nDB Error: {e}")
 
     async def _run_async(self):
@@ -0,0 +1,176 @@
+"""
+公会期间汇总任务
+clan_sync 完成后按月聚合 clan_snapshots / player_clan_snapshots，写入 clan_period_summary。
+公会历史、战力排名、排名前列公会等查询直接读取汇总表，不再扫描快照表。
+"""
+import time
+from datetime import timedelta
+from typing import List
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db.connection import pooled_connection
+from db.collection_runs import CLAN_TASKS, CollectionRun, get_periods, period_range
+from db.task_logger import notify_data_changed
+
+
+# 每个公会取该月最新一条快照；成员数/战力取该月每个玩家最新一条快照按公会聚合
+SUMMARY_SQL = """
+    INSERT INTO clan_period_summary (
+        clan_id, period, run_id, collected_at, clan_name, leader_viewer_id, leader_name,
+        member_num, current_period_ranking, grade_rank,
+        member_count, total_power, avg_power, exist, updated_at
+    )
+    SELECT
+        c.clan_id, %(period)s, c.run_id, c.collected_at, c.clan_name, c.leader_viewer_id, c.leader_name,
+        c.member_num, c.current_period_ranking, c.grade_rank,
+        COALESCE(m.member_count, 0), COALESCE(m.total_power, 0), COALESCE(m.avg_power, 0),
+        c.exist, NOW()
+    FROM (
+        SELECT DISTINCT ON (clan_id) *
+        FROM clan_snapshots
+        WHERE collected_at >= %(start)s AND collected_at < %(end)s
+        ORDER BY clan_id, collected_at DESC
+    ) c
+    LEFT JOIN (
+        SELECT
+            join_clan_id,
+            COUNT(*) as member_count,
+            SUM(total_power) as total_power,
+            ROUND(AVG(total_power)) as avg_power
+        FROM (
+            SELECT DISTINCT ON (viewer_id) viewer_id, join_clan_id, total_power
+            FROM player_clan_snapshots
+            WHERE collected_at >= %(start)s AND collected_at < %(end)s
+              AND join_clan_id IS NOT NULL
+            ORDER BY viewer_id, collected_at DESC
+        ) latest
+        WHERE total_power > 0
+        GROUP BY join_clan_id
+    ) m ON m.join_clan_id = c.clan_id
+    ON CONFLICT (clan_id, period) DO UPDATE SET
+        run_id = EXCLUDED.run_id,
+        collected_at = EXCLUDED.collected_at,
+        clan_name = EXCLUDED.clan_name,
+        leader_viewer_id = EXCLUDED.leader_viewer_id,
+        leader_name = EXCLUDED.leader_name,
+        member_num = EXCLUDED.member_num,
+        current_period_ranking = EXCLUDED.current_period_ranking,
+        grade_rank = EXCLUDED.grade_rank,
+        member_count = EXCLUDED.member_count,
+        total_power = EXCLUDED.total_power,
+        avg_power = EXCLUDED.avg_power,
+        exist = EXCLUDED.exist,
+        updated_at = NOW()
+"""
+
+# 本期的 grade_rank 即各公会上一期的最终排名
+RESOLVE_PREVIOUS_SQL = """
+    UPDATE clan_period_summary prev
+    SET final_ranking = cur.grade_rank, is_final = TRUE
+    FROM clan_period_summary cur
+    WHERE cur.period = %(period)s
+      AND prev.clan_id = cur.clan_id
+      AND prev.period = (
+          SELECT MAX(p.period) FROM clan_period_summary p
+          WHERE p.clan_id = cur.clan_id AND p.period < cur.period
+      )
+"""
+
+# 回填历史时本期可能已有下一期
+RESOLVE_CURRENT_SQL = """
+    UPDATE clan_period_summary cur
+    SET final_ranking = nxt.grade_rank, is_final = TRUE
+    FROM clan_period_summary nxt
+    WHERE cur.period = %(period)s
+      AND nxt.clan_id = cur.clan_id
+      AND nxt.period = (
+          SELECT MIN(p.period) FROM clan_period_summary p
+          WHERE p.clan_id = cur.clan_id AND p.period > cur.period
+      )
+"""
+
+
+def _summary_range(period: str, run: CollectionRun = None):
+    """期间的快照时间范围：该月成功运行覆盖的范围，加上尚未结束的本次运行"""
+    start, end = period_range(CLAN_TASKS, period)
+    if run is None:
+        return start, end
+    # 进行中的运行尚未标记成功，不在目录范围内
+    run_start = run.collected_at
+    run_end = run_start + timedelta(seconds=1)
+    if start.tzinfo is not None and run_start.tzinfo is None:
+        run_start, run_end = run_start.astimezone(), run_end.astimezone()
+    return min(start, run_start), max(end, run_end)
+
+
+def summarize_period(period: str, run: CollectionRun = None) -> int:
+    """
+    汇总单个月份并解析相邻期间的最终排名
+
+    Args:
+        period: 月份 YYYY-MM
+        run: clan_sync 中调用时传入本次（尚未结束的）运行
+
+    Returns:
+        写入/更新的公会数
+    """
+    start, end = _summary_range(period, run)
+    params = {'period': period, 'start': start, 'end': end}
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SUMMARY_SQL, params)
+        count = cursor.rowcount
+        cursor.execute(RESOLVE_PREVIOUS_SQL, params)
+        cursor.execute(RESOLVE_CURRENT_SQL, params)
+        conn.commit()
+
+    return count
+
+
+def get_missing_periods() -> List[str]:
+    """有 clan_sync 运行但还没有汇总的月份（正序）"""
+    periods = get_periods(CLAN_TASKS)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT period FROM clan_period_summary WHERE period = ANY(%s)
+        """, (periods,))
+        summarized = {row[0] for row in cursor.fetchall()}
+    return sorted(p for p in periods if p not in summarized)
+
+
+def run(period: str = None):
+    """
+    运行公会期间汇总
+
+    Args:
+        period: 月份 YYYY-MM；None 为最近一期，'all' 按时间顺序重建全部期间，
+                'missing' 只回填还没有汇总的期间
+    """
+    if period == 'all':
+        periods: List[str] = sorted(get_periods(CLAN_TASKS))
+    elif period == 'missing':
+        periods = get_missing_periods()
+    elif period:
+        periods = [period]
+    else:
+        periods = get_periods(CLAN_TASKS)[:1]
+
+    if not periods:
+        print("没有可汇总的期间")
+        return
+
+    for p in periods:
+        start = time.time()
+        count = summarize_period(p)
+        print(f"{p}: 汇总 {count} 个公会，耗时 {time.time() - start:.2f} 秒")
+    
+    notify_data_changed('clan_summary')
+
+
+if __name__ == '__main__':
+    run()
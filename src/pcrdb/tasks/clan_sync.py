@@ -11,7 +11,9 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from tasks.base import TaskQueue
-from db.connection import get_connection, insert_snapshots_batch, get_config
+from tasks.clan_summary import summarize_period
+from db.connection import pooled_connection, insert_snapshots_batch, get_config
+from db.collection_runs import CollectionRun
 
 
 def build_query_list(new_clan_add: int = 100) -> List[int]:
@@ -22,12 +24,9 @@ def build_query_list(new_clan_add: int = 100) -> List[int]:
     start_time = time.time()
     print("正在构建待查询公会列表...")
     
-    conn = get_connection()
     # Debug: Print current database
     print(f"Connected to Database: {get_config()['database']}")
     
-    cursor = conn.cursor()
-    
     # SQL: 查找活跃公会
     # 逻辑: 按可以 join_clan_id 分组，如果该公会最新快照里有成员登录时间 > 快照时间 - 30天，则视为活跃
     # 注意: player_clan_snapshots 可能很大，这个查询可能慢，需关注性能
@@ -40,8 +39,10 @@ def build_query_list(new_clan_add: int = 100) -> List[int]:
         ORDER BY join_clan_id
     """
     
-    cursor.execute(query_active_sql)
-    active_clans = [r[0] for r in cursor.fetchall()]
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query_active_sql)
+        active_clans = [r[0] for r in cursor.fetchall()]
     
     now = datetime.now()
     is_full_scan_month = (now.month == 1 or now.month == 7)
@@ -130,13 +131,11 @@ def process_clan_data(clan_data: Dict[str, Any]) -> Dict[str, Any]:
     return None
 
 
-def insert_clan_batch(data_batch: List[Dict]):
-    """批量插入公会数据"""
+def insert_clan_batch(data_batch: List[Dict], run: CollectionRun) -> int:
+    """批量插入公会数据（整次运行共用 run.collected_at），返回实际插入的行数"""
     clan_records = []
     member_records = []
     
-    now = datetime.now()
-    
     for item in data_batch:
         if item.get('type') != 'data':
             continue
@@ -180,11 +179,14 @@ def insert_clan_batch(data_batch: List[Dict]):
             })
     
     # 批量插入
+    inserted = 0
     if clan_records:
-        insert_snapshots_batch('clan_snapshots', clan_records, collected_at=now)
+        inserted += insert_snapshots_batch('clan_snapshots', clan_records, collected_at=run.collected_at, run_id=run.id)
         
     if member_records:
-        insert_snapshots_batch('player_clan_snapshots', member_records, collected_at=now)
+        inserted += insert_snapshots_batch('player_clan_snapshots', member_records,
+                                           collected_at=run.collected_at, run_id=run.id)
+    return inserted
 
 
 def run(new_clan_add: int = 100):
@@ -205,13 +207,13 @@ def run(new_clan_add: int = 100):
     # 简化：用查询数 × 30 作为预估
     records_expected = query_count * 31  # 1条公会 + 约30条成员
     
-    # 用于累计实际获取的记录数
-    fetch_counter = {'count': 0}
+    # 用于累计实际获取 / 入库的记录数
+    fetch_counter = {'count': 0, 'saved': 0}
     
     def insert_with_count(data_batch):
         """带计数的插入函数"""
         fetch_counter['count'] += len(data_batch)
-        insert_clan_batch(data_batch)
+        fetch_counter['saved'] += insert_clan_batch(data_batch, task_logger.run)
     
     # 初始化日志记录
     task_logger = TaskLogger('clan_sync')
@@ -226,13 +228,19 @@ def run(new_clan_add: int = 100):
             data_processor=process_clan_data,
             pg_inserter=insert_with_count,
             sync_num=config['sync_num'],
-            batch_size=config['batch_size']
+            batch_size=config['batch_size'],
+            metrics=task_logger.metrics
         )
         
         queue.run()
-        task_logger.finish_success(records_fetched=fetch_counter['count'])
+        
+        # 汇总本期公会数据 → clan_period_summary
+        with task_logger.metrics.phase('summarize'):
+            summary_count = summarize_period(task_logger.run.period, task_logger.run)
+        print(f"已汇总 {task_logger.run.period} 期 {summary_count} 个公会")
+        task_logger.finish_success(records_fetched=fetch_counter['count'], records_saved=fetch_counter['saved'])
     except Exception as e:
-        task_logger.finish_failed(str(e), records_fetched=fetch_counter['count'])
+        task_logger.finish_failed(str(e), records_fetched=fetch_counter['count'], records_saved=fetch_counter['saved'])
         raise
 
 
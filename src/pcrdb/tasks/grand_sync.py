@@ -5,8 +5,7 @@ PJJC 排名同步任务
 import time
 import asyncio
 import os
-from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 import sys
 from pathlib import Path
@@ -14,9 +13,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from api.endpoints import PCRApi, create_client
 from db.connection import get_accounts_by_group, insert_snapshots_batch
+from db.collection_runs import CollectionRun
+from db.task_logger import TaskMetrics
 
-# 用于统计实际获取的记录数
-_fetch_counter = {'count': 0}
+# 用于统计实际获取 / 入库的记录数
+_fetch_counter = {'count': 0, 'saved': 0}
+# 本次采集运行（各分场快照共用同一 collected_at）
+_run: Optional[CollectionRun] = None
+# 分阶段计时 / 计数（TaskLogger.metrics）
+_metrics = TaskMetrics()
 
 
 async def query_and_save_ranking(client: PCRApi, group: int, pages: int = 10):
@@ -25,7 +30,9 @@ async def query_and_save_ranking(client: PCRApi, group: int, pages: int = 10):
     
     for page in range(1, pages + 1):
         try:
-            result = await client.query_grand_arena_ranking(page)
+            _metrics.count('pages')
+            with _metrics.phase('fetch'):
+                result = await client.query_grand_arena_ranking(page)
             ranking = result.get('ranking', [])
             if ranking:
                 all_rankings.extend(ranking)
@@ -33,6 +40,7 @@ async def query_and_save_ranking(client: PCRApi, group: int, pages: int = 10):
             else:
                 print(f"第 {group} 组第 {page} 页为空")
         except Exception as e:
+            _metrics.count('page_errors')
             print(f"查询第 {group} 组第 {page} 页失败: {e}")
             # 简单的错误处理，继续下一页
     
@@ -44,29 +52,31 @@ def insert_grand_ranking(ranking_list: List[Dict], group: int):
     """插入 PJJC 排名数据"""
     global _fetch_counter
     records = []
-    now = datetime.now()
     
-    for user in ranking_list:
-        # favorite_unit 可能是字典或直接是 id
-        fav_unit = user.get('favorite_unit')
+    with _metrics.phase('decode'):
+        for user in ranking_list:
+            # favorite_unit 可能是字典或直接是 id
+            fav_unit = user.get('favorite_unit')
         
-        favorite_unit_id = fav_unit.get('id', 0)
+            favorite_unit_id = fav_unit.get('id', 0)
 
  
         
-        record = {
-            'viewer_id': user['viewer_id'],
-            'user_name': user.get('user_name', ''),
-            'team_level': user.get('team_level', 0),
-            'grand_arena_rank': user.get('rank', 0),
-            'grand_arena_group': group,
-            'winning_number': user.get('winning_number', 0),
-            'favorite_unit': favorite_unit_id
-        }
-        records.append(record)
+            record = {
+                'viewer_id': user['viewer_id'],
+                'user_name': user.get('user_name', ''),
+                'team_level': user.get('team_level', 0),
+                'grand_arena_rank': user.get('rank', 0),
+                'grand_arena_group': group,
+                'winning_number': user.get('winning_number', 0),
+                'favorite_unit': favorite_unit_id
+            }
+            records.append(record)
     
     if records:
-        insert_snapshots_batch('grand_arena_snapshots', records, collected_at=now)
+        with _metrics.phase('db_insert'):
+            _fetch_counter['saved'] += insert_snapshots_batch('grand_arena_snapshots', records,
+                                                             collected_at=_run.collected_at, run_id=_run.id)
         _fetch_counter['count'] += len(records)
         print(f"已保存第 {group} 组数据: {len(records)} 条")
 
@@ -93,10 +103,12 @@ async def run_async():
         }
         
         try:
-            client = await create_client(acc_dict)
+            with _metrics.phase('login'):
+                client = await create_client(acc_dict)
             task = asyncio.create_task(query_and_save_ranking(client, group_id))
             tasks.append(task)
         except Exception as e:
+            _metrics.count('login_failures')
             print(f"分场 {group_id} (账号 {account.uid}) 初始化失败: {e}")
     
     if tasks:
@@ -106,14 +118,14 @@ async def run_async():
 def run():
     """运行 PJJC 排名同步任务"""
     from db.task_logger import TaskLogger
-    global _fetch_counter
+    global _fetch_counter, _run, _metrics
     
     print("=" * 60)
     print("PJJC 排名同步任务 (PostgreSQL)")
     print("=" * 60)
     
     # 重置计数器
-    _fetch_counter = {'count': 0}
+    _fetch_counter = {'count': 0, 'saved': 0}
     
     # 获取分场数以计算预期获取数
     accounts_map = get_accounts_by_group('grand_arena')
@@ -127,6 +139,8 @@ def run():
         records_expected=records_expected,
         details={'groups': list(accounts_map.keys()), 'pages_per_group': pages_per_group}
     )
+    _run = task_logger.run
+    _metrics = task_logger.metrics
     
     if os.name == 'nt':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -142,9 +156,10 @@ def run():
         
         elapsed = time.time() - start
         print(f"任务完成，耗时 {elapsed:.2f} 秒")
-        task_logger.finish_success(records_fetched=_fetch_counter['count'])
+        task_logger.finish_success(records_fetched=_fetch_counter['count'], records_saved=_fetch_counter['saved'])
     except Exception as e:
-        task_logger.finish_failed(str(e), records_fetched=_fetch_counter['count'])
+        task_logger.finish_failed(str(e), records_fetched=_fetch_counter['count'],
+                                  records_saved=_fetch_counter['saved'])
         raise
 
 
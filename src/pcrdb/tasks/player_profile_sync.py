@@ -4,7 +4,6 @@
 """
 import time
 from typing import Dict, Any, List, Tuple
-from datetime import datetime
 from psycopg2.extras import Json
 
 import sys
@@ -12,7 +11,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from tasks.base import TaskQueue
-from db.connection import get_connection, insert_snapshots_batch, get_config
+from db.connection import pooled_connection, insert_snapshots_batch, get_config
+from db.collection_runs import CollectionRun
 
 
 def get_target_players(mode: str = 'top_clans', rank_limit: int = 30) -> Tuple[List[int], Dict[int, Dict]]:
@@ -26,30 +26,11 @@ def get_target_players(mode: str = 'top_clans', rank_limit: int = 30) -> Tuple[L
     Returns:
         (viewer_ids, member_info_dict)
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
     
-    if mode == 'top_clans':
-        # 获取最新一次快照中排名前N的公会
-        cursor.execute("""
-            WITH latest_date AS (
-                SELECT DATE(MAX(collected_at)) as max_date
-                FROM clan_snapshots
-                WHERE collected_at > NOW() - INTERVAL '30 days'
-            )
-            SELECT DISTINCT clan_id
-            FROM clan_snapshots
-            WHERE current_period_ranking > 0 
-              AND current_period_ranking <= %s
-              AND exist = TRUE
-              AND DATE(collected_at) = (SELECT max_date FROM latest_date)
-            ORDER BY clan_id
-        """, (rank_limit,))
-        
-        top_clans = [r[0] for r in cursor.fetchall()]
-        
-        if not top_clans:
-            print(f"未找到最新快照中排名前 {rank_limit} 的公会，尝试使用评级...")
+        if mode == 'top_clans':
+            # 获取最新一次快照中排名前N的公会
             cursor.execute("""
                 WITH latest_date AS (
                     SELECT DATE(MAX(collected_at)) as max_date
@@ -58,65 +39,83 @@ def get_target_players(mode: str = 'top_clans', rank_limit: int = 30) -> Tuple[L
                 )
                 SELECT DISTINCT clan_id
                 FROM clan_snapshots
-                WHERE grade_rank > 0 AND grade_rank <= 3
+                WHERE current_period_ranking > 0 
+                  AND current_period_ranking <= %s
                   AND exist = TRUE
                   AND DATE(collected_at) = (SELECT max_date FROM latest_date)
                 ORDER BY clan_id
-            """)
+            """, (rank_limit,))
+        
             top_clans = [r[0] for r in cursor.fetchall()]
         
-        if not top_clans:
-            return [], {}
+            if not top_clans:
+                print(f"未找到最新快照中排名前 {rank_limit} 的公会，尝试使用评级...")
+                cursor.execute("""
+                    WITH latest_date AS (
+                        SELECT DATE(MAX(collected_at)) as max_date
+                        FROM clan_snapshots
+                        WHERE collected_at > NOW() - INTERVAL '30 days'
+                    )
+                    SELECT DISTINCT clan_id
+                    FROM clan_snapshots
+                    WHERE grade_rank > 0 AND grade_rank <= 3
+                      AND exist = TRUE
+                      AND DATE(collected_at) = (SELECT max_date FROM latest_date)
+                    ORDER BY clan_id
+                """)
+                top_clans = [r[0] for r in cursor.fetchall()]
+        
+            if not top_clans:
+                return [], {}
         
-        # 获取这些公会的成员（仅最近30天的记录）
-        clan_ids_tuple = tuple(top_clans)
-        cursor.execute("""
-            SELECT DISTINCT ON (viewer_id) 
-                viewer_id, join_clan_id, join_clan_name
-            FROM player_clan_snapshots
-            WHERE join_clan_id IN %s
-              AND collected_at > NOW() - INTERVAL '30 days'
-            ORDER BY viewer_id, collected_at DESC
-        """, (clan_ids_tuple,))
+            # 获取这些公会的成员（仅最近30天的记录）
+            clan_ids_tuple = tuple(top_clans)
+            cursor.execute("""
+                SELECT DISTINCT ON (viewer_id) 
+                    viewer_id, join_clan_id, join_clan_name
+                FROM player_clan_snapshots
+                WHERE join_clan_id IN %s
+                  AND collected_at > NOW() - INTERVAL '30 days'
+                ORDER BY viewer_id, collected_at DESC
+            """, (clan_ids_tuple,))
         
-        rows = cursor.fetchall()
-        viewer_ids = []
-        member_info = {}
+            rows = cursor.fetchall()
+            viewer_ids = []
+            member_info = {}
         
-        for r in rows:
-            vid = r[0]
-            viewer_ids.append(vid)
-            member_info[vid] = {
-                'join_clan_id': r[1],
-                'join_clan_name': r[2]
-            }
+            for r in rows:
+                vid = r[0]
+                viewer_ids.append(vid)
+                member_info[vid] = {
+                    'join_clan_id': r[1],
+                    'join_clan_name': r[2]
+                }
         
-        return viewer_ids, member_info
+            return viewer_ids, member_info
     
-    else:  # mode == 'active_all'
-        # 获取所有活跃高战力玩家
-        cursor.execute("""
-            SELECT DISTINCT ON (viewer_id) 
-                viewer_id, join_clan_id, join_clan_name
-            FROM player_clan_snapshots
-            WHERE total_power > 1000000 
-              AND last_login_time > NOW() - INTERVAL '30 days'
-            ORDER BY viewer_id, collected_at DESC
-        """)
+        else:  # mode == 'active_all'
+            # 获取所有活跃高战力玩家（读最新状态目录，不扫快照表）
+            cursor.execute("""
+                SELECT viewer_id, join_clan_id, join_clan_name
+                FROM player_latest
+                WHERE total_power > 1000000 
+                  AND last_login_time > NOW() - INTERVAL '30 days'
+                ORDER BY viewer_id
+            """)
         
-        rows = cursor.fetchall()
-        viewer_ids = []
-        member_info = {}
+            rows = cursor.fetchall()
+            viewer_ids = []
+            member_info = {}
         
-        for r in rows:
-            vid = r[0]
-            viewer_ids.append(vid)
-            member_info[vid] = {
-                'join_clan_id': r[1],
-                'join_clan_name': r[2]
-            }
+            for r in rows:
+                vid = r[0]
+                viewer_ids.append(vid)
+                member_info[vid] = {
+                    'join_clan_id': r[1],
+                    'join_clan_name': r[2]
+                }
         
-        return viewer_ids, member_info
+            return viewer_ids, member_info
 
 
 def process_profile(profile_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -160,10 +159,9 @@ def process_profile(profile_data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def insert_profile_batch(data_batch: List[Dict], member_info: Dict):
-    """批量插入玩家档案数据"""
+def insert_profile_batch(data_batch: List[Dict], member_info: Dict, run: CollectionRun) -> int:
+    """批量插入玩家档案数据（整次运行共用 run.collected_at），返回实际插入的行数"""
     records = []
-    now = datetime.now()
     
     for data in data_batch:
         if not data:
@@ -191,8 +189,7 @@ def insert_profile_batch(data_batch: List[Dict], member_info: Dict):
         }
         records.append(record)
     
-    if records:
-        insert_snapshots_batch('player_profile_snapshots', records, collected_at=now)
+    return insert_snapshots_batch('player_profile_snapshots', records, collected_at=run.collected_at, run_id=run.id)
 
 
 def run(mode: str = 'top_clans', rank_limit: int = 30):
@@ -221,8 +218,8 @@ def run(mode: str = 'top_clans', rank_limit: int = 30):
     else:
         print(f"待查询成员: {records_expected} 人 (所有活跃高战力)")
     
-    # 用于累计实际获取的记录数
-    fetch_counter = {'count': 0}
+    # 用于累计实际获取 / 入库的记录数
+    fetch_counter = {'count': 0, 'saved': 0}
     
     # 根据mode确定task_name
     task_name = 'player_profile_sync_monthly' if mode == 'active_all' else 'player_profile_sync'
@@ -241,20 +238,21 @@ def run(mode: str = 'top_clans', rank_limit: int = 30):
         # 使用闭包传递 member_info 和计数
         def inserter_with_count(batch):
             fetch_counter['count'] += len(batch)
-            insert_profile_batch(batch, member_info)
+            fetch_counter['saved'] += insert_profile_batch(batch, member_info, task_logger.run)
         
         queue = TaskQueue(
             query_list=viewer_ids,
             data_processor=process_profile,
             pg_inserter=inserter_with_count,
             sync_num=config['sync_num'],
-            batch_size=config['batch_size']
+            batch_size=config['batch_size'],
+            metrics=task_logger.metrics
         )
         
         queue.run()
-        task_logger.finish_success(records_fetched=fetch_counter['count'])
+        task_logger.finish_success(records_fetched=fetch_counter['count'], records_saved=fetch_counter['saved'])
     except Exception as e:
-        task_logger.finish_failed(str(e), records_fetched=fetch_counter['count'])
+        task_logger.finish_failed(str(e), records_fetched=fetch_counter['count'], records_saved=fetch_counter['saved'])
         raise
 
 
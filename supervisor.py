@@ -0,0 +1,186 @@
+"""
+多进程 supervisor
+生产环境运行方式（PCRDB_RUN_MODE=supervisor）：
+- N 个 API worker 进程共享同一个监听 socket（API + 静态前端，见 run.build_single_app）
+- 1 个调度器进程，每个采集任务再在独立的低优先级采集进程中运行
+采集任务的 CPU 开销不再与 API 共用一个解释器 / GIL。
+
+supervisor 负责：
+- 健康检查：API worker 的事件循环每 0.1 秒更新心跳，超过 PCRDB_HEALTH_TIMEOUT 秒未更新视为卡死
+- 崩溃 / 卡死后重启（指数退避，最长 60 秒）
+- SIGTERM / SIGINT 时优雅退出：先通知子进程停止，超过 PCRDB_SHUTDOWN_TIMEOUT 秒仍未退出再强制结束
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger('supervisor')
+
+HOST = os.environ.get("FRONTEND_HOST", "0.0.0.0")
+PORT = int(os.environ.get("FRONTEND_PORT", "8080"))
+API_WORKERS = int(os.getenv("PCRDB_API_WORKERS", str(min(os.cpu_count() or 2, 4))))
+HEALTH_TIMEOUT = float(os.getenv("PCRDB_HEALTH_TIMEOUT", "30"))
+SHUTDOWN_TIMEOUT = float(os.getenv("PCRDB_SHUTDOWN_TIMEOUT", "30"))
+# 启动后多久开始做心跳检查（加载热数据等启动开销）
+STARTUP_GRACE = 60
+MAX_BACKOFF = 60
+
+ctx = multiprocessing.get_context('spawn')
+
+
+# === 子进程入口 ===
+def api_worker_main(sock: socket.socket, heartbeat):
+    """API worker：在共享 socket 上运行 uvicorn，事件循环每个 tick 更新心跳"""
+    import uvicorn
+    from run import build_single_app
+
+    class HeartbeatServer(uvicorn.Server):
+        async def on_tick(self, counter: int) -> bool:
+            heartbeat.value = time.time()
+            return await super().on_tick(counter)
+
+    config = uvicorn.Config(build_single_app(), log_level="info")
+    HeartbeatServer(config).run(sockets=[sock])
+
+
+def scheduler_main():
+    """调度器：SIGTERM 时停止调度；任务在采集子进程中运行"""
+    import scheduler
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    scheduler.main(isolate=True, stop_event=stop_event)
+
+
+# === 进程管理 ===
+class Managed:
+    """一个受管子进程：崩溃 / 心跳超时后按退避重启"""
+
+    def __init__(self, name: str, target: Callable, args: tuple = (), heartbeat=None):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.heartbeat = heartbeat
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.next_start = 0.0
+
+    def start(self):
+        if self.heartbeat is not None:
+            self.heartbeat.value = time.time()
+        self.process = ctx.Process(target=self.target, args=self.args, name=self.name)
+        self.process.start()
+        self.started_at = time.time()
+        logger.info(f"{self.name} 已启动 (pid={self.process.pid})")
+
+    def is_stale(self) -> bool:
+        if self.heartbeat is None or time.time() - self.started_at < STARTUP_GRACE:
+            return False
+        return time.time() - self.heartbeat.value > HEALTH_TIMEOUT
+
+    def check(self):
+        """健康检查，必要时重启"""
+        now = time.time()
+        if self.process is None:
+            if now >= self.next_start:
+                self.start()
+            return
+
+        if self.process.is_alive():
+            if not self.is_stale():
+                # 稳定运行一段时间后重置退避
+                if self.restarts and now - self.started_at > MAX_BACKOFF * 2:
+                    self.restarts = 0
+                return
+            logger.error(f"{self.name} 心跳超时 {HEALTH_TIMEOUT:.0f} 秒，强制结束")
+            self.process.kill()
+            self.process.join(5)
+        else:
+            logger.error(f"{self.name} 异常退出 (exitcode={self.process.exitcode})")
+
+        self.process = None
+        backoff = min(2 ** self.restarts, MAX_BACKOFF)
+        self.restarts += 1
+        self.next_start = now + backoff
+        logger.info(f"{self.name} 将在 {backoff} 秒后重启（第 {self.restarts} 次）")
+
+    def terminate(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+
+    def join(self, deadline: float):
+        if self.process is None:
+            return
+        self.process.join(max(0.0, deadline - time.time()))
+        if self.process.is_alive():
+            logger.warning(f"{self.name} 未在 {SHUTDOWN_TIMEOUT:.0f} 秒内退出，强制结束")
+            self.process.kill()
+            self.process.join()
+
+
+def bind_socket() -> socket.socket:
+    """在 supervisor 中绑定监听 socket，由各 API worker 共享"""
+    family = socket.AF_INET6 if ':' in HOST else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    logger.info("=" * 60)
+    logger.info(f"pcrdb supervisor 启动: {API_WORKERS} 个 API worker @ {HOST}:{PORT} + 调度器")
+    logger.info("=" * 60)
+
+    sock = bind_socket()
+    managed: List[Managed] = []
+    for i in range(API_WORKERS):
+        heartbeat = ctx.Value('d', 0.0)
+        managed.append(Managed(f"api-{i}", api_worker_main, (sock, heartbeat), heartbeat=heartbeat))
+    managed.append(Managed("scheduler", scheduler_main))
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    for m in managed:
+        m.start()
+
+    while not stopping.wait(1):
+        for m in managed:
+            m.check()
+
+    logger.info("收到停止信号，等待子进程退出...")
+    for m in managed:
+        m.terminate()
+    deadline = time.time() + SHUTDOWN_TIMEOUT
+    for m in managed:
+        m.join(deadline)
+    sock.close()
+    logger.info("supervisor 已退出")
+
+
+if __name__ == '__main__':
+    main()
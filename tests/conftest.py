@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 与 server.py 相同的导入方式（src.pcrdb.*）
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def pg_cursor():
+    """
+    测试数据库游标（PCRDB_TEST_DSN 未设置时跳过）
+    用例只操作 TEMP 表，结束时回滚，不会改动库中数据
+    """
+    dsn = os.getenv('PCRDB_TEST_DSN')
+    if not dsn:
+        pytest.skip('PCRDB_TEST_DSN 未设置')
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET TIME ZONE 'UTC'")
+        yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
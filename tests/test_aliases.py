@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.db import aliases
+from src.pcrdb.db.aliases import like_pattern, upsert_aliases
+
+
+T0 = datetime(2026, 9, 1, tzinfo=timezone.utc)
+T1 = T0 + timedelta(days=1)
+T2 = T0 + timedelta(days=2)
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    calls = []
+    monkeypatch.setattr(aliases, 'execute_values', lambda cursor, sql, rows: calls.append((sql, rows)))
+    return calls
+
+
+def test_rows_sorted_and_blank_names_skipped(captured):
+    records = [
+        {'clan_id': 2, 'clan_name': 'b'},
+        {'clan_id': 1, 'clan_name': 'z'},
+        {'clan_id': 1, 'clan_name': 'a'},
+        {'clan_id': 1, 'clan_name': 'a'},
+        {'clan_id': 3, 'clan_name': ''},
+        {'clan_id': 4, 'clan_name': None},
+    ]
+    upsert_aliases(None, 'clan_snapshots', records, T0)
+
+    (sql, rows), = captured
+    assert [row[:2] for row in rows] == [(1, 'a'), (1, 'z'), (2, 'b')]
+    assert 'clan_aliases' in sql
+
+
+def test_untracked_table(captured):
+    upsert_aliases(None, 'arena_deck_snapshots', [{'viewer_id': 1, 'user_name': 'x'}], T0)
+    assert captured == []
+
+
+def test_like_pattern_escapes_wildcards():
+    assert like_pattern('50%_a\\b') == '%50\\%\\_a\\\\b%'
+
+
+@pytest.fixture
+def player_aliases(pg_cursor):
+    pg_cursor.execute("""
+        CREATE TEMP TABLE player_aliases (
+            viewer_id BIGINT NOT NULL,
+            name TEXT NOT NULL,
+            first_seen TIMESTAMPTZ NOT NULL,
+            last_seen TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (viewer_id, name)
+        )
+    """)
+    return pg_cursor
+
+
+def fetch(cursor, viewer_id):
+    cursor.execute("""
+        SELECT name, first_seen, last_seen FROM player_aliases
+        WHERE viewer_id = %s ORDER BY first_seen, name
+    """, (viewer_id,))
+    return cursor.fetchall()
+
+
+def test_out_of_order_snapshots_widen_range(player_aliases):
+    cur = player_aliases
+    upsert_aliases(cur, 'player_clan_snapshots', [{'viewer_id': 1, 'name': 'a'}], T1)
+    upsert_aliases(cur, 'player_profile_snapshots', [{'viewer_id': 1, 'user_name': 'a'}], T2)
+    # 回填时较旧的快照后到
+    upsert_aliases(cur, 'grand_arena_snapshots', [{'viewer_id': 1, 'user_name': 'a'}], T0)
+
+    assert fetch(cur, 1) == [('a', T0, T2)]
+
+
+def test_equal_timestamps_do_not_change_range(player_aliases):
+    cur = player_aliases
+    upsert_aliases(cur, 'player_clan_snapshots', [{'viewer_id': 1, 'name': 'a'}], T1)
+    upsert_aliases(cur, 'player_profile_snapshots', [{'viewer_id': 1, 'user_name': 'a'}], T1)
+
+    assert fetch(cur, 1) == [('a', T1, T1)]
+
+
+def test_rename_keeps_previous_alias(player_aliases):
+    cur = player_aliases
+    upsert_aliases(cur, 'player_clan_snapshots', [{'viewer_id': 1, 'name': 'old'}], T0)
+    upsert_aliases(cur, 'player_clan_snapshots', [{'viewer_id': 1, 'name': 'new'}], T1)
+    # 改回原名
+    upsert_aliases(cur, 'player_clan_snapshots', [{'viewer_id': 1, 'name': 'old'}], T2)
+
+    assert fetch(cur, 1) == [('old', T0, T2), ('new', T1, T1)]
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb import api_log
+from src.pcrdb.api_log import ApiLogBuffer
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """替换数据库写入，记录每一批写入的行"""
+    batches = []
+
+    async def run_db(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(api_log, 'run_db', run_db)
+    monkeypatch.setattr(api_log, '_insert_rows', lambda rows: batches.append(list(rows)))
+    return batches
+
+
+def test_overflow_drops_oldest(written):
+    buffer = ApiLogBuffer(capacity=3, flush_rows=10)
+    for i in range(5):
+        buffer.record(i, f'/api/{i}')
+
+    assert buffer.stats() == {'buffered': 3, 'written': 0, 'dropped': 2}
+    asyncio.run(buffer.flush())
+    (batch,) = written
+    assert [row[0] for row in batch] == [2, 3, 4]
+    assert buffer.stats() == {'buffered': 0, 'written': 3, 'dropped': 2}
+
+
+def test_flush_writes_in_batches(written):
+    buffer = ApiLogBuffer(capacity=100, flush_rows=4)
+    for i in range(10):
+        buffer.record(1, '/api/x', {'page': i} if i % 2 else None)
+
+    asyncio.run(buffer.flush())
+    assert [len(batch) for batch in written] == [4, 4, 2]
+    assert written[0][0][2] is None
+    assert written[0][1][2] == '{"page": 1}'
+    assert buffer.written == 10
+
+
+def test_failed_write_drops_batch(monkeypatch, written):
+    def fail(rows):
+        raise RuntimeError('db down')
+
+    monkeypatch.setattr(api_log, '_insert_rows', fail)
+    buffer = ApiLogBuffer(capacity=100, flush_rows=4)
+    for i in range(6):
+        buffer.record(1, '/api/x')
+
+    asyncio.run(buffer.flush())
+    # 只丢弃失败的一批，剩余记录留待下次写入
+    assert buffer.stats() == {'buffered': 2, 'written': 0, 'dropped': 4}
+
+
+def test_background_flush_and_stop(written):
+    async def scenario():
+        buffer = ApiLogBuffer(capacity=100, flush_rows=3, flush_interval=60)
+        buffer.start()
+        for i in range(3):
+            buffer.record(i, '/api/x')
+        # 攒满 flush_rows 时立即唤醒后台任务
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert buffer.written == 3
+
+        buffer.record(9, '/api/y')
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(scenario())
+    assert [len(batch) for batch in written] == [3, 1]
+    assert buffer.stats() == {'buffered': 0, 'written': 4, 'dropped': 0}
@@ -0,0 +1,133 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from src.pcrdb.clan_battle_api import ClanBattleClient, UpstreamError
+
+
+def make_client(handler):
+    """上游桩：handler(request) 可以是协程，用于在响应前挂起"""
+    calls = []
+
+    async def transport_handler(request):
+        calls.append(request)
+        result = handler(request)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    return ClanBattleClient('http://upstream', transport=httpx.MockTransport(transport_handler)), calls
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(200, json={'body': json.loads(request.content)})
+
+        client, calls = make_client(handler)
+        waiters = [asyncio.ensure_future(client.post('/search', {'b': 1, 'a': 2})) for _ in range(3)]
+        # 键按 sort_keys 生成，字段顺序不同的请求体也共享
+        waiters.append(asyncio.ensure_future(client.post('/search', {'a': 2, 'b': 1})))
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        await client.aclose()
+        return client, calls, results
+
+    client, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == {'body': {'a': 2, 'b': 1}} for result in results)
+    assert client.stats() == {'entries': 1, 'hits': 0, 'misses': 1, 'coalesced': 3}
+
+
+def test_cached_value_reused_until_ttl():
+    async def scenario():
+        client, calls = make_client(lambda request: httpx.Response(200, json=[1, 2]))
+        assert await client.get('/time') == [1, 2]
+        assert await client.get('/time') == [1, 2]
+        assert await client.get('/other', ttl=0) == [1, 2]
+        assert await client.get('/other', ttl=0) == [1, 2]
+        await client.aclose()
+        return client, calls
+
+    client, calls = asyncio.run(scenario())
+    assert [c.url.path for c in calls] == ['/time', '/other', '/other']
+    assert client.hits == 1
+
+
+def test_upstream_error_propagates_to_all_waiters():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(503, text='busy')
+
+        client, calls = make_client(handler)
+        waiters = [asyncio.ensure_future(client.post('/scoreline', {'x': 1})) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        # 失败不缓存，下一次请求重新访问上游
+        retry = await asyncio.gather(client.post('/scoreline', {'x': 1}), return_exceptions=True)
+        await client.aclose()
+        return calls, results + retry
+
+    calls, results = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert all(isinstance(r, UpstreamError) and r.status_code == 503 for r in results)
+
+
+def test_non_json_response():
+    async def scenario():
+        client, _ = make_client(lambda request: httpx.Response(200, text='<html>'))
+        try:
+            with pytest.raises(UpstreamError) as exc:
+                await client.get('/time')
+            return exc.value
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()).status_code == 502
+
+
+def test_cancelled_waiter_does_not_cancel_shared_request():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(200, json={'ok': True})
+
+        client, calls = make_client(handler)
+        first = asyncio.ensure_future(client.get('/time'))
+        second = asyncio.ensure_future(client.get('/time'))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        release.set()
+        result = await second
+        await client.aclose()
+        return calls, first, result
+
+    calls, first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == {'ok': True}
+    assert len(calls) == 1
+
+
+def test_cache_bounded():
+    async def scenario():
+        client = ClanBattleClient('http://upstream', max_entries=2,
+                                  transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+        for i in range(5):
+            await client.get(f'/time/{i}')
+        await client.aclose()
+        return client
+
+    assert asyncio.run(scenario()).stats()['entries'] == 2
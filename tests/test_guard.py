@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('psycopg2')
+
+from src.pcrdb import guard
+from src.pcrdb.guard import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(guard.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_burst_then_reject(clock):
+    limiter = RateLimiter(burst=5, rate=1)
+    assert all(limiter.take(1, 1) == 0 for _ in range(5))
+    assert limiter.take(1, 1) == pytest.approx(1.0)
+    assert limiter.rejected == 1
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = RateLimiter(burst=4, rate=2)
+    assert limiter.take(1, 4) == 0
+    assert limiter.take(1, 2) == pytest.approx(1.0)
+    clock[0] += 1
+    assert limiter.take(1, 2) == 0
+    # 补充不超过容量
+    clock[0] += 100
+    assert limiter.take(1, 4) == 0
+    assert limiter.take(1, 1) > 0
+
+
+def test_buckets_are_per_key(clock):
+    limiter = RateLimiter(burst=1, rate=1)
+    assert limiter.take(1, 1) == 0
+    assert limiter.take(2, 1) == 0
+    assert limiter.take(1, 1) > 0
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.db import latest
+from src.pcrdb.db.latest import upsert_latest
+
+
+T0 = datetime(2026, 9, 1, tzinfo=timezone.utc)
+T1 = T0 + timedelta(days=1)
+T2 = T0 + timedelta(days=2)
+
+
+def player(viewer_id, **fields):
+    record = {'viewer_id': viewer_id, 'name': None, 'level': None, 'total_power': None,
+              'join_clan_id': None, 'join_clan_name': None, 'last_login_time': None}
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    calls = []
+    monkeypatch.setattr(latest, 'execute_values', lambda cursor, sql, rows: calls.append((sql, rows)))
+    return calls
+
+
+def test_rows_sorted_by_key_and_deduplicated(captured):
+    records = [player(30, name='c'), player(10, name='a'), player(20, name='b'), player(10, name='a2')]
+    upsert_latest(None, 'player_clan_snapshots', records, T0)
+
+    (sql, rows), = captured
+    assert [row[0] for row in rows] == [10, 20, 30]
+    # 同一批次内后出现的记录生效
+    assert rows[0][1] == 'a2'
+    assert 'player_latest' in sql
+
+
+def test_empty_string_is_missing(captured):
+    upsert_latest(None, 'player_profile_snapshots', [{'viewer_id': 1, 'user_name': ''}], T0)
+    (_, rows), = captured
+    assert rows[0][1] is None
+
+
+def test_untracked_table_and_empty_batch(captured):
+    upsert_latest(None, 'collection_runs', [{'viewer_id': 1}], T0)
+    upsert_latest(None, 'player_clan_snapshots', [], T0)
+    assert captured == []
+
+
+@pytest.fixture
+def player_latest(pg_cursor):
+    pg_cursor.execute("""
+        CREATE TEMP TABLE player_latest (
+            viewer_id BIGINT PRIMARY KEY,
+            name TEXT,
+            level SMALLINT,
+            total_power INTEGER,
+            join_clan_id INTEGER,
+            join_clan_name TEXT,
+            last_login_time TIMESTAMPTZ,
+            arena_group SMALLINT,
+            grand_arena_group SMALLINT,
+            last_seen_at TIMESTAMPTZ NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    return pg_cursor
+
+
+def fetch(cursor, viewer_id):
+    cursor.execute("""
+        SELECT name, total_power, join_clan_id, grand_arena_group, last_seen_at
+        FROM player_latest WHERE viewer_id = %s
+    """, (viewer_id,))
+    return cursor.fetchone()
+
+
+def test_newer_snapshot_overwrites_non_null_fields(player_latest):
+    cur = player_latest
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='old', total_power=100, join_clan_id=5)], T0)
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='new', total_power=200)], T1)
+
+    # join_clan_id 为空的新快照不清空已有值
+    assert fetch(cur, 1) == ('new', 200, 5, None, T1)
+
+
+def test_older_snapshot_only_fills_missing_fields(player_latest):
+    cur = player_latest
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='new', total_power=200)], T2)
+    # 回填时较旧的快照后到
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='old', total_power=100, join_clan_id=5)], T0)
+    upsert_latest(cur, 'grand_arena_snapshots',
+                  [{'viewer_id': 1, 'user_name': 'older', 'team_level': 200, 'grand_arena_group': 3}], T1)
+
+    assert fetch(cur, 1) == ('new', 200, 5, 3, T2)
+
+
+def test_equal_timestamps_latest_write_wins(player_latest):
+    cur = player_latest
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='a', total_power=100)], T1)
+    upsert_latest(cur, 'player_profile_snapshots',
+                  [{'viewer_id': 1, 'user_name': 'b', 'total_power': None, 'grand_arena_group': 2}], T1)
+
+    assert fetch(cur, 1) == ('b', 100, None, 2, T1)
+
+
+def test_rename_with_empty_name_keeps_previous(player_latest):
+    cur = player_latest
+    upsert_latest(cur, 'player_clan_snapshots', [player(1, name='kept')], T0)
+    upsert_latest(cur, 'player_profile_snapshots', [{'viewer_id': 1, 'user_name': ''}], T1)
+
+    assert fetch(cur, 1)[0] == 'kept'
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.metrics import Histogram, Metrics
+
+
+def test_histogram_bucketing():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 3.0):
+        histogram.observe(value)
+
+    # 桶上界包含边界值（le），超出最大桶的计入 +Inf
+    assert histogram.counts == [2, 2, 1]
+    assert list(histogram.lines('h', 'route="/x"')) == [
+        'h_bucket{route="/x",le="0.1"} 2',
+        'h_bucket{route="/x",le="1.0"} 4',
+        'h_bucket{route="/x",le="+Inf"} 5',
+        'h_sum{route="/x"} 4.65',
+        'h_count{route="/x"} 5',
+    ]
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.record('GET', '/api/clan/members', 200, 0.02, 2000, 0.015, 2)
+    metrics.record('GET', '/api/clan/members', 200, 0.2, 300, 0.25, 1)
+    metrics.record('GET', '/api/"odd"', 404, 0.001, 10, 0.0, 0)
+
+    text = metrics.render({'pcrdb_cache_entries': {'cache="response"': 3}, 'pcrdb_pool_size': {'': 5}})
+    lines = text.splitlines()
+
+    assert text.endswith('\n')
+    assert 'pcrdb_http_requests_total{method="GET",route="/api/clan/members",status="200"} 2' in lines
+    assert 'pcrdb_http_requests_total{method="GET",route="/api/\\"odd\\"",status="404"} 1' in lines
+    assert 'pcrdb_http_request_duration_seconds_bucket{route="/api/clan/members",le="0.025"} 1' in lines
+    assert 'pcrdb_http_request_duration_seconds_count{route="/api/clan/members"} 2' in lines
+    assert 'pcrdb_http_response_size_bytes_bucket{route="/api/clan/members",le="4096"} 2' in lines
+    assert 'pcrdb_http_db_calls_total{route="/api/clan/members"} 3' in lines
+    # 数据库时间超过总耗时时 Python 时间不为负
+    assert any(line.startswith('pcrdb_http_python_seconds_total{route="/api/clan/members"} 0.005') for line in lines)
+    assert 'pcrdb_cache_entries{cache="response"} 3' in lines
+    assert 'pcrdb_pool_size 5' in lines
+
+    # 每个指标只声明一次类型
+    types = [line.split()[2] for line in lines if line.startswith('# TYPE')]
+    assert len(types) == len(set(types))
@@ -0,0 +1,55 @@
+import pytest
+
+from src.pcrdb.analysis.paging import (
+    cursor_scope, decode_cursor, encode_cursor, keyset_condition, order_by, split_page
+)
+
+
+def test_cursor_round_trip():
+    scope = cursor_scope('-avg_power', '2026-09')
+    cursor = encode_cursor([123456.5, 42], 50, scope)
+    assert decode_cursor(cursor, 2, scope) == ([123456.5, 42], 50)
+
+
+def test_empty_cursor():
+    assert decode_cursor(None, 2) == (None, 0)
+    assert decode_cursor('', 2) == (None, 0)
+
+
+def test_cursor_rejects_other_sort_with_same_key_count():
+    cursor = encode_cursor([10, 1], 20, cursor_scope('-member_count', '2026-09'))
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2, cursor_scope('-total_power', '2026-09'))
+
+
+def test_cursor_rejects_other_period():
+    cursor = encode_cursor([10, 1], 20, cursor_scope('-avg_power', '2026-09'))
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2, cursor_scope('-avg_power', '2026-10'))
+
+
+def test_cursor_rejects_wrong_key_count_and_garbage():
+    scope = cursor_scope('-avg_power')
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1, 2, 3], 5, scope), 2, scope)
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor', 2, scope)
+
+
+def test_keyset_condition_mixed_directions():
+    keys = [('a', True), ('b', False), ('c', False)]
+    sql, params = keyset_condition(keys, [3, 'x', 7])
+    assert sql == "(a < %s OR (a = %s AND (b > %s OR (b = %s AND c > %s))))"
+    assert params == [3, 3, 'x', 'x', 7]
+    assert order_by(keys) == "a DESC, b ASC, c ASC"
+
+
+def test_split_page_builds_scoped_cursor():
+    rows = [('r1', 9, 1), ('r2', 8, 2), ('r3', 7, 3)]
+    scope = cursor_scope('-score')
+    page, next_cursor = split_page(rows, 2, 2, 10, scope)
+    assert page == [('r1',), ('r2',)]
+    assert decode_cursor(next_cursor, 2, scope) == ([8, 2], 12)
+
+    page, next_cursor = split_page(rows[:2], 2, 2, 0, scope)
+    assert next_cursor is None
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.response_cache import _etag_matches
+
+
+ETAG = '"0123456789abcdef"'
+
+
+def test_exact_and_weak_match():
+    assert _etag_matches(ETAG, ETAG)
+    assert _etag_matches('W/' + ETAG, ETAG)
+    assert _etag_matches('*', ETAG)
+
+
+def test_encoding_suffix_is_stripped():
+    assert _etag_matches('"0123456789abcdef-gzip"', ETAG)
+    assert _etag_matches('W/"0123456789abcdef-br"', ETAG)
+
+
+def test_list_and_mismatch():
+    assert _etag_matches('"other", "0123456789abcdef-gzip"', ETAG)
+    assert not _etag_matches('"other-gzip"', ETAG)
+    assert not _etag_matches(None, ETAG)
+    assert not _etag_matches('', ETAG)
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.db.slow_queries import QueryStats, _explainable, fingerprint
+
+
+def test_fingerprint_normalizes_values():
+    a = fingerprint("SELECT *  FROM clan_snapshots\n WHERE clan_id = 123 AND clan_name = 'it''s'")
+    b = fingerprint("SELECT * FROM clan_snapshots WHERE clan_id = %s AND clan_name = %(name)s")
+    assert a == b == "SELECT * FROM clan_snapshots WHERE clan_id = ? AND clan_name = ?"
+
+
+def test_fingerprint_keeps_identifiers_with_digits():
+    assert fingerprint("SELECT total_power FROM player_clan_snapshots_2026_09 LIMIT 10") == \
+        "SELECT total_power FROM player_clan_snapshots_2026_09 LIMIT ?"
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT 1", True),
+    ("  with t AS (SELECT 1) SELECT * FROM t", True),
+    ("INSERT INTO t VALUES (1)", False),
+    ("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d", False),
+    ("SELECT pg_notify('c', 'x'); NOTIFY c", False),
+    ("UPDATE t SET a = 1", False),
+    ("", False),
+    ("   ", False),
+])
+def test_explainable(sql, expected):
+    assert _explainable(sql) is expected
+
+
+def test_stats_aggregate_by_fingerprint():
+    stats = QueryStats(slow_ms=10000)
+    stats.record(None, "SELECT * FROM t WHERE id = %s", (1,), 0.01)
+    stats.record(None, "SELECT * FROM t WHERE id = %s", (2,), 0.03)
+    stats.record(None, b"SELECT * FROM t WHERE id = 3", None, 0.02)
+
+    (row,) = stats.top()
+    assert row['calls'] == 3
+    assert row['total_ms'] == 60.0
+    assert row['max_ms'] == 30.0
+    assert row['slowest_params'] == '(2,)'
+    assert row['explain'] is None
+
+
+def test_stats_bounded():
+    stats = QueryStats(slow_ms=10000, max_fingerprints=2)
+    for table in ('a', 'b', 'c'):
+        stats.record(None, f"SELECT * FROM {table}", None, 0.001)
+    assert [row['fingerprint'] for row in stats.top(order='calls')] == ['SELECT * FROM b', 'SELECT * FROM c']
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.pcrdb.db.task_logger import _publish_change
+
+
+@pytest.fixture
+def data_versions(pg_cursor):
+    pg_cursor.execute("""
+        CREATE TEMP TABLE data_versions (
+            task_name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            changed_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    return pg_cursor
+
+
+def versions(cursor):
+    cursor.execute("SELECT task_name, version FROM data_versions ORDER BY task_name")
+    return cursor.fetchall()
+
+
+def test_each_change_bumps_shared_version(data_versions):
+    cur = data_versions
+    _publish_change(cur, 'clan_sync')
+    _publish_change(cur, 'clan_summary')
+    _publish_change(cur, 'clan_summary')
+
+    assert versions(cur) == [('clan_summary', 2), ('clan_sync', 1)]
+
+
+def test_existing_version_continues(data_versions):
+    cur = data_versions
+    cur.execute("INSERT INTO data_versions (task_name, version) VALUES ('grand_sync', 812)")
+    _publish_change(cur, 'grand_sync')
+
+    assert versions(cur) == [('grand_sync', 813)]